@@ -61,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'cheaplatzi_deploy.middleware.GzipRequestMiddleware',
 ]
 
 CORS_ORIGIN_ALLOW_ALL = False
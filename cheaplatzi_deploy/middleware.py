@@ -0,0 +1,30 @@
+import io
+import gzip
+import zlib
+
+from django.http.response import JsonResponse
+from rest_framework import status
+
+
+class GzipRequestMiddleware:
+    """
+    Decompresses the body of the requests sent with Content-Encoding: gzip
+    (the scraper compresses its bulk product uploads)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.META.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip':
+            try:
+                body = gzip.decompress(request.body)
+            except (OSError, EOFError, zlib.error):
+                return JsonResponse({'message': 'Invalid gzip request body'}, status=status.HTTP_400_BAD_REQUEST)
+
+            request._body = body
+            request._stream = io.BytesIO(body)
+            request.META['CONTENT_LENGTH'] = str(len(body))
+            del request.META['HTTP_CONTENT_ENCODING']
+
+        return self.get_response(request)
@@ -1,3 +1,94 @@
+import gzip
+import json
+
 from django.test import TestCase
 
-# Create your tests here.
+from cheaplatzi_deploy.models import ProductType, Ecommerce, Product
+
+
+SYNC_URL = '/api/product/sync'
+
+
+class ProductSyncTests(TestCase):
+
+    def setUp(self):
+        self.product_type = ProductType.objects.create(name='Consoles', status=True)
+        self.ecommerce = Ecommerce.objects.create(name='MercadoLibre')
+
+    def record(self, url, **fields):
+        record = {'id_type_product': self.product_type.id,
+                  'id_ecommerce': self.ecommerce.id,
+                  'name': 'Nintendo Switch',
+                  'price': '1500000.00',
+                  'url': url}
+        record.update(fields)
+        return record
+
+    def create_product(self, url, **fields):
+        record = self.record(url, **fields)
+        record['id_type_product'] = self.product_type
+        record['id_ecommerce'] = self.ecommerce
+        return Product.objects.create(**record)
+
+    def sync(self, records):
+        return self.client.post(SYNC_URL, data=json.dumps(records), content_type='application/json')
+
+    def test_creates_new_products(self):
+        response = self.sync([self.record('https://a'), self.record('https://b')])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 2, 'updated': 0})
+        self.assertEqual(set(Product.objects.values_list('url', flat=True)), {'https://a', 'https://b'})
+
+    def test_updates_every_duplicated_product(self):
+        duplicates = [self.create_product('https://a'), self.create_product('https://a')]
+
+        response = self.sync([self.record('https://a', price='1200000.00')])
+
+        self.assertEqual(response.json(), {'created': 0, 'updated': 2})
+        for product in duplicates:
+            product.refresh_from_db()
+            self.assertEqual(str(product.price), '1200000.00')
+
+    def test_deactivates_existing_products(self):
+        product = self.create_product('https://a')
+
+        response = self.sync([{'id_ecommerce': self.ecommerce.id, 'url': 'https://a', 'status': False}])
+
+        self.assertEqual(response.json(), {'created': 0, 'updated': 1})
+        product.refresh_from_db()
+        self.assertFalse(product.status)
+
+    def test_ignores_deactivation_of_unknown_products(self):
+        response = self.sync([{'id_ecommerce': self.ecommerce.id, 'url': 'https://a', 'status': False}])
+
+        self.assertEqual(response.json(), {'created': 0, 'updated': 0})
+        self.assertFalse(Product.objects.exists())
+
+    def test_rolls_back_when_a_record_is_invalid(self):
+        product = self.create_product('https://a')
+
+        response = self.sync([self.record('https://a', price='1200000.00'),
+                              self.record('https://b', price='not a price')])
+
+        self.assertEqual(response.status_code, 400)
+        product.refresh_from_db()
+        self.assertEqual(str(product.price), '1500000.00')
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_rejects_bodies_that_are_not_lists_of_products(self):
+        for body in [self.record('https://a'), ['https://a'], [self.record('https://a'), None]]:
+            response = self.sync(body)
+
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.exists())
+
+    def test_accepts_gzip_encoded_bodies(self):
+        body = gzip.compress(json.dumps([self.record('https://a')]).encode('utf-8'))
+
+        response = self.client.post(SYNC_URL, data=body, content_type='application/json',
+                                    HTTP_CONTENT_ENCODING='gzip')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 1, 'updated': 0})
+        self.assertTrue(Product.objects.filter(url='https://a').exists())
@@ -9,6 +9,7 @@ from cheaplatzi_deploy.serializers import ProductTypeSerializer, EcommerceSerial
 from rest_framework.decorators import api_view
 from django.core.paginator import Paginator
 from django.db.models import Q
+from django.db import transaction
 
 
 @api_view(['GET', 'POST', 'DELETE'])
@@ -118,6 +119,53 @@ def product_list(request):
         return JsonResponse({'message': '{} Product types were deleted successfully!'.format(count[0])}, status=status.HTTP_204_NO_CONTENT)
  
  
+@api_view(['POST'])
+def product_sync(request):
+    # Upserts the products by (id_ecommerce, url). Records with status False
+    # deactivate products that are no longer listed. Every product with the
+    # same key is updated, since the POST endpoint may have duplicated them
+    product_data = JSONParser().parse(request)
+    if not isinstance(product_data, list) or not all(isinstance(record, dict) for record in product_data):
+        return JsonResponse({'message': 'The body must be a list of products'}, status=status.HTTP_400_BAD_REQUEST)
+
+    urls = [record.get('url') for record in product_data]
+    existing = {}
+    for product in Product.objects.filter(url__in=urls):
+        existing.setdefault((product.id_ecommerce_id, product.url), []).append(product)
+    created = {}
+    updated = 0
+
+    with transaction.atomic():
+        for record in product_data:
+            key = (record.get('id_ecommerce'), record.get('url'))
+            products = existing.get(key)
+
+            if not products:
+                # The last record of a new key in the payload wins
+                if record.get('status', True):
+                    created[key] = record
+                else:
+                    created.pop(key, None)
+                continue
+
+            for product in products:
+                product_serializer = ProductSerializer(product, data=record, partial=True)
+                if not product_serializer.is_valid():
+                    transaction.set_rollback(True)
+                    return JsonResponse(product_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                product_serializer.save()
+                updated += 1
+
+        created = list(created.values())
+        product_serializer = ProductSerializer(data=created, many=True)
+        if not product_serializer.is_valid():
+            transaction.set_rollback(True)
+            return JsonResponse(product_serializer.errors, status=status.HTTP_400_BAD_REQUEST, safe=False)
+        product_serializer.save()
+
+    return JsonResponse({'created': len(created), 'updated': updated}, status=status.HTTP_201_CREATED)
+ 
+ 
 @api_view(['GET', 'PUT', 'DELETE'])
 def producttype_detail(request, pk):
     producttype = ProductType.objects.get(pk=pk)
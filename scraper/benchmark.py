@@ -0,0 +1,461 @@
+"""
+This module measures the scraper's performance offline, using the mocks saved
+in scraper/test, so that the cost of its stages is known and can be compared
+between commits. The crawl benchmarks serve the mocks from a local mock server
+(see utils/mockserver.py) instead of the real sites
+"""
+import os
+import sys
+import glob
+import json
+import time
+import click
+import tempfile
+import datetime
+import statistics
+import subprocess
+import urllib.parse
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.http import HtmlResponse, Request
+from utils.spiders import GamePlSpider, MixUpSpider, SearSpider
+from utils.spiders import OLXSpider, ColombiaGamerSpider as CGamerSpider
+from utils.constants import OLXConfig as OLX, ColombiaGamerConfig as CGamer
+from utils.constants import GamePlanetConfig as GamePl, SearsConfig as SEA
+from utils.constants import MixUpConfig as MU, MercadoLibreConfig as MLC
+from utils.constants import CacheConfig, RunConfig as Run, ProfileConfig
+from utils.exporters import read_records
+from utils.mockserver import MockServer, Faults
+from utils.profiling import PROFILER
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+SPIDERS = [
+    (OLXSpider, OLX),
+    (CGamerSpider, CGamer),
+    (GamePlSpider, GamePl),
+    (SearSpider, SEA),
+    (MixUpSpider, MU)
+]
+
+# The spiders crawled by the crawl benchmark, by the site names of the mock
+# server. GamePlanet's listings are rendered by a browser, so it is only
+# crawled when it is explicitly requested
+CRAWL_SPIDERS = {
+    'olx': OLXSpider,
+    'cgamer': CGamerSpider,
+    'gamepl': GamePlSpider,
+    'sears': SearSpider,
+    'mixup': MixUpSpider
+}
+CRAWL_SITES = ['olx', 'cgamer', 'sears', 'mixup', 'mercadolibre']
+
+
+def _load_product_pages(config):
+    """
+    Returns the (url, body, brand) of every saved product page of a site
+    """
+    pages = []
+
+    for product in config.TEST_PRODUCTS.value:
+        path = urllib.parse.unquote(product['url'].split('file://')[1])
+
+        with open(path, 'rb') as page:
+            pages.append((product['url'], page.read(),
+                          product['id_type_product']))
+
+    return pages
+
+
+def _time_parse(spider, pages, repeat):
+    """
+    Parses every page repeat times with the spider's parse_product, and returns
+    the seconds each parse took. Every parse gets a new response, so that the
+    documents are parsed again as they would be during a crawl
+    """
+    timings = []
+
+    for _ in range(0, repeat):
+        for url, body, brand in pages:
+            request = Request(url, meta = { 'brand': brand })
+            started = time.perf_counter()
+            response = HtmlResponse(url, body = body, encoding = 'utf-8',
+                                    request = request)
+            list(spider.parse_product(response))
+            timings.append(time.perf_counter() - started)
+
+    return timings
+
+
+def _get_percentile(timings, fraction):
+    """
+    Returns the specified percentile (a fraction) of the timings in
+    milliseconds, or None if there are none
+    """
+    if not timings:
+        return None
+
+    timings = sorted(timings)
+
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))] * 1000
+
+
+def _report(name, timings):
+    """
+    Returns the summary of a spider's parse timings
+    """
+    return {
+        'benchmark': 'parse',
+        'spider': name,
+        'pages': len(timings),
+        'mean_ms': statistics.mean(timings) * 1000,
+        'p50_ms': _get_percentile(timings, 0.5),
+        'p99_ms': _get_percentile(timings, 0.99),
+        'pages_per_second': len(timings) / sum(timings)
+    }
+
+
+def _get_commit():
+    """
+    Returns the hash of the checked out commit, or None if it is unknown
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], check = True,
+                              capture_output = True,
+                              text = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _get_peak_rss():
+    """
+    Returns the peak resident memory of the process in MB, or None if it can't
+    be measured in this platform
+    """
+    if resource is None:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _write_results(results, output):
+    """
+    Prints the results, and appends them to the output file (JSON Lines) if
+    one was specified. Every result is tagged with the commit and the time of
+    the run
+    """
+    commit = _get_commit()
+    timestamp = datetime.datetime.now().isoformat(timespec = 'seconds')
+    results = [{ **result, 'commit': commit, 'timestamp': timestamp }
+               for result in results]
+
+    print(f'\n{"*" * 70}')
+
+    for result in results:
+        print(', '.join(f'{key}: {value:.3f}' if isinstance(value, float)
+                        else f'{key}: {value}'
+                        for key, value in result.items()))
+
+    print(f'{"*" * 70}\n')
+
+    if output:
+        with open(output, 'a', encoding = 'utf-8') as output_file:
+            for result in results:
+                output_file.write(json.dumps(result))
+                output_file.write('\n')
+
+
+@click.group()
+def run():
+    """
+    This module runs the scraper's benchmarks. They use the mocks saved in
+    scraper/test, so they must be run from the repository's root:
+
+        `python3 ./scraper/benchmark.py parse [--repeat=<n>] [--output=<file>]`
+
+        `python3 ./scraper/benchmark.py crawl [--site=<site>]
+        [--products=<n>] [--latency=<s>] [--jitter=<s>] [--rate-limited=<f>]
+        [--failures=<f>] [--api-rate=<n>] [--rate-limits] [--seed=<n>]
+        [--output=<file>]`
+
+    The mock server can also be run on its own, to point the scraper at it:
+
+        `python3 ./scraper/benchmark.py serve [--port=<n>] [--products=<n>]
+        [--latency=<s>] [--jitter=<s>] [--rate-limited=<f>] [--failures=<f>]
+        [--api-rate=<n>] [--seed=<n>]`
+    """
+
+
+@run.command()
+@click.option('--repeat', default = 200, help = 'The number of times each '
+              'saved product page is parsed')
+@click.option('--output', help = 'The JSON Lines file the results are '
+              'appended to')
+def parse(repeat, output):
+    """
+    Measures the cost of parsing a product page for every spider
+    """
+    results = []
+
+    for spider_class, config in SPIDERS:
+        spider = spider_class()
+        timings = _time_parse(spider, _load_product_pages(config), repeat)
+        results.append(_report(spider.name, timings))
+
+    _write_results(results, output)
+
+
+def _crawl_spider(site, server):
+    """
+    Crawls the mock server's listings of a site with its spider, and returns
+    the number of responses and items, and the download latency of every
+    response
+    """
+    latencies = []
+    process = CrawlerProcess({ 'LOG_LEVEL': 'ERROR' })
+    crawler = process.create_crawler(CRAWL_SPIDERS[site])
+
+    def response_received(response, request, spider):
+        latencies.append(request.meta.get('download_latency', 0))
+
+    crawler.signals.connect(response_received,
+                            signal = signals.response_received)
+
+    kwargs = { 'start_urls': [f'{server}/{site}/listing/{query}'
+                              for query in ('switch', 'ps4', 'xbox-one')] }
+
+    if site == 'olx':
+        kwargs.update(api_url = f'{server}/olx/api',
+                      item_url = f'{server}/olx/item')
+
+    process.crawl(crawler, **kwargs)
+    process.start()
+
+    stats = crawler.stats.get_stats()
+
+    return (stats.get('response_received_count', 0),
+            stats.get('item_scraped_count', 0), latencies)
+
+
+def _crawl_mercadolibre(rate_limits):
+    """
+    Runs the MercadoLibre pipeline against the API's stand-in (the
+    MERCADOLIBRE_API_URL of the process), and returns the number of responses
+    and exported items, and the latency of every response. Unless rate_limits
+    is set, the API's request budget is lifted
+    """
+    from utils import apis
+    from utils.engine import ENGINE
+    from utils.cache import ResponseCache
+    from utils.limiters import LIMITER, get_host
+    from utils.checkpoints import CheckpointStore
+
+    apis.CACHE = ResponseCache(CacheConfig.PATH.value,
+                               CacheConfig.MAX_SIZE.value)
+    apis.CHECKPOINTS = CheckpointStore(Run.CHECKPOINT_PATH.value)
+
+    if not rate_limits:
+        LIMITER.configure(get_host(MLC.BASE_URL.value), 1e9, 1e9)
+
+    latencies = []
+    fetch = ENGINE.fetch
+
+    # Like the spiders' download latency, the time waited for the request
+    # budget is left out
+    async def timed_fetch(method, url, **kwargs):
+        response = await fetch(method, url, **kwargs)
+        latencies.append(response.elapsed.total_seconds())
+        return response
+
+    ENGINE.fetch = timed_fetch
+    apis.scrap_mercadolibre()
+
+    items = sum(1 for _ in read_records(glob.glob('export/ml_items*')))
+
+    return len(latencies), items, latencies
+
+
+def _server_options(command):
+    """
+    Decorator that adds the options of the mock server to a command
+    """
+    options = [
+        click.option('--products', default = 1000, help = 'The number of '
+                     'synthetic products of every listing'),
+        click.option('--latency', default = 0.0, help = 'The seconds every '
+                     'response of the mock server is delayed'),
+        click.option('--jitter', default = 0.0, help = 'The maximum random '
+                     'variation of the latency, in seconds'),
+        click.option('--rate-limited', default = 0.0, help = 'The fraction of '
+                     'the responses that are 429 errors'),
+        click.option('--failures', default = 0.0, help = 'The fraction of the '
+                     'responses that are 500 errors'),
+        click.option('--api-rate', type = float, help = 'The requests per '
+                     'second every client can send to the MercadoLibre API '
+                     'stand-in (unlimited by default)'),
+        click.option('--seed', type = int, help = 'The seed of the injected '
+                     'faults')
+    ]
+
+    for option in reversed(options):
+        command = option(command)
+
+    return command
+
+
+def _start_server(products, latency, jitter, rate_limited, failures, api_rate,
+                  seed, port = 0):
+    """
+    Starts the mock server with the specified options, and returns it
+    """
+    faults = Faults(latency, jitter, rate_limited, failures, seed)
+    rate_limit = (api_rate, MLC.BURST.value) if api_rate else None
+
+    return MockServer(products, faults, rate_limit, port = port).start()
+
+
+@run.command()
+@click.option('--site', 'sites', multiple = True,
+              type = click.Choice(list(CRAWL_SPIDERS) + ['mercadolibre']),
+              help = 'A site to crawl (can be repeated). Defaults to every site '
+              'that doesn\'t need a browser')
+@_server_options
+@click.option('--rate-limits', is_flag = True, help = 'Keep the configured '
+              'request budget of the MercadoLibre API')
+@click.option('--profile', is_flag = True, help = 'Write the collapsed stacks '
+              'of every stage of each site\'s crawl to profile/<site>')
+@click.option('--output', help = 'The JSON Lines file the results are '
+              'appended to')
+def crawl(sites, products, latency, jitter, rate_limited, failures, api_rate,
+          seed, rate_limits, profile, output):
+    """
+    Measures the throughput, latency and memory of crawling every site (and of
+    the MercadoLibre pipeline) against the local mock server
+
+    Each site is crawled in its own process, so that it gets a fresh reactor
+    and its own peak memory, and in a temporary directory, so that the real
+    exports, cache and job state are left untouched
+
+    With --profile, every crawl is sampled by the profiler (whose overhead
+    shows in the measures)
+    """
+    server = _start_server(products, latency, jitter, rate_limited, failures,
+                           api_rate, seed)
+    settings = { 'products': products, 'latency': latency, 'jitter': jitter,
+                 'rate_limited': rate_limited, 'failures': failures,
+                 'api_rate': api_rate }
+    results = []
+
+    try:
+        for site in sites or CRAWL_SITES:
+            env = dict(os.environ, MERCADOLIBRE_API_URL = f'{server.url}/ml')
+
+            with tempfile.NamedTemporaryFile(suffix = '.json') as result:
+                command = [sys.executable, os.path.abspath(__file__),
+                           'crawl-site', '--site', site, '--server',
+                           server.url, '--result', result.name]
+
+                if rate_limits:
+                    command.append('--rate-limits')
+
+                if profile:
+                    command.extend(['--profile', os.path.abspath(
+                        f'{ProfileConfig.DIRECTORY.value}/{site}')])
+
+                subprocess.run(command, check = True, env = env,
+                               stdout = subprocess.DEVNULL)
+                results.append({ 'benchmark': 'crawl', 'site': site,
+                                 **settings, **json.load(result) })
+    finally:
+        server.stop()
+
+    print(f'The mock server answered {server.stats["requests"]} requests: '
+          f'{server.stats["rate_limited"]} injected 429, '
+          f'{server.stats["failures"]} injected 500, '
+          f'{server.stats["throttled"]} over the API\'s budget and '
+          f'{server.stats["not_modified"]} not modified')
+
+    if profile:
+        print('The collapsed stacks of every stage were written to '
+              f'{ProfileConfig.DIRECTORY.value}/<site>')
+
+    _write_results(results, output)
+
+
+@run.command()
+@click.option('--port', default = 8000, help = 'The port to listen on')
+@_server_options
+def serve(port, products, latency, jitter, rate_limited, failures, api_rate,
+          seed):
+    """
+    Runs the mock server until it is interrupted. The scraper consumes its
+    MercadoLibre API stand-in if MERCADOLIBRE_API_URL is set to the printed
+    URL
+    """
+    server = _start_server(products, latency, jitter, rate_limited, failures,
+                           api_rate, seed, port)
+
+    print(f'Serving the mocks at {server.url}')
+    print(f'MERCADOLIBRE_API_URL={server.url}/ml')
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f'Served {server.stats}')
+
+
+@run.command('crawl-site', hidden = True)
+@click.option('--site', required = True)
+@click.option('--server', required = True)
+@click.option('--result', required = True)
+@click.option('--rate-limits', is_flag = True)
+@click.option('--profile')
+def crawl_site(site, server, result, rate_limits, profile):
+    """
+    Crawls a single site against the mock server (run by the crawl benchmark
+    in its own process), and writes its measures to the result file. If a
+    profile directory is given, the crawl's collapsed stacks are written to it
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.makedirs('export')
+
+        if profile:
+            PROFILER.start()
+
+        started = time.perf_counter()
+
+        if site == 'mercadolibre':
+            pages, items, latencies = _crawl_mercadolibre(rate_limits)
+        else:
+            pages, items, latencies = _crawl_spider(site, server)
+
+        seconds = time.perf_counter() - started
+
+    if profile:
+        PROFILER.stop()
+        PROFILER.write(profile)
+
+    with open(result, 'w', encoding = 'utf-8') as result_file:
+        json.dump({
+            'seconds': seconds,
+            'pages': pages,
+            'items': items,
+            'pages_per_second': pages / seconds,
+            'items_per_second': items / seconds,
+            'p50_ms': _get_percentile(latencies, 0.5),
+            'p99_ms': _get_percentile(latencies, 0.99),
+            'peak_rss_mb': _get_peak_rss()
+        }, result_file)
+
+
+if __name__ == "__main__":
+    run()
@@ -2,50 +2,86 @@
 This module is in charge of performing requests to e-commerce sites' public 
 APIs, in order to retrieve product data
 """
+import os
 import sys
 import time
+import shutil
 import json
 import click
+import itertools
 import utils.apis as apis
+import utils.uploads as uploads
 from scrapy.crawler import CrawlerProcess
+from utils.cache import CACHE
+from utils.limiters import LIMITER
+from utils.seen import SEEN
+from utils.metrics import METRICS
+from utils.profiling import PROFILER
+from utils.archives import ARCHIVE, CAPTURE, REPLAY
+from utils.checkpoints import get_job_dir
+from utils.fingerprints import FingerprintStore
+from utils.resilience import RESILIENCE
+from utils.exporters import get_export_path, read_records
 from utils.spiders import GamePlSpider, MixUpSpider, SearSpider
 from utils.spiders import OLXSpider, ColombiaGamerSpider as CGamerSpider
 from utils.constants import MixUpConfig as MUConfig
-from utils.constants import MercadoLibreConfig as MLC, BACKEND_URL, SITE_IDS
+from utils.constants import MercadoLibreConfig as MLC, SITE_IDS
 from utils.constants import OLXConfig as OLX, ColombiaGamerConfig as CGamer
 from utils.constants import GamePlanetConfig as GamePl, SearsConfig as SEAConfig
+from utils.constants import BackendConfig as Backend, SyncConfig as Sync
+from utils.constants import ArchiveConfig as Archive, MetricsConfig
+from utils.constants import ProfileConfig
 
 
 def _store_in_remote_database(results_path, scrap_api = False, n_pages = 0,
-                              verbose = False):
+                              verbose = False, site = ''):
     """
-    This function sends the scraped data found as json files to the remote
+    This function sends the scraped data found as export files to the remote
     database through POST requests
 
     results_path is the base path to the file
     scrap_api indicates whether data has been scraped through an API
     n_pages indicates the number of scraped pages through an API
+    site is the name of the scraped site, which labels the upload metrics
+
+    Only the records that are new or changed since the last synchronized run
+    are sent, together with the deactivation of the ones that disappeared. The
+    records are streamed from the files and uploaded in compressed batches.
+    The batches that fail are spooled so that they can be sent with --replay
     """
     print('Sending requests to the backend\'s database API')
 
     if scrap_api:
-        data = []
-        for i in range(0, n_pages):
-            index = f'{i}'.zfill(3)
-            file_name = results_path.replace('.json', f'{index}.json')
+        paths = [get_export_path(results_path, i) for i in range(0, n_pages)]
+    else:
+        paths = [get_export_path(results_path)]
 
-            with open(file_name, encoding = 'utf-8') as data_file:
-                data.append(json.dumps(json.load(data_file)))
+    fingerprints = FingerprintStore(Sync.PATH.value)
+    changes = itertools.chain(fingerprints.diff(read_records(paths)),
+                              fingerprints.disappeared())
 
-        apis.store_request(data, BACKEND_URL, verbose)
-    else:
-        data = ""
-        with open(results_path, encoding = 'utf-8') as data_file:
-            data = json.dumps(json.load(data_file))
+    try:
+        stats = uploads.upload_records(changes, Sync.URL.value, verbose,
+                                       site = site)
+
+        if stats['failed']:
+            fingerprints.rollback()
+        else:
+            fingerprints.commit()
+    finally:
+        fingerprints.close()
+
+    delta = fingerprints.stats
 
-        apis.store_request([data], BACKEND_URL, verbose)
+    print(f'{delta["new"]} new, {delta["changed"]} changed, '
+          f'{delta["disappeared"]} disappeared and {delta["unchanged"]} '
+          'unchanged records')
+    print(f'Finished sending data to the backend: {stats["sent"]} batches '
+          f'sent, {stats["failed"]} failed')
 
-    print('Finished sending data to the backend')
+    if stats['failed']:
+        print(f'The failed batches were saved to {Backend.SPOOL_PATH.value}. '
+              'Use --replay to send them again')
 
 
 def _find_exact_among_records(records_collection, match, prop):
@@ -66,14 +102,193 @@ def _find_contains_among_records(records_collection, match, prop):
             if match.upper() in record[prop].upper()]
 
 
+SITES = [
+    ('MercadoLibre', None, MLC),
+    ('OLX', OLXSpider, OLX),
+    ('ColombiaGamer', CGamerSpider, CGamer),
+    ('GamePlanet', GamePlSpider, GamePl),
+    ('Sears', SearSpider, SEAConfig),
+    ('MixUp', MixUpSpider, MUConfig)
+]
+
+
+def _parse_sites(value):
+    """
+    Returns the sorted list of site indexes selected by the --site option (an
+    index, a comma-separated list of indexes, or "all"), or None if the value
+    is not valid
+    """
+    if value.strip().lower() == 'all':
+        return list(range(0, len(SITES)))
+
+    try:
+        indexes = {int(index) for index in value.split(',')}
+    except ValueError:
+        return None
+
+    if not all(0 <= index < len(SITES) for index in indexes):
+        return None
+
+    return sorted(indexes)
+
+
+def _track_site(deferred, results, index, crawler = None):
+    """
+    Adds the callbacks that record the result of a site's scraping to its
+    deferred: the number of exported pages (for the API) or items, the seconds
+    it took, and whether it failed
+    """
+    name = SITES[index][0]
+    started = time.time()
+
+    def finish(N):
+        count = crawler.stats.get_value('item_scraped_count', 0) if crawler \
+                else N
+        results[index] = { 'count': count, 'failed': False,
+                           'seconds': time.time() - started }
+        print(f'Finished scraping {name}!\n')
+
+    def fail(failure):
+        results[index] = { 'count': 0, 'failed': True,
+                           'seconds': time.time() - started }
+        print(f'Could not scrap {name} due to a problem:')
+        print(failure.getErrorMessage())
+
+    deferred.addCallbacks(finish, fail)
+
+
+def _reset_site(spider, config):
+    """
+    Deletes the job state (pending requests and seen URLs) and the export file
+    of a spider's previous run, so that its next run starts over
+    """
+    shutil.rmtree(get_job_dir(spider.name), ignore_errors = True)
+
+    try:
+        os.remove(get_export_path(config.EXPORT_FILE_PATH.value))
+    except OSError:
+        pass
+
+
+def _scrap_sites(indexes, verbose, store = False, resume = False,
+                 archive_mode = None, refresh = False):
+    """
+    Scraps the specified sites at the same time in a single reactor: all the
+    spiders are scheduled in one CrawlerProcess, while MercadoLibre's API
+    scraper runs in a worker thread
+
+    If store is set, the spiders' items are stored in the backend's database
+    while they are crawled (see pipelines.BackendPipeline). If resume is set,
+    every site continues its previous run from its checkpoints or job state
+
+    The archive_mode (CAPTURE or REPLAY) makes every site either append its
+    responses to the response archive, or read them from it instead of
+    requesting them. Either way (as with refresh), the spiders download every
+    product page again instead of skipping the ones fetched recently
+
+    Returns a dictionary with the result of each site (see _track_site)
+    """
+    results = {}
+
+    if archive_mode:
+        ARCHIVE.start(archive_mode)
+    spider_indexes = [index for index in indexes if SITES[index][1]]
+
+    if not spider_indexes:
+        from twisted.internet import defer
+
+        # It runs right away, and its exceptions become the deferred's failure
+        deferred = defer.maybeDeferred(apis.scrap_mercadolibre,
+                                       verbose = verbose, resume = resume)
+        _track_site(deferred, results, 0)
+
+        return results
+
+    # The items skipped by a resumed crawl are not seen again, so they can't
+    # be told apart from the ones that disappeared
+    process = CrawlerProcess({ 'BACKEND_STORE': store,
+                               'BACKEND_VERBOSE': verbose,
+                               'BACKEND_DEACTIVATE': not resume,
+                               'PERSIST_JOB_STATE': True,
+                               'ARCHIVE_MODE': archive_mode,
+                               'SEEN_REFRESH': refresh or bool(archive_mode) })
+    deferreds = []
+
+    for index in spider_indexes:
+        _, spider, config = SITES[index]
+        if not resume:
+            _reset_site(spider, config)
+
+        crawler = process.create_crawler(spider)
+        deferred = process.crawl(crawler,
+                                 start_urls = config.PRODUCT_URLS.value)
+        _track_site(deferred, results, index, crawler)
+        deferreds.append(deferred)
+
+    from twisted.internet import defer, reactor, threads
+
+    if 0 in indexes:
+        deferred = threads.deferToThread(apis.scrap_mercadolibre,
+                                         verbose = verbose, resume = resume)
+        _track_site(deferred, results, 0)
+        deferreds.append(deferred)
+
+    defer.DeferredList(deferreds).addBoth(lambda _: reactor.stop())
+    process.start(stop_after_crawl = False)
+
+    return results
+
+
+def _print_results(results, elapsed):
+    """
+    Prints the combined results and timings of the scraped sites
+    """
+    print(f'\n{"*" * 70}')
+    print('Scraping report\n')
+
+    for index, result in sorted(results.items()):
+        name = SITES[index][0]
+        unit = 'pages' if index == 0 else 'items'
+        outcome = 'FAILED' if result['failed'] else \
+                  f'{result["count"]} {unit}'
+
+        print(f'{name}: {outcome} in {result["seconds"]:.1f} seconds')
+
+    sequential = sum(result['seconds'] for result in results.values())
+
+    print(f'\nFinished in {elapsed:.1f} seconds ({sequential:.1f} seconds if '
+          'the sites were scraped one after another)')
+    print(f'{"*" * 70}\n')
+
+
 @click.command()
-@click.option('--site', help = 'The index of the site to scrap', type = int,
-              required = True)
+@click.option('--site', help = 'The index of the site to scrap, a '
+              'comma-separated list of indexes, or "all"')
 @click.option('--verbose', help = 'If present, show additional information in '
               'the output (show full API responses)', is_flag = True)
 @click.option('--store', help = 'This flag enables sending requests to the '
               'backend\'s database API to store the records', is_flag = True)
-def run(site, verbose, store):
+@click.option('--replay', help = 'This flag sends again the batches of records '
+              'that previous runs could not store in the backend\'s database '
+              'API', is_flag = True)
+@click.option('--resume', help = 'This flag continues the previous run of the '
+              'sites from where it stopped, instead of starting over',
+              is_flag = True)
+@click.option('--capture', help = 'This flag appends every response of the '
+              'run to the response archive', is_flag = True)
+@click.option('--reparse', help = 'This flag rebuilds the exports by parsing '
+              'the responses in the archive again, without any network access',
+              is_flag = True)
+@click.option('--refresh', help = 'This flag makes the spiders download every '
+              'product page again, even the ones fetched recently',
+              is_flag = True)
+@click.option('--metrics-port', type = int, help = 'The local port where the '
+              'metrics of the run are served (at /metrics) while it goes on')
+@click.option('--profile', help = 'This flag samples the run\'s stacks and '
+              'writes a profile of each stage (network wait, browser wait, '
+              'XPath parsing and JSON serialization)', is_flag = True)
+def run(site, verbose, store, replay, resume, capture, reparse, refresh,
+        metrics_port, profile):
     """
     This module retrieves the list of products from the Consoles and Video
     Games category within the selected e-commerce site.
@@ -87,71 +302,107 @@ def run(site, verbose, store):
     4: Sears\n
     5: MixUp\n
 
+    Several sites (such as `--site=0,2,4`) or all of them (`--site=all`) can be
+    scraped at the same time in a single process
+
     Windows Use: 
     
-        `python .\scraper\scraper.py --site=<index> [--verbose] [--store]`
+        `python .\scraper\scraper.py --site=<index> [--verbose] [--store] [--resume] [--refresh] [--capture | --reparse] [--metrics-port=<port>] [--profile]`
 
     Linux/Unix Use:
     
-        `python3 ./scraper/scraper.py --site=<index> [--verbose] [--store]`
-    """
-    if site == 0:
-        N = apis.scrap_mercadolibre(verbose = verbose)
-
-        print(f'Finished scraping MercadoLibre!\n')
-
-        if store:
-            _store_in_remote_database(MLC.EXPORT_FILE_PATH.value, True, N,
-                                      verbose)
-    elif site == 1:
-        process = CrawlerProcess()
-        process.crawl(OLXSpider, start_urls = OLX.PRODUCT_URLS.value)
-        process.start()
-
-        print(f'Finished scraping OLX!\n')
-
-        if store:
-            _store_in_remote_database(OLX.EXPORT_FILE_PATH.value,
-                                      verbose = verbose)
-    elif site == 2:
-        process = CrawlerProcess()
-        process.crawl(CGamerSpider, start_urls = CGamer.PRODUCT_URLS.value)
-        process.start()
-        print(f'Finished scraping ColombiaGamer!\n')
-
-        if store:
-            _store_in_remote_database(CGamer.EXPORT_FILE_PATH.value,
-                                      verbose = verbose)
-    elif site == 3:
-        process = CrawlerProcess()
-        process.crawl(GamePlSpider, start_urls = GamePl.PRODUCT_URLS.value)
-        process.start()
-        print(f'Finished scraping GamePlanet!\n')
-
-        if store:
-            _store_in_remote_database(GamePl.EXPORT_FILE_PATH.value,
-                                      verbose = verbose)
-    elif site == 4:
-        process = CrawlerProcess()
-        process.crawl(SearSpider, start_urls = SEAConfig.PRODUCT_URLS.value)
-        process.start()
-        print(f'Finished scraping Sears!\n')
-
-        if store:
-            _store_in_remote_database(SEAConfig.EXPORT_FILE_PATH.value,
-                                      verbose = verbose)
-    elif site == 5:
-        process = CrawlerProcess()
-        process.crawl(MixUpSpider, start_urls = MUConfig.PRODUCT_URLS.value)
-        process.start()
-        print(f'Finished scraping MixUp!\n')
-
-        if store:
-            _store_in_remote_database(MUConfig.EXPORT_FILE_PATH.value,
-                                      verbose = verbose)
-    else:
+        `python3 ./scraper/scraper.py --site=<index> [--verbose] [--store] [--resume] [--refresh] [--capture | --reparse] [--metrics-port=<port>] [--profile]`
+
+    The batches that failed to be stored are kept in a spool file, and can be
+    sent again with `--replay` (with or without `--site`)
+
+    An interrupted run can be continued with `--resume`: MercadoLibre skips
+    the pages it already exported, and the spiders restore their pending
+    requests and seen URLs
+
+    A run with `--capture` keeps every response in the response archive, and
+    `--reparse` rebuilds the exports from it (after fixing an extraction
+    rule, for instance) without requesting anything
+
+    The spiders skip the product pages fetched within the last hours (see
+    SEEN_TTL) and export the items scraped from them back then. Among the
+    older pages, only the RECRAWL_BUDGET ones most likely to have changed
+    (according to each product's history of price changes) are downloaded
+    again per run. `--refresh` downloads every page again
+
+    The latency, outcomes and operations in flight of every stage of the run
+    (fetch, render, parse, export and upload) are written to a Prometheus text
+    file while it goes on, and served at /metrics with `--metrics-port`
+
+    A run with `--profile` samples the stacks of every thread, and writes the
+    collapsed stacks of each stage (network wait, browser wait, XPath parsing,
+    JSON serialization, idle and other code) to the profile directory, ready
+    for flamegraph tools
+    """
+    if replay:
+        stats = uploads.replay_spool(Sync.URL.value, verbose)
+        print(f'Replayed the failed batches: {stats["sent"]} sent, '
+              f'{stats["failed"]} failed')
+
+        if site is None:
+            return
+
+    indexes = _parse_sites(site) if site is not None else None
+
+    if not indexes:
         print('Invalid option for site')
+        return
+
+    if capture and reparse:
+        print('The responses can\'t be captured and re-parsed at the same time')
+        return
+
+    if reparse and not os.path.exists(Archive.PATH.value):
+        print('There is no response archive to re-parse, capture one first '
+              'with --capture')
+        return
+
+    archive_mode = CAPTURE if capture else REPLAY if reparse else None
+    METRICS.start(MetricsConfig.PATH.value, metrics_port)
+
+    if profile:
+        PROFILER.start()
+
+    started = time.time()
+    results = _scrap_sites(indexes, verbose, store, resume, archive_mode,
+                           refresh)
+
+    if 0 in indexes and not reparse:
+        CACHE.print_report()
+        RESILIENCE.print_report()
+
+    if archive_mode:
+        ARCHIVE.print_report()
+        ARCHIVE.close()
+
+    if not reparse:
+        SEEN.print_report([SITES[index][1].name if SITES[index][1]
+                           else MLC.SEEN_SOURCE.value for index in indexes])
+
+    _print_results(results, time.time() - started)
+
+    # The spiders' items were already stored while crawling
+    if store and 0 in results and not results[0]['failed']:
+        _store_in_remote_database(MLC.EXPORT_FILE_PATH.value, True,
+                                  results[0]['count'], verbose,
+                                  MLC.METRICS_SITE.value)
+
+    if profile:
+        PROFILER.stop()
+        PROFILER.print_report()
+        PROFILER.write(ProfileConfig.DIRECTORY.value)
+        print('The collapsed stacks of every stage were written to '
+              f'{ProfileConfig.DIRECTORY.value}')
+
+    LIMITER.print_report()
+    METRICS.stop()
+    print(f'The metrics of the run were written to {MetricsConfig.PATH.value}')
 
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
@@ -3,18 +3,122 @@ This module performs unit tests on the scraper module
 """
 import os
 import sys
+import gzip
 import json
+import time
+import asyncio
+import aiohttp
 import pytest
 import requests
-import responses
 import urllib.parse
-from ..utils import apis
+import urllib.request
+import threading
+from types import SimpleNamespace
+from aioresponses import aioresponses, CallbackResult
+from ..utils import apis, uploads, middlewares, pipelines, seen
+from ..utils.cache import ResponseCache
+from ..utils.archives import ResponseArchive, CAPTURE, REPLAY
+from ..utils.engine import ENGINE
+from ..utils.mockserver import MockServer
+from ..utils.checkpoints import CheckpointStore
+from ..utils.seen import SeenStore, get_listing_fingerprint
+from ..utils.metrics import MetricsRegistry
+from ..utils.profiling import SamplingProfiler, get_stage
+from ..utils.browsers import DriverPool
+from ..utils.fingerprints import FingerprintStore
+from ..utils.pagination import get_page_urls
+from ..utils.selectors import SELECTORS, RULES
+from ..utils.resilience import ResiliencePolicy, CircuitOpenError
+from ..utils.exporters import get_export_path, read_records
 from ..utils.spiders import GamePlSpider, MixUpSpider, SearSpider
 from ..utils.spiders import OLXSpider, ColombiaGamerSpider as CGamerSpider
 from ..utils.constants import MercadoLibreConfig as MLC, SearsConfig as SEA
 from ..utils.constants import OLXConfig as OLX, ColombiaGamerConfig as CGamer
 from ..utils.constants import GamePlanetConfig as GamePl, MixUpConfig as MUC
+from ..utils.constants import BACKEND_URL, BRAND_IDS, SyncConfig as Sync
+from scrapy import Request
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy.utils.test import get_crawler
 from scrapy.crawler import CrawlerProcess
+from scrapy.exceptions import DropItem, IgnoreRequest
+from twisted.internet import defer
+
+
+@pytest.fixture(autouse = True)
+def _temporary_stores(tmp_path, monkeypatch):
+    """
+    Replaces the on-disk stores shared by the scraper's runs with stores in a
+    temporary directory, so that the tests neither read nor write the ones of
+    the working tree
+    """
+    store = SeenStore(f'{tmp_path}/seen.sqlite3')
+    monkeypatch.setattr(apis, 'CACHE',
+                        ResponseCache(f'{tmp_path}/responses.sqlite3', 1e6))
+    monkeypatch.setattr(apis, 'CHECKPOINTS',
+                        CheckpointStore(f'{tmp_path}/checkpoints.sqlite3'))
+    monkeypatch.setattr(apis, 'SEEN', store)
+    monkeypatch.setattr(middlewares, 'SEEN', store)
+
+
+class _MockAPI:
+    """
+    Mock of the HTTP APIs requested through aiohttp: every method and URL
+    answers with its registered responses in order (the last one repeats), and
+    every request is recorded in calls
+    """
+
+    def __init__(self, mocked):
+        self.mocked = mocked
+        self.routes = {}
+        self.calls = []
+
+    def add(self, method, url, status = 200, json = None, headers = None,
+            callback = None):
+        if (method, url) not in self.routes:
+            self.routes[(method, url)] = []
+            self.mocked.add(url, method, repeat = True,
+                            callback = lambda request_url, **kwargs:
+                                self._respond(method, url, kwargs))
+
+        self.routes[(method, url)].append(callback or (status, headers or {},
+                                                       json))
+
+    def replace(self, method, url, **kwargs):
+        self.routes[(method, url)] = []
+        self.add(method, url, **kwargs)
+
+    def reset(self):
+        for key in self.routes:
+            self.routes[key] = []
+
+    def _respond(self, method, url, kwargs):
+        request = SimpleNamespace(url = url, headers = kwargs.get('headers')
+                                  or {}, body = kwargs.get('data'))
+        self.calls.append(SimpleNamespace(request = request))
+        routes = self.routes[(method, url)]
+
+        if not routes:
+            raise aiohttp.ClientConnectionError(f'No mock for {method} {url}')
+
+        response = routes.pop(0) if len(routes) > 1 else routes[0]
+
+        if callable(response):
+            status, headers, body = response(request)
+            return CallbackResult(status = status, headers = headers,
+                                  body = body)
+
+        status, headers, payload = response
+        return CallbackResult(status = status, headers = headers,
+                              payload = payload)
+
+
+@pytest.fixture
+def api():
+    """
+    Mocks the HTTP APIs requested by the test
+    """
+    with aioresponses() as mocked:
+        yield _MockAPI(mocked)
 
 
 def _cleanup(created_file_path):
@@ -94,7 +198,7 @@ def _olx_setup():
                 in OLX.TEST_FILES.value]
 
     process = CrawlerProcess()
-    process.crawl(OLXSpider, start_urls = fileURIs)
+    process.crawl(OLXSpider, start_urls = fileURIs, use_browser = True)
     process.start()
 
 
@@ -156,9 +260,8 @@ def _assert_file_exists_and_matches_expected_value(file_path, expected):
     
     assert os.path.exists(file_path), file_message
 
-    with open(file_path) as json_file:
-        data = json.load(json_file)
-        assert data == expected, json_message
+    data = list(read_records([file_path]))
+    assert data == expected, json_message
 
 
 def _assert_files_exist_and_match_expected_value(file_paths, expected):
@@ -173,36 +276,43 @@ def _assert_files_exist_and_match_expected_value(file_paths, expected):
     for path in file_paths:
         assert os.path.exists(path), f'expected the file {path} to exist'
 
-        with open(path) as json_file:
-            data.append(json.load(json_file)[0])
+        data.append(next(read_records([path])))
         
     assert data == expected, json_message
 
 
-def _map_responses(response_URIs, mock_URLs):
+def _map_responses(api, response_URIs, mock_URLs):
     """
     Maps mock responses to endpoints
     """
     for i in range(0, len(response_URIs)):
         with open(response_URIs[i], 'r', encoding = 'utf-8') as json_file:
             data = json.load(json_file)
-            responses.add(responses.GET, mock_URLs[i],
-                          json = data, status = 200)
+            api.add('GET', mock_URLs[i], json = data, status = 200)
+
+
+def _map_multiget_responses(api, response_URIs, mock_URLs):
+    """
+    Maps mock responses to multiget endpoints, wrapping each one of them in the
+    list of { code, body } objects that MercadoLibre's multiget API returns
+    """
+    for i in range(0, len(response_URIs)):
+        with open(response_URIs[i], 'r', encoding = 'utf-8') as json_file:
+            data = json.load(json_file)
+            api.add('GET', mock_URLs[i],
+                    json = [{ 'code': 200, 'body': data }], status = 200)
 
 
-@responses.activate
 @pytest.mark.mercadolibre
-def test_mercadolibre_api_consuming_happy_path_json_data_exported():
+def test_mercadolibre_api_consuming_happy_path_json_data_exported(api):
     """
     This test case checks if MercadoLibre's API consuming generates the right
     json file after scraping a mock with MercadoLibre's expected responses
     """
-    file_path = f'{MLC.EXPORT_FILE_PATH.value}'
     output_files = []
 
     for i in range(0, 3):
-        index = f'{i}'.zfill(3)
-        output_files.append(file_path.replace('.json', f'{index}.json'))
+        output_files.append(get_export_path(MLC.EXPORT_FILE_PATH.value, i))
         _cleanup(output_files[i])
 
     _mercadolibre_setup()
@@ -210,17 +320,17 @@ def test_mercadolibre_api_consuming_happy_path_json_data_exported():
     index_URIs = [f'{MLC.TEST_PATH.value}/{file_name}'
                   for file_name in MLC.TEST_INDEX_FILES_PARSED.value]
     
-    _map_responses(index_URIs, MLC.TEST_INDEX_URLS.value)
+    _map_responses(api, index_URIs, MLC.TEST_INDEX_URLS.value)
     
     desc_URIs = [f'{MLC.TEST_PATH.value}/{file_name}'
                  for file_name in MLC.TEST_DESCRIPTION_FILES.value]
 
-    _map_responses(desc_URIs, MLC.TEST_DESCRIPTION_URLS.value)
+    _map_responses(api, desc_URIs, MLC.TEST_DESCRIPTION_URLS.value)
 
     detail_URIs = [f'{MLC.TEST_PATH.value}/{file_name}'
                    for file_name in MLC.TEST_PRODUCT_FILES_PARSED.value]
 
-    _map_responses(detail_URIs, MLC.TEST_PRODUCT_URLS.value)
+    _map_multiget_responses(api, detail_URIs, MLC.TEST_MULTIGET_URLS.value)
 
     apis.scrap_mercadolibre(0)
 
@@ -242,13 +352,936 @@ def test_mercadolibre_api_consuming_happy_path_json_data_exported():
         _cleanup(output_file)
 
 
+@pytest.mark.mercadolibre
+def test_mercadolibre_run_resumes_from_its_checkpoints(api, tmp_path,
+                                                       monkeypatch):
+    """
+    This test case checks that the exported MercadoLibre pages are
+    checkpointed, and that a resumed run only scraps the pages that the
+    interrupted one could not export
+    """
+    monkeypatch.setattr(apis, 'CHECKPOINTS',
+                        CheckpointStore(f'{tmp_path}/checkpoints.sqlite3'))
+    monkeypatch.setattr(apis, 'CACHE',
+                        ResponseCache(f'{tmp_path}/responses.sqlite3', 1e6))
+    monkeypatch.setattr(apis, 'RESILIENCE',
+                        ResiliencePolicy(0, 0, 0, 100, 0))
+    output_files = [get_export_path(MLC.EXPORT_FILE_PATH.value, i)
+                    for i in range(0, 3)]
+    _mercadolibre_setup()
+
+    index_URIs = [f'{MLC.TEST_PATH.value}/{file_name}'
+                  for file_name in MLC.TEST_INDEX_FILES_PARSED.value]
+    desc_URIs = [f'{MLC.TEST_PATH.value}/{file_name}'
+                 for file_name in MLC.TEST_DESCRIPTION_FILES.value]
+    detail_URIs = [f'{MLC.TEST_PATH.value}/{file_name}'
+                   for file_name in MLC.TEST_PRODUCT_FILES_PARSED.value]
+
+    _map_responses(api, index_URIs[:2], MLC.TEST_INDEX_URLS.value[:2])
+    _map_responses(api, desc_URIs, MLC.TEST_DESCRIPTION_URLS.value)
+    _map_multiget_responses(api, detail_URIs, MLC.TEST_MULTIGET_URLS.value)
+
+    apis.scrap_mercadolibre(0)
+
+    assert apis.CHECKPOINTS.get_completed(MLC.CHECKPOINT_RUN.value) == \
+           dict(enumerate(MLC.TEST_INDEX_URLS.value[:2]))
+
+    _map_responses(api, index_URIs[2:], MLC.TEST_INDEX_URLS.value[2:])
+    calls = len(api.calls)
+
+    apis.scrap_mercadolibre(0, resume = True)
+
+    resumed_urls = [call.request.url for call in api.calls[calls:]]
+
+    assert MLC.TEST_DESCRIPTION_URLS.value[2] in resumed_urls
+    assert not set(MLC.TEST_DESCRIPTION_URLS.value[:2]) & set(resumed_urls)
+    _assert_files_exist_and_match_expected_value(output_files,
+                                                 MLC.TEST_PRODUCTS.value)
+
+    for path in index_URIs + detail_URIs + output_files:
+        _cleanup(path)
+
+
+@pytest.mark.mercadolibre
+def test_mercadolibre_pages_with_placeholders_are_scraped_on_resume(
+        api, monkeypatch):
+    """
+    This test case checks that a MercadoLibre page whose products could not
+    get their description is exported with placeholders but not checkpointed,
+    and that a resumed run scraps it again once the description is available
+    """
+    monkeypatch.setattr(apis, 'RESILIENCE',
+                        ResiliencePolicy(0, 0, 0, 100, 0))
+    output_files = [get_export_path(MLC.EXPORT_FILE_PATH.value, i)
+                    for i in range(0, 3)]
+    _mercadolibre_setup()
+
+    index_URIs = [f'{MLC.TEST_PATH.value}/{file_name}'
+                  for file_name in MLC.TEST_INDEX_FILES_PARSED.value]
+    desc_URIs = [f'{MLC.TEST_PATH.value}/{file_name}'
+                 for file_name in MLC.TEST_DESCRIPTION_FILES.value]
+    detail_URIs = [f'{MLC.TEST_PATH.value}/{file_name}'
+                   for file_name in MLC.TEST_PRODUCT_FILES_PARSED.value]
+
+    api.add('GET', MLC.TEST_DESCRIPTION_URLS.value[0], status = 500)
+    _map_responses(api, index_URIs, MLC.TEST_INDEX_URLS.value)
+    _map_responses(api, desc_URIs, MLC.TEST_DESCRIPTION_URLS.value)
+    _map_multiget_responses(api, detail_URIs, MLC.TEST_MULTIGET_URLS.value)
+
+    apis.scrap_mercadolibre(0)
+
+    record, = read_records([output_files[0]])
+
+    assert record['description'] == ''
+    assert record[Sync.PLACEHOLDERS_FIELD.value] == ['description']
+    assert apis.CHECKPOINTS.get_completed(MLC.CHECKPOINT_RUN.value) == \
+           dict(list(enumerate(MLC.TEST_INDEX_URLS.value))[1:])
+
+    calls = len(api.calls)
+
+    apis.scrap_mercadolibre(0, resume = True)
+
+    resumed_urls = [call.request.url for call in api.calls[calls:]]
+
+    assert MLC.TEST_DESCRIPTION_URLS.value[0] in resumed_urls
+    assert not set(MLC.TEST_DESCRIPTION_URLS.value[1:]) & set(resumed_urls)
+    assert apis.CHECKPOINTS.get_completed(MLC.CHECKPOINT_RUN.value) == \
+           dict(enumerate(MLC.TEST_INDEX_URLS.value))
+    _assert_files_exist_and_match_expected_value(output_files,
+                                                 MLC.TEST_PRODUCTS.value)
+
+    for path in index_URIs + detail_URIs + output_files:
+        _cleanup(path)
+
+
+@pytest.mark.mercadolibre
+def test_mercadolibre_queries_without_a_total_are_not_paged(api, monkeypatch):
+    """
+    This test case checks that the remaining pages of a query are skipped when
+    its first page could not be obtained, instead of requesting every offset
+    """
+    monkeypatch.setattr(apis, 'RESILIENCE',
+                        ResiliencePolicy(0, 0, 0, 100, 0))
+    _mercadolibre_setup()
+    limit = 50
+    first_urls = [f'{url}&offset=0&limit={limit}'
+                  for url in MLC.PRODUCT_URLS.value]
+
+    api.add('GET', first_urls[0], status = 500)
+
+    for url in first_urls[1:]:
+        api.add('GET', url, json = { 'paging': { 'total': limit },
+                                     'results': [] })
+
+    N = apis.scrap_mercadolibre(limit)
+
+    assert N == len(first_urls)
+    assert [call.request.url for call in api.calls] == first_urls
+    assert apis.CHECKPOINTS.get_completed(MLC.CHECKPOINT_RUN.value) == \
+           dict(list(enumerate(first_urls))[1:])
+
+
+@pytest.mark.mercadolibre
+def test_mercadolibre_api_stand_in_pages_revalidates_and_throttles():
+    """
+    This test case checks that the MercadoLibre API's stand-in pages the search
+    results within the API's bounds, answers revalidations with 304 and
+    enforces its per-client request budget
+    """
+    server = MockServer(products = 30, rate_limit = (1, 4)).start()
+    search_url = f'{server.url}/ml/sites/{MLC.COUNTRY_ID.value}/search?q=ps4'
+
+    try:
+        page = requests.get(f'{search_url}&offset=20&limit=20').json()
+        invalid = requests.get(f'{search_url}&offset=0&limit=51')
+        item = requests.get(f'{server.url}/ml/items/{page["results"][0]["id"]}')
+        revalidated = requests.get(item.url, headers = {
+            'If-None-Match': item.headers['ETag']
+        })
+        throttled = requests.get(item.url)
+    finally:
+        server.stop()
+
+    assert page['paging'] == { 'total': 30, 'offset': 20, 'limit': 20 }
+    assert len(page['results']) == 10
+    assert invalid.status_code == 400
+    assert item.json()['id'] == page['results'][0]['id']
+    assert revalidated.status_code == 304
+    assert throttled.status_code == 429
+    assert int(throttled.headers['Retry-After']) >= 1
+
+
+@pytest.mark.mercadolibre
+def test_mercadolibre_run_against_the_api_stand_in(tmp_path, monkeypatch):
+    """
+    This test case checks that a whole MercadoLibre run against the API's
+    stand-in exports every product, retrying the requests over the stand-in's
+    budget, and that a second run serves the items from the cache
+    """
+    server = MockServer(products = 45, rate_limit = (200, 20)).start()
+    fetch = ENGINE.fetch
+
+    async def fetch_from_stand_in(method, url, **kwargs):
+        return await fetch(method, url.replace(MLC.BASE_URL.value,
+                                               f'{server.url}/ml'), **kwargs)
+
+    monkeypatch.setattr(ENGINE, 'fetch', fetch_from_stand_in)
+    monkeypatch.setattr(apis, 'CHECKPOINTS',
+                        CheckpointStore(f'{tmp_path}/checkpoints.sqlite3'))
+    monkeypatch.setattr(apis, 'CACHE',
+                        ResponseCache(f'{tmp_path}/responses.sqlite3', 1e7))
+    monkeypatch.setattr(apis, 'RESILIENCE',
+                        ResiliencePolicy(20, 0.01, 0.05, 1000, 0))
+    output_files = [get_export_path(MLC.EXPORT_FILE_PATH.value, i)
+                    for i in range(0, 9)]
+
+    try:
+        pages = apis.scrap_mercadolibre()
+        records = list(read_records(output_files))
+        apis.scrap_mercadolibre()
+    finally:
+        server.stop()
+
+        for output_file in output_files:
+            _cleanup(output_file)
+
+    assert pages == 9
+    assert len(records) == 135
+    assert len({ record['url'] for record in records }) == 135
+    assert all(record['description'] for record in records)
+    assert server.stats['throttled'] > 0
+    assert apis.CACHE.stats['hits'] == 135
+
+
+@pytest.mark.mercadolibre
+def test_mercadolibre_urls_stop_at_result_count():
+    """
+    This test case checks that the MercadoLibre page URLs are generated only for
+    the offsets that hold results, up to the API's maximum offset
+    """
+    base_url = MLC.PRODUCT_URLS.value[0]
+
+    urls = apis._get_all_mercadolibre_urls(base_url, 20, 45)
+    assert urls == [f'{base_url}&offset={offset}&limit=20'
+                    for offset in (0, 20, 40)]
+
+    assert len(apis._get_all_mercadolibre_urls(base_url, 20, 0)) == 1
+    assert len(apis._get_all_mercadolibre_urls(base_url, 20, 25577)) == \
+           MLC.MAX_OFFSET.value // 20 + 1
+    assert len(apis._get_all_mercadolibre_urls(base_url, 20)) == \
+           MLC.MAX_OFFSET.value // 20 + 1
+
+
+@pytest.mark.mercadolibre
+def test_mercadolibre_response_cache_revalidates_with_etag(api, tmp_path,
+                                                          monkeypatch):
+    """
+    This test case checks that cached MercadoLibre responses are served from
+    disk while fresh, and revalidated with a conditional request when stale
+    """
+    cache = ResponseCache(f'{tmp_path}/responses.sqlite3', 1024 * 1024)
+    monkeypatch.setattr(apis, 'CACHE', cache)
+
+    url = MLC.TEST_DESCRIPTION_URLS.value[0]
+    description = { 'plain_text': 'Ultima consola de Nintendo.' }
+
+    api.add('GET', url, json = description, status = 200,
+            headers = { 'ETag': '"v1"' })
+
+    assert apis.scrap_request([url])[0].json() == description
+    assert apis.scrap_request([url])[0].json() == description
+    assert len(api.calls) == 1
+
+    monkeypatch.setattr(apis, '_get_cache_ttl', lambda url: 1e-9)
+    api.replace('GET', url, status = 304)
+
+    assert apis.scrap_request([url])[0].json() == description
+    assert api.calls[1].request.headers['If-None-Match'] == '"v1"'
+    assert cache.report()['hits'] == 1
+    assert cache.report()['revalidations'] == 1
+    assert cache.report()['misses'] == 1
+
+    def evict_and_revalidate(request):
+        if 'If-None-Match' not in request.headers:
+            return (200, {}, json.dumps(description))
+
+        with cache.lock:
+            cache.connection.execute('DELETE FROM responses')
+
+        return (304, {}, '')
+
+    api.replace('GET', url, callback = evict_and_revalidate)
+
+    assert apis.scrap_request([url])[0].json() == description
+    assert 'If-None-Match' not in api.calls[-1].request.headers
+
+
+@pytest.mark.store
+def test_backend_upload_retries_and_spools_failed_batches(api, tmp_path,
+                                                         monkeypatch):
+    """
+    This test case checks that the records are uploaded in compressed batches,
+    that server errors are retried, and that the batches rejected by the
+    backend are spooled and can be replayed
+    """
+    monkeypatch.setattr(uploads, '_get_backoff', lambda attempt: 0)
+    spool_path = f'{tmp_path}/failed_batches.jsonl'
+    records = [{ 'name': f'Product {i}' } for i in range(0, 5)]
+
+    api.add('POST', BACKEND_URL, status = 503)
+    api.add('POST', BACKEND_URL, status = 201)
+
+    stats = uploads.upload(uploads.batch_payloads(records, 2), BACKEND_URL,
+                           spool_path = spool_path)
+    bodies = [json.loads(gzip.decompress(call.request.body))
+              for call in api.calls[1:]]
+
+    assert stats == { 'sent': 3, 'failed': 0 }
+    assert sorted(len(body) for body in bodies) == [1, 2, 2]
+
+    api.replace('POST', BACKEND_URL, status = 400)
+    stats = uploads.upload(uploads.batch_payloads(records, 5), BACKEND_URL,
+                           spool_path = spool_path)
+
+    assert stats == { 'sent': 0, 'failed': 1 }
+
+    api.replace('POST', BACKEND_URL, status = 201)
+
+    with open(f'{spool_path}.replay', 'w') as leftover_file:
+        leftover_file.write(json.dumps(json.dumps(records[:1])) + '\n')
+
+    assert uploads.replay_spool(BACKEND_URL, spool_path = spool_path) == \
+           { 'sent': 2, 'failed': 0 }
+    assert not os.path.exists(spool_path)
+    assert not os.path.exists(f'{spool_path}.replay')
+
+
+@pytest.mark.store
+def test_fingerprint_store_yields_only_the_changes(tmp_path):
+    """
+    This test case checks that only new and changed records are synchronized,
+    that the ones that disappeared are deactivated, and that the changes of a
+    run that was not committed are computed again
+    """
+    path = f'{tmp_path}/fingerprints.sqlite3'
+    records = [{ 'id_ecommerce': 1, 'url': f'https://site/{i}', 'name': 'A',
+                 'price': i } for i in range(0, 4)]
+
+    store = FingerprintStore(path)
+    assert list(store.diff(records)) == records
+    store.commit()
+    store.close()
+
+    changed = dict(records[1], price = 100)
+    store = FingerprintStore(path)
+    changes = list(store.diff([records[0], changed, records[2]])) + \
+              list(store.disappeared())
+
+    assert changes == [changed, { 'id_ecommerce': 1, 'url': 'https://site/3',
+                                  'status': False }]
+    assert store.stats == { 'new': 0, 'changed': 1, 'unchanged': 2,
+                            'disappeared': 1 }
+    store.rollback()
+    store.close()
+
+    store = FingerprintStore(path)
+    assert len(list(store.diff([records[0], changed, records[2]]))) == 1
+    assert len(list(store.disappeared())) == 1
+    store.close()
+
+    placeholder = dict(records[0], description = '',
+                       placeholders = ['description'])
+    new = dict(placeholder, url = 'https://site/4')
+    store = FingerprintStore(path)
+
+    assert list(store.diff([placeholder, new])) == \
+           [dict(records[0], url = 'https://site/4', description = '')]
+    assert store.stats['unchanged'] == 1
+    store.close()
+
+
+@pytest.mark.store
+def test_backend_pipeline_streams_batches_with_backpressure(tmp_path,
+                                                            monkeypatch):
+    """
+    This test case checks that the items are uploaded in batches while they
+    are scraped, that items wait when every upload slot is busy, that invalid
+    items are dropped, and that the run becomes the baseline once every batch
+    was sent
+    """
+    path = f'{tmp_path}/fingerprints.sqlite3'
+    uploads_started = []
+
+    def defer_to_thread(function, body, *args):
+        uploads_started.append((json.loads(body), defer.Deferred()))
+        return uploads_started[-1][1]
+
+    monkeypatch.setattr(pipelines.threads, 'deferToThread', defer_to_thread)
+    crawler = get_crawler(CGamerSpider)
+    crawler.spider = CGamerSpider.from_crawler(crawler)
+    pipeline = pipelines.BackendPipeline(crawler, BACKEND_URL,
+                                         max_in_flight = 1,
+                                         fingerprints_path = path)
+    pipeline.buffer = uploads.BatchBuffer(max_records = 1)
+    items = [dict(CGamer.TEST_PRODUCTS.value[0], url = f'https://site/{i}')
+             for i in range(0, 3)]
+
+    pipeline.open_spider()
+
+    assert pipeline.process_item(items[0]) == items[0]
+
+    results = [pipeline.process_item(item) for item in items[1:]]
+
+    assert results[0].result == items[1]
+    assert not results[1].called
+    assert len(uploads_started) == 1
+
+    with pytest.raises(DropItem):
+        pipeline.process_item(dict(items[0], price = 0))
+
+    uploads_started[0][1].callback(True)
+
+    assert results[1].called
+    assert len(uploads_started) == 2
+
+    closed = pipeline.close_spider()
+    uploads_started[1][1].callback(True)
+    uploads_started[2][1].callback(True)
+
+    assert closed.called
+    assert [body[0]['url'] for body, _ in uploads_started] == \
+           [item['url'] for item in items]
+    assert crawler.stats.get_value('backend/batches_sent') == 3
+
+    store = FingerprintStore(path)
+    assert list(store.diff(items)) == []
+    store.close()
+
+
+@pytest.mark.mercadolibre
+def test_mercadolibre_requests_are_retried_until_the_circuit_opens(api):
+    """
+    This test case checks that failed GET requests are retried following the
+    Retry-After header, and that the host's circuit opens after repeated
+    failures so that no more requests are sent to it
+    """
+    policy = ResiliencePolicy(max_retries = 2, backoff_base = 0,
+                              backoff_max = 0, failure_threshold = 3,
+                              cooldown = 60)
+    url = f'{MLC.BASE_URL.value}/items/MLM1'
+
+    api.add('GET', url, status = 503, headers = { 'Retry-After': '0' })
+    api.add('GET', url, json = { 'id': 'MLM1' })
+
+    response = asyncio.run(policy.fetch('GET', url))
+
+    assert response.json() == { 'id': 'MLM1' }
+    assert len(api.calls) == 2
+
+    api.replace('GET', url, status = 500)
+    response = asyncio.run(policy.fetch('GET', url))
+
+    assert response.status_code == 500
+    assert len(api.calls) == 5
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(policy.fetch('GET', url))
+
+    stats = policy.report()['api.mercadolibre.com']
+
+    assert len(api.calls) == 5
+    assert stats['retries'] == 3 and stats['rejected'] == 1
+    assert stats['circuit_opened'] == 1
+    assert stats['statuses'] == { 503: 1, 500: 3 }
+
+
+class _FileDriver:
+    """
+    Stand-in for a Selenium driver that loads the mocks from the file system
+    """
+
+    def get(self, url):
+        with open(urllib.parse.unquote(url.split('file://')[1])) as page:
+            self.page_source = page.read()
+        self.current_url = url
+
+    def find_element(self, by, value):
+        return True
+
+    def quit(self):
+        pass
+
+
+@pytest.mark.browser
+def test_browser_middleware_renders_pages_with_a_driver_pool(monkeypatch):
+    """
+    This test case checks that the pages marked for a browser are rendered by
+    the pool's drivers, and that the spiders scrap the rendered responses
+    """
+    monkeypatch.setattr(middlewares, 'DriverPool',
+                        lambda size: DriverPool(size, _FileDriver))
+    middleware = middlewares.BrowserMiddleware(get_crawler(GamePlSpider), 2)
+    spider = GamePlSpider()
+
+    for product in GamePl.TEST_PRODUCTS.value:
+        request = Request(product['url'],
+                          meta = { 'browser': 'wait_for_product' })
+        response = middleware.render(request, spider)
+
+        assert list(spider.parse_product(response)) == [product]
+
+    assert len(middleware.pool.drivers) == 1
+
+    spider.fail = lambda driver: [][0]
+    request = Request(GamePl.TEST_PRODUCTS.value[0]['url'],
+                      meta = { 'browser': 'fail' })
+
+    with pytest.raises(IndexError):
+        middleware.render(request, spider)
+
+    assert middleware.pool.idle.qsize() == 1
+    middleware.pool.close()
+
+
+@pytest.mark.archive
+def test_archived_responses_are_replayed_without_requests(api, tmp_path,
+                                                          monkeypatch):
+    """
+    This test case checks that the captured responses of the spiders (told
+    apart by their form data) and of the API consuming functions are replayed
+    from the archive with their metadata, and that the requests that were not
+    captured are ignored
+    """
+    archive = ResponseArchive(f'{tmp_path}/responses.gz',
+                              f'{tmp_path}/index.sqlite3')
+    monkeypatch.setattr(middlewares, 'ARCHIVE', archive)
+    monkeypatch.setattr(apis, 'ARCHIVE', archive)
+    monkeypatch.setattr(apis, 'CACHE',
+                        ResponseCache(f'{tmp_path}/responses.sqlite3', 1e6))
+    crawler = get_crawler(MixUpSpider)
+    crawler.spider = MixUpSpider()
+    listing_url = MUC.PRODUCT_URLS.value[0]
+    listing_body = b'<html><body><a href="/product">Page 2</a></body></html>'
+    description_url = MLC.TEST_DESCRIPTION_URLS.value[0]
+    description = { 'plain_text': 'Consola' }
+
+    middleware = middlewares.ArchiveMiddleware(crawler, CAPTURE)
+    request = Request(listing_url, method = 'POST', body = b'page=2',
+                      meta = { 'browser_result': ['/product'] })
+    middleware.process_request(request)
+    middleware.process_response(request, HtmlResponse(
+        listing_url, body = listing_body, encoding = 'utf-8',
+        request = request))
+    api.add('GET', description_url, json = description)
+    apis.scrap_request([description_url])
+    archive.close()
+
+    api.reset()
+    middleware = middlewares.ArchiveMiddleware(crawler, REPLAY)
+    request = Request(listing_url, method = 'POST', body = b'page=2')
+    response = middleware.process_request(request)
+
+    assert isinstance(response, HtmlResponse)
+    assert response.body == listing_body
+    assert request.meta['browser_result'] == ['/product']
+    assert apis.scrap_request([description_url])[0].json() == description
+
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request(listing_url, method = 'POST',
+                                           body = b'page=3'))
+
+    assert archive.stats == { 'captured': 2, 'replayed': 2, 'missing': 1 }
+    assert crawler.stats.get_value('archive/missing') == 1
+    archive.close()
+
+
+@pytest.mark.store
+def test_seen_urls_skip_fresh_product_pages(tmp_path, monkeypatch):
+    """
+    This test case checks that the product pages fetched recently are replaced
+    by their stored items (once per URL), unless their listing fingerprint
+    changed or they must not be filtered, and that the downloaded ones are
+    recorded
+    """
+    store = SeenStore(f'{tmp_path}/seen.sqlite3')
+    monkeypatch.setattr(middlewares, 'SEEN', store)
+    crawler = get_crawler(OLXSpider)
+    spider = crawler.spider = OLXSpider()
+    middleware = middlewares.SeenUrlMiddleware(crawler, 3600)
+    url = f'{OLX.ITEM_URL.value}/xbox-one-s-1tb-con-control-iid-1001'
+    fingerprint = get_listing_fingerprint('Xbox One S', 1200000)
+    item = { 'name': 'Xbox One S', 'price': 1200000, 'url': url }
+
+    def get_request(fingerprint, dont_filter = False):
+        return Request(url, callback = spider.parse_product,
+                       dont_filter = dont_filter,
+                       meta = { 'listing_fingerprint': fingerprint })
+
+    listing = TextResponse(OLX.API_URL.value, body = b'{}',
+                           request = Request(OLX.API_URL.value))
+    request, = middleware.process_spider_output(listing,
+                                                [get_request(fingerprint)])
+    assert request.meta['seen_url'] == url
+
+    response = TextResponse(url, body = b'', request = request)
+    assert list(middleware.process_spider_output(response, [item])) == [item]
+    assert store.get(url)['item'] == item
+    store.commit()
+
+    changed = get_listing_fingerprint('Xbox One S', 1000000)
+    output = list(middleware.process_spider_output(
+        listing, [get_request(fingerprint), get_request(fingerprint),
+                  get_request(changed), get_request(fingerprint, True)]))
+
+    assert output[0] == item
+    assert [element.meta['listing_fingerprint'] for element in output[1:]] \
+           == [changed, fingerprint]
+    assert output[1].priority == request.priority > 0
+    assert crawler.stats.get_value('seen/recorded') == 1
+    assert crawler.stats.get_value('seen/skipped') == 1
+
+
+@pytest.mark.store
+def test_recrawl_budget_goes_to_the_stalest_pages(tmp_path, monkeypatch):
+    """
+    This test case checks that the change history of the products ranks their
+    pages by expected staleness, and that only the budget stalest pages old
+    enough are downloaded again (prioritized, after the new ones) while the
+    rest are replaced by their stored items
+    """
+    day = 24 * 60 * 60
+    clock = [0]
+    monkeypatch.setattr(seen, 'time', SimpleNamespace(time = lambda: clock[0]))
+    store = SeenStore(f'{tmp_path}/seen.sqlite3')
+    monkeypatch.setattr(middlewares, 'SEEN', store)
+    spider = OLXSpider()
+    urls = { name: f'{OLX.ITEM_URL.value}/{name}'
+             for name in ('volatile', 'stable', 'once', 'fresh', 'new') }
+
+    for moment, prices in ((0, { 'volatile': 1, 'stable': 1 }),
+                           (day, { 'volatile': 2, 'stable': 1 }),
+                           (2 * day, { 'volatile': 3, 'stable': 1,
+                                       'once': 1 }),
+                           (2.75 * day, { 'fresh': 1 })):
+        clock[0] = moment
+
+        for name, price in prices.items():
+            store.record(urls[name], { 'price': price }, source = spider.name)
+
+        store.commit()
+
+    store.record(f'{MLC.BASE_URL.value}/other', { 'price': 1 },
+                 source = MLC.SEEN_SOURCE.value)
+    clock[0] = 3 * day
+
+    assert list(store.get_due(spider.name, day / 2)) == [
+        urls['volatile'], urls['once'], urls['stable']
+    ]
+    assert list(store.get_due(spider.name, day / 2, 2)) == [
+        urls['volatile'], urls['once']
+    ]
+
+    crawler = get_crawler(OLXSpider)
+    crawler.spider = spider
+    middleware = middlewares.SeenUrlMiddleware(crawler, day / 2, 2)
+    middleware.spider_opened(spider)
+    listing = TextResponse(OLX.API_URL.value, body = b'{}',
+                           request = Request(OLX.API_URL.value))
+    output = list(middleware.process_spider_output(
+        listing, [Request(url, callback = spider.parse_product)
+                  for url in urls.values()]))
+    downloaded = { element.url: element.priority for element in output
+                   if isinstance(element, Request) }
+
+    assert list(downloaded) == [urls['volatile'], urls['once'], urls['new']]
+    assert downloaded[urls['new']] > downloaded[urls['volatile']] > \
+           downloaded[urls['once']] > 0
+    assert [element for element in output
+            if not isinstance(element, Request)] == [{ 'price': 1 }] * 2
+    assert crawler.stats.get_value('seen/due') == 2
+    assert crawler.stats.get_value('seen/skipped') == 2
+
+    store = SeenStore(f'{tmp_path}/flushed.sqlite3', flush_size = 2)
+
+    for price in (1, 2, 3):
+        store.record(urls['volatile'], { 'price': price }, source = spider.name)
+        store.record(urls['stable'], { 'price': 1 }, source = spider.name)
+        assert not store.pending
+
+    store.commit()
+    store.record(urls['volatile'], { 'price': 4 }, source = spider.name)
+    store.commit()
+
+    assert store.get(urls['volatile'])['item'] == { 'price': 4 }
+    assert store.connection.execute('SELECT checks, changes FROM pages WHERE '
+                                    'url = ?', (urls['volatile'],)) \
+                .fetchone() == (1, 1)
+
+
+@pytest.mark.metrics
+def test_stage_metrics_are_exposed_in_the_text_format(tmp_path, monkeypatch):
+    """
+    This test case checks that the operations of the stages are counted by
+    outcome and timed per site and endpoint (the spiders' downloads and
+    callbacks through their middlewares), and that the metrics are served and
+    written in Prometheus' text format
+    """
+    registry = MetricsRegistry()
+    monkeypatch.setattr(middlewares, 'METRICS', registry)
+    crawler = get_crawler(CGamerSpider)
+    spider = crawler.spider = CGamerSpider()
+    fetch_middleware = middlewares.FetchMetricsMiddleware(crawler)
+    parse_middleware = middlewares.ParseMetricsMiddleware(crawler)
+
+    with registry.track('fetch', 'mercadolibre', 'search'):
+        assert registry.in_flight.get('fetch', 'mercadolibre') == 1
+
+    with pytest.raises(ValueError):
+        with registry.track('upload', 'mercadolibre', '/api/sync'):
+            raise ValueError
+
+    request = Request(CGamer.PRODUCT_URLS.value[0],
+                      callback = spider.parse_product)
+    fetch_middleware.process_request(request)
+    response = HtmlResponse(request.url, status = 404, body = b'',
+                            request = request)
+    fetch_middleware.process_response(request, response)
+    output = list(parse_middleware.process_spider_output(
+        response, iter([{ 'name': 'Xbox One S' }])))
+    parse_middleware.item_scraped(output[0], response, spider)
+
+    registry.start(f'{tmp_path}/scraper.prom', 0)
+    port = registry.server.server_address[1]
+
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as reply:
+        text = reply.read().decode('utf-8')
+
+    registry.stop()
+
+    with open(f'{tmp_path}/scraper.prom') as metrics_file:
+        assert metrics_file.read() == text
+
+    lines = text.splitlines()
+
+    assert '# TYPE scraper_stage_seconds histogram' in lines
+    assert 'scraper_stage_operations_total{stage="fetch",site="mercadolibre",' \
+           'endpoint="search",outcome="ok"} 1' in lines
+    assert 'scraper_stage_operations_total{stage="upload",site="mercadolibre",' \
+           'endpoint="/api/sync",outcome="error"} 1' in lines
+    assert 'scraper_stage_operations_total{stage="fetch",site="cgamerspider",' \
+           'endpoint="parse_product",outcome="error"} 1' in lines
+    assert 'scraper_stage_seconds_bucket{stage="parse",site="cgamerspider",' \
+           'endpoint="parse_product",le="+Inf"} 1' in lines
+    assert 'scraper_stage_in_flight{stage="fetch",site="cgamerspider"} 0' \
+           in lines
+    assert 'scraper_items_total{site="cgamerspider"} 1' in lines
+
+
+@pytest.mark.profile
+def test_profiler_samples_are_split_by_stage(tmp_path):
+    """
+    This test case checks that the sampled stacks are attributed to their
+    stage (a browser's HTTP calls to the browser, a blocked socket to the
+    network), and that the samples of a thread serializing json are written
+    as collapsed stacks of the json stage
+    """
+    assert get_stage(['/lib/twisted/internet/base.py',
+                      '/lib/urllib3/connectionpool.py',
+                      '/usr/lib/python3/socket.py']) == 'network'
+    assert get_stage(['/repo/scraper/utils/middlewares.py',
+                      '/lib/selenium/webdriver/remote/webdriver.py',
+                      '/usr/lib/python3/socket.py']) == 'browser'
+    assert get_stage(['/lib/scrapy/core/scraper.py',
+                      '/repo/scraper/utils/spiders.py',
+                      '/lib/parsel/selector.py']) == 'xpath'
+    assert get_stage(['/usr/lib/python3/threading.py']) == 'idle'
+    assert get_stage(['/repo/scraper/utils/spiders.py']) == 'other'
+
+    records = [dict(CGamer.TEST_PRODUCTS.value[0], url = f'https://site/{i}')
+               for i in range(0, 1000)]
+    stopped = threading.Event()
+
+    def serialize():
+        while not stopped.is_set():
+            json.dumps(records)
+
+    profiler = SamplingProfiler(0.001)
+    thread = threading.Thread(target = serialize)
+    profiler.start()
+    thread.start()
+    time.sleep(0.3)
+    stopped.set()
+    thread.join()
+    profiler.stop()
+
+    assert profiler.get_stage_counts()['json'] > 0
+
+    paths = profiler.write(f'{tmp_path}/profile')
+
+    assert f'{tmp_path}/profile/stacks.folded' in paths
+
+    with open(f'{tmp_path}/profile/json.folded') as folded_file:
+        lines = folded_file.read().splitlines()
+
+    assert any('serialize (test/test_scraper.py:' in line and
+               'json/encoder.py' in line for line in lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+@pytest.mark.gamepl
+def test_gamepl_product_pages_are_parsed_without_a_browser():
+    """
+    This test case checks that GamePlanet's product pages are scraped from the
+    downloaded HTML, and that the pages missing required fields are requested
+    again to be rendered by a browser
+    """
+    crawler = get_crawler(GamePlSpider)
+    spider = GamePlSpider.from_crawler(crawler)
+    product = GamePl.TEST_PRODUCTS.value[0]
+
+    with open(urllib.parse.unquote(product['url'].split('file://')[1])) as page:
+        body = page.read()
+
+    response = HtmlResponse(product['url'], body = body, encoding = 'utf-8',
+                            request = Request(product['url']))
+
+    assert list(spider.parse_product(response)) == [product]
+
+    response = HtmlResponse(product['url'], body = '<html></html>',
+                            encoding = 'utf-8',
+                            request = Request(product['url']))
+    fallback = list(spider.parse_product(response))
+
+    assert len(fallback) == 1
+    assert fallback[0].meta['browser'] == 'wait_for_product'
+    assert crawler.stats.get_value('gamepl/browser_fallback') == 1
+
+
+@pytest.mark.mixup
+def test_mixup_listing_pages_replay_the_postback():
+    """
+    This test case checks that MixUp's next listing page is requested by
+    replaying the ASP.NET postback of its "next" button with the page's
+    hidden fields, and that the last page doesn't request another one
+    """
+    spider = MixUpSpider()
+    url = f'file://{MUC.TEST_PATH.value}/mixup_mock.html'
+    body = ('<html><body><form method="post" action="Productos.aspx">'
+            '<input type="hidden" name="__VIEWSTATE" value="state" />'
+            f'<a id="{MUC.NEXT_ID.value}" href="javascript:__doPostBack('
+            '\'ctl00$container$linkPnts2Up\',\'\')">Next</a>'
+            '</form></body></html>')
+    response = HtmlResponse(url, body = body, encoding = 'utf-8',
+                            request = Request(url, meta = { 'page': 1 }))
+
+    next_page_request = spider._get_next_page_request(response)
+    form = urllib.parse.parse_qs(next_page_request.body.decode())
+
+    assert next_page_request.method == 'POST'
+    assert next_page_request.url == f'file://{MUC.TEST_PATH.value}/Productos.aspx'
+    assert form == { '__VIEWSTATE': ['state'],
+                     '__EVENTTARGET': ['ctl00$container$linkPnts2Up'] }
+    assert next_page_request.meta['page'] == 2
+
+    body = body.replace('<a ', '<a disabled="disabled" ')
+    response = HtmlResponse(url, body = body, encoding = 'utf-8',
+                            request = Request(url, meta = { 'page': 2 }))
+
+    assert spider._get_next_page_request(response) is None
+
+
+@pytest.mark.cgamer
+def test_listing_pages_are_discovered_from_the_paginator():
+    """
+    This test case checks that all the pages of a listing are found from the
+    paginator of its first page, even when it only shows a window of them, and
+    that paginators without a URL pattern return their visible pages
+    """
+    url = 'https://www.colombiagamer.com.co/productos/xbox-one'
+    links = ''.join(f'<li><a href="?limit=24&start={(page - 1) * 24}">{page}'
+                    '</a></li>' for page in range(1, 6))
+    body = (f'<nav role="pagination"><ul>{links}<li><a href="?limit=24&'
+            'start=240">Fin</a></li></ul></nav>')
+    response = HtmlResponse(url, body = body, encoding = 'utf-8')
+
+    page_urls = get_page_urls(response, '//nav[@role="pagination"]//a', 100)
+
+    assert len(page_urls) == 10
+    assert page_urls[0] == f'{url}?limit=24&start=24'
+    assert page_urls[-1] == f'{url}?limit=24&start=240'
+    assert len(get_page_urls(response, '//nav[@role="pagination"]//a', 4)) == 3
+
+    body = ('<nav role="pagination"><a href="/a">1</a><a href="/b">2</a>'
+            '<a href="/c">3</a><a href="/c">Siguiente</a></nav>')
+    response = HtmlResponse(url, body = body, encoding = 'utf-8')
+
+    assert get_page_urls(response, '//nav[@role="pagination"]//a', 100) == [
+        'https://www.colombiagamer.com.co/b',
+        'https://www.colombiagamer.com.co/c'
+    ]
+
+
+@pytest.mark.cgamer
+def test_selectors_are_compiled_once_and_match_parsel():
+    """
+    This test case checks that the sites' extraction rules are compiled only
+    once and shared by the spiders, and that they return the same strings as
+    parsel's selectors (including the HTML of the matched elements)
+    """
+    spider = CGamerSpider()
+    product = CGamer.TEST_PRODUCTS.value[0]
+
+    with open(urllib.parse.unquote(product['url'].split('file://')[1])) as page:
+        body = page.read()
+
+    response = HtmlResponse(product['url'], body = body, encoding = 'utf-8')
+
+    assert spider.selectors is CGamerSpider().selectors
+    assert spider.selectors is SELECTORS.get(CGamer.SPIDER_NAME.value)
+
+    for field, rule in RULES[CGamer.SPIDER_NAME.value].items():
+        assert spider.selectors.get_all(response, field) == \
+               response.xpath(rule).getall()
+
+
+@pytest.mark.olx
+def test_olx_listing_json_pages_schedule_product_pages():
+    """
+    This test case checks that OLX's listing json data schedules the product
+    pages of its items, and that the first page requests the rest of the pages
+    according to the total number of items
+    """
+    spider = OLXSpider(start_urls = [OLX.PRODUCT_URLS.value[0]])
+    request = next(spider.start_requests())
+
+    with open(f'{OLX.TEST_PATH.value}/{OLX.TEST_LISTING_FILE.value}') as mock:
+        body = mock.read()
+
+    response = TextResponse(request.url, body = body, encoding = 'utf-8',
+                            request = request)
+    requests = list(spider.parse_listing(response))
+    product_requests = [request for request in requests
+                        if request.callback == spider.parse_product]
+    page_requests = [request for request in requests
+                     if request.callback == spider.parse_listing]
+
+    assert [request.url for request in product_requests] == [
+        f'{OLX.ITEM_URL.value}/xbox-one-s-1tb-con-control-iid-1001',
+        f'{OLX.ITEM_URL.value}/consola-xbox-one-x-nueva-iid-1002'
+    ]
+    assert all(request.meta['brand'] == BRAND_IDS['xbox']
+               for request in product_requests)
+    assert [request.meta['page'] for request in page_requests] == [1, 2]
+    assert 'query=xbox+one' in page_requests[0].url
+
+
 @pytest.mark.olx
 def test_olx_scrapper_happy_path_json_data_exported():
     """
     This test case checks if the scraper generates the right json file after
     scraping a mock with OLX's site structure
     """
-    file_path = f'{OLX.EXPORT_FILE_PATH.value}'
+    file_path = get_export_path(OLX.EXPORT_FILE_PATH.value)
     _cleanup(file_path)
     _olx_setup()
 
@@ -263,7 +1296,7 @@ def test_cgamer_scrapper_happy_path_json_data_exported():
     This test case checks if the scraper generates the right json file after
     scraping a mock with CGamer's site structure
     """
-    file_path = f'{CGamer.EXPORT_FILE_PATH.value}'
+    file_path = get_export_path(CGamer.EXPORT_FILE_PATH.value)
     _cleanup(file_path)
     _cgamer_setup()
 
@@ -278,16 +1311,15 @@ def test_gamepl_scrapper_happy_path_json_data_exported():
     This test case checks if the scraper generates the right json file after
     scraping a mock with GamePlanet's site structure
     """
-    file_path = f'{GamePl.EXPORT_FILE_PATH.value}'
+    file_path = get_export_path(GamePl.EXPORT_FILE_PATH.value)
     _cleanup(file_path)
     _gamepl_setup()
 
     assert os.path.exists(file_path), f'expected the file {file_path} to exist'
 
-    with open(file_path) as json_file:
-        data = json.load(json_file)
-        assert data == GamePl.TEST_PRODUCTS.value, \
-                'the exported json file does not match the expected result'
+    data = list(read_records([file_path]))
+    assert data == GamePl.TEST_PRODUCTS.value, \
+           'the exported json file does not match the expected result'
 
     _cleanup(file_path)
 
@@ -298,16 +1330,18 @@ def test_mixup_scrapper_happy_path_json_data_exported():
     This test case checks if the scraper generates the right json file after
     scraping a mock with Mixup's site structure
     """
-    file_path = f'{MUC.EXPORT_FILE_PATH.value}'
+    file_path = get_export_path(MUC.EXPORT_FILE_PATH.value)
     _cleanup(file_path)
     _mixup_setup()
 
     assert os.path.exists(file_path), f'expected the file {file_path} to exist'
 
-    with open(file_path) as json_file:
-        data = json.load(json_file)
-        assert data == MUC.TEST_PRODUCTS.value, \
-                'the exported json file does not match the expected result'
+    # The product pages are fetched concurrently, so they can come in any order
+    data = sorted(read_records([file_path]), key = lambda record: record['url'])
+    expected = sorted(MUC.TEST_PRODUCTS.value,
+                      key = lambda record: record['url'])
+    assert data == expected, \
+           'the exported json file does not match the expected result'
 
     _cleanup(file_path)
 
@@ -318,15 +1352,14 @@ def test_sears_scrapper_happy_path_json_data_exported():
     This test case checks if the scraper generates the right json file after
     scraping a mock with Sears's site structure
     """
-    file_path = f'{SEA.EXPORT_FILE_PATH.value}'
+    file_path = get_export_path(SEA.EXPORT_FILE_PATH.value)
     _cleanup(file_path)
     _sears_setup()
 
     assert os.path.exists(file_path), f'expected the file {file_path} to exist'
 
-    with open(file_path) as json_file:
-        data = json.load(json_file)
-        assert data == SEA.TEST_PRODUCTS.value, \
-                'the exported json file does not match the expected result'
+    data = list(read_records([file_path]))
+    assert data == SEA.TEST_PRODUCTS.value, \
+           'the exported json file does not match the expected result'
 
     _cleanup(file_path)
@@ -1,14 +1,22 @@
 """
 This module contains the definiton of functions for API consuming
 """
-import time
-import json
-import grequests
-from .constants import MercadoLibreConfig as MLC
-from .constants import HEADERS, SITE_IDS, BRAND_IDS
-
-
-def _handle_exception(request, exception):
+import os
+import math
+import asyncio
+from .cache import CACHE
+from .engine import ENGINE
+from .seen import SEEN
+from .metrics import METRICS
+from .archives import ARCHIVE
+from .resilience import RESILIENCE, is_failure
+from .checkpoints import CHECKPOINTS
+from .exporters import get_export_path, write_records
+from .constants import MercadoLibreConfig as MLC, SyncConfig as Sync
+from .constants import SITE_IDS, BRAND_IDS
+
+
+def _handle_exception(url, exception):
     """
     Exception handler callback function
     """
@@ -51,26 +59,95 @@ def _print_response_success(response, index, expected_code, verbose):
         print(f'{"*" * 70}\n')
 
 
-def scrap_request(endpoints, params_dict = {}, verbose = False):
+def _get_cache_ttl(url):
+    """
+    Returns the seconds a response of the URL can be served from the cache
+    without revalidation, or 0 if the URL's endpoint is not cached
+
+    Multiget items URLs are not cached: their ids depend on the order of the
+    search results, which changes from one run to another, so the same
+    combination of ids is seldom requested again
+    """
+    if not url.startswith(f'{MLC.BASE_URL.value}/items'):
+        return 0
+
+    endpoint = _get_mercadolibre_endpoint(url)
+
+    if endpoint == 'items':
+        return 0
+    elif endpoint == 'description':
+        return MLC.DESC_CACHE_TTL.value
+
+    return MLC.ITEMS_CACHE_TTL.value
+
+
+def _get_mercadolibre_endpoint(url):
+    """
+    Returns the name of the MercadoLibre endpoint of a URL (search, items,
+    item or description), used to label its metrics
+    """
+    path = url.split('?')[0].rstrip('/')
+
+    if path.endswith('/search'):
+        return 'search'
+    elif path.endswith('/description'):
+        return 'description'
+    elif path.endswith('/items'):
+        return 'items'
+
+    return 'item'
+
+
+async def _fetch(method, url, **kwargs):
+    """
+    Sends a request through the resilience policy, and records it in the fetch
+    metrics of its endpoint. Failed responses count as errors
+    """
+    with METRICS.track('fetch', MLC.METRICS_SITE.value,
+                       _get_mercadolibre_endpoint(url)) as outcome:
+        response = await RESILIENCE.fetch(method, url, **kwargs)
+        outcome['ok'] = not is_failure(response)
+
+        return response
+
+
+async def scrap_request_async(endpoints, params_dict = {}, verbose = False,
+                              size = None):
     """
     Attempts to send a GET request with for the specified list of endpoints for
-    scraping
+    scraping, awaiting all of them concurrently
     
     The params_dict parameter is a dictionary of URL parameters to replace with
     values. The verbose flag enables showing the whole response contents (json)
+    The size parameter bounds how many of the requests are in flight at the
+    same time (the engine's concurrency if None)
+
+    Responses of cached endpoints are served from the response cache while they
+    are fresh, and revalidated with conditional requests afterwards
+
+    Requests go through the resilience policy: failed ones are retried with
+    backoff, and hosts that keep failing are paused by their circuit breaker
+
+    When the response archive is capturing, every response is appended to it;
+    when it is replaying, the responses are read from it instead of being
+    requested (those that were not archived are None)
 
     This method returns a list of response objects
     """
-    pending_requests = []
+    parsed_endpoints = [parse_endpoint(endpoint, params_dict)
+                        for endpoint in endpoints]
 
-    for endpoint in endpoints:
-        parsed_endpoint = parse_endpoint(endpoint, params_dict)
-
-        pending_requests.append(grequests.get(parsed_endpoint,
-                                              headers = HEADERS))
+    if ARCHIVE.replaying:
+        responses = [ARCHIVE.get_response(endpoint)
+                     for endpoint in parsed_endpoints]
+    else:
+        responses = await _fetch_responses(parsed_endpoints, size)
 
-    responses = grequests.map(pending_requests,
-                              exception_handler = _handle_exception)
+    if ARCHIVE.capturing:
+        for endpoint, response in zip(parsed_endpoints, responses):
+            if response is not None:
+                ARCHIVE.add_response(endpoint, response,
+                                     MLC.ARCHIVE_SOURCE.value)
 
     for i, response in enumerate(responses):
         if response != None:
@@ -79,28 +156,88 @@ def scrap_request(endpoints, params_dict = {}, verbose = False):
     return responses
 
 
-def store_request(page_list, endpoint, verbose):
+async def _fetch_responses(parsed_endpoints, size):
+    """
+    Obtains the responses of the endpoints, either from the response cache or
+    through the network. The endpoints revalidated with a 304 response after
+    their cache entry was evicted are requested again, unconditionally
+    """
+    ttls = [_get_cache_ttl(endpoint) for endpoint in parsed_endpoints]
+
+    responses = [CACHE.get_fresh(endpoint, ttl) if ttl else None
+                 for endpoint, ttl in zip(parsed_endpoints, ttls)]
+    pending = [i for i, response in enumerate(responses) if response is None]
+
+    pending_endpoints = [parsed_endpoints[i] for i in pending]
+    conditional_headers = [CACHE.get_conditional_headers(parsed_endpoints[i])
+                           if ttls[i] else None for i in pending]
+
+    fetched = await ENGINE.fetch_all('GET', pending_endpoints,
+                                     headers = conditional_headers,
+                                     size = size,
+                                     exception_handler = _handle_exception,
+                                     fetch = _fetch)
+
+    for i, response in zip(pending, fetched):
+        responses[i] = CACHE.update(parsed_endpoints[i], response) if ttls[i] \
+                       else response
+
+    evicted = [i for i, response in zip(pending, fetched)
+               if response is not None and response.status_code == 304
+               and responses[i] is None]
+
+    if evicted:
+        refetched = await ENGINE.fetch_all('GET', [parsed_endpoints[i]
+                                                   for i in evicted],
+                                           size = size,
+                                           exception_handler = \
+                                               _handle_exception,
+                                           fetch = _fetch)
+
+        for i, response in zip(evicted, refetched):
+            responses[i] = CACHE.update(parsed_endpoints[i], response)
+
+    return responses
+
+
+def scrap_request(endpoints, params_dict = {}, verbose = False, size = None):
+    """
+    Synchronous version of scrap_request_async
+
+    This method returns a list of response objects
+    """
+    return asyncio.run(scrap_request_async(endpoints, params_dict, verbose,
+                                           size))
+
+
+async def store_request_async(page_list, endpoint, verbose):
     """
     Attempts to send multiple asynchronous POST requests to the specified
     endpoint, one for each element of the page list
     """
-    pending_requests = []
-
-    for page_data in page_list:
-        pending_requests.append(grequests.post(endpoint, data = page_data,
-                                               headers = HEADERS))    
-    responses = grequests.map(pending_requests, 
-                              exception_handler = _handle_exception)
+    responses = await ENGINE.fetch_all('POST', [endpoint] * len(page_list),
+                                       data = page_list,
+                                       exception_handler = _handle_exception)
     
     for i, response in enumerate(responses):
         if response != None:
             _print_response_success(response, i, 201, verbose)
 
 
-def _get_all_mercadolibre_urls(product_index_url, limit):
+def store_request(page_list, endpoint, verbose):
+    """
+    Synchronous version of store_request_async
+    """
+    asyncio.run(store_request_async(page_list, endpoint, verbose))
+
+
+def _get_all_mercadolibre_urls(product_index_url, limit, total = None):
     """
     Generates a list of MercadoLibre product URLs for scraping (according to
     item offsets within a specified limit)
+
+    If the total number of results of the query is known, only the offsets that
+    hold results are generated
     """
     urls = []
 
@@ -109,6 +246,9 @@ def _get_all_mercadolibre_urls(product_index_url, limit):
     if limit:
         N = MLC.MAX_OFFSET.value // limit + 1
 
+        if total is not None:
+            N = max(1, min(N, math.ceil(total / limit)))
+
     for coef in range(0, N):
         params = f'&offset={coef * limit}&limit={limit}'
         urls.append(f'{product_index_url}{params}')
@@ -116,91 +256,296 @@ def _get_all_mercadolibre_urls(product_index_url, limit):
     return urls
 
 
-def _scrap_mercadolibre_product_pages(product_responses, brand_id, verbose):
+def _get_mercadolibre_total(response):
+    """
+    Returns the total number of results reported by a search page response, or
+    None if it can't be read from it
+    """
+    try:
+        return response.json()['paging']['total']
+    except Exception:
+        return None
+
+
+def _get_mercadolibre_brand(url):
+    """
+    Returns the brand id of the products of a MercadoLibre search URL
+    """
+    return BRAND_IDS['playstation'] if 'ps4' in url \
+           else BRAND_IDS['nintendo'] if 'nintendo' in url \
+               else BRAND_IDS['xbox'] if 'xbox' in url \
+                   else None
+
+
+def _chunk(collection, size):
+    """
+    Splits a collection into consecutive lists of at most size elements
+    """
+    return [collection[i:i + size] for i in range(0, len(collection), size)]
+
+
+async def _scrap_mercadolibre_images(product_ids, verbose):
+    """
+    Retrieves the main picture URL of each of the specified products through
+    MercadoLibre's multiget items endpoint, up to MULTIGET_SIZE ids per request
+
+    Returns a dictionary that maps every resolved product id to its image URL
+    """
+    chunks = _chunk(product_ids, MLC.MULTIGET_SIZE.value)
+    endpoints = [parse_endpoint(MLC.MULTIGET_URL.value,
+                                { MLC.PRODUCT_IDS_PARAM.value: ','.join(ids) })
+                 for ids in chunks]
+
+    responses = await scrap_request_async(endpoints, verbose = verbose,
+                                          size = MLC.MAX_CONCURRENCY.value)
+
+    images = {}
+
+    for ids, response in zip(chunks, responses):
+        if response:
+            try:
+                items = response.json()
+            except Exception:
+                continue
+
+            # The multiget results come in the same order as the requested ids
+            for product_id, item in zip(ids, items):
+                try:
+                    if item['code'] == 200:
+                        pictures = item['body']['pictures']
+                        images[product_id] = pictures[0]['secure_url']
+                except Exception:
+                    pass
+
+    return images
+
+
+async def _scrap_mercadolibre_descriptions(product_ids, verbose):
+    """
+    Retrieves the plain text description of each of the specified products.
+    The requests are sent concurrently, at most MAX_CONCURRENCY at a time
+
+    Returns a dictionary that maps every resolved product id to its description
+    """
+    endpoints = [parse_endpoint(MLC.DESC_URL.value,
+                                { MLC.PRODUCT_ID_PARAM.value: product_id })
+                 for product_id in product_ids]
+
+    responses = await scrap_request_async(endpoints, verbose = verbose,
+                                          size = MLC.MAX_CONCURRENCY.value)
+
+    descriptions = {}
+
+    for product_id, response in zip(product_ids, responses):
+        if response:
+            try:
+                descriptions[product_id] = response.json()['plain_text']
+            except Exception:
+                pass
+
+    return descriptions
+
+
+async def _scrap_mercadolibre_product_pages(product_responses, brand_id,
+                                            verbose):
+    """
+    Scraps MercadoLibre's product pages from the passed responses, and returns
+    a generator of their records
+
+    The item ids of all the pages are collected first, so that their pictures
+    and descriptions are resolved in batches instead of one item at a time.
+    Both batches are awaited at the same time
+    """
+    products = []
+
+    with METRICS.track('parse', MLC.METRICS_SITE.value, 'search'):
+        for product_response in product_responses:
+            if product_response:
+                products.extend(product_response.json()['results'])
+            else:
+                print('No response obtained')
+
+    product_ids = [product['id'] for product in products]
+
+    images, descriptions = await asyncio.gather(
+        _scrap_mercadolibre_images(product_ids, verbose),
+        _scrap_mercadolibre_descriptions(product_ids, verbose)
+    )
+
+    return _build_mercadolibre_records(products, images, descriptions,
+                                       brand_id)
+
+
+def _build_mercadolibre_records(products, images, descriptions, brand_id):
+    """
+    Generator that yields the export record of each product, one at a time. A
+    product whose description could not be obtained gets an empty one, and one
+    without a picture falls back to the search result's thumbnail. The fields
+    that hold such placeholders are listed in the record's placeholders field,
+    so that the delta synchronization doesn't send them as changes
+    """
+    for product in products:
+        description = descriptions.get(product['id'], '')
+        image = images.get(product['id'], product.get('thumbnail', ''))
+        placeholders = [field for field, resolved
+                        in (('description', product['id'] in descriptions),
+                            ('image', product['id'] in images))
+                        if not resolved]
+
+        record = {
+            'id_ecommerce': SITE_IDS['MercadoLibre'],
+            'id_type_product': brand_id,
+            'name': product['title'],
+            'description': description,
+            'price': product['price'],
+            'image': image,
+            'url': product['permalink']
+        }
+
+        if placeholders:
+            record[Sync.PLACEHOLDERS_FIELD.value] = placeholders
+
+        yield record
+
+
+def _record_mercadolibre_prices(records):
+    """
+    Generator that records every record in the seen store as it is exported,
+    so that the change history of MercadoLibre's prices is kept as well. The
+    records rebuilt from the archive are not recorded
+    """
+    for record in records:
+        if not ARCHIVE.replaying:
+            SEEN.record(record['url'], record,
+                        source = MLC.SEEN_SOURCE.value)
+
+        yield record
+
+
+def _find_mercadolibre_placeholders(records, incomplete):
     """
-    Scraps MercadoLibre's product pages from the passed responses
+    Generator that passes the records on, appending the URL of the ones that
+    hold placeholders to the incomplete list
     """
-    records = []
-        
-    for i, product_response in enumerate(product_responses):
-        if product_response:
-            products = product_response.json()['results']
+    for record in records:
+        if Sync.PLACEHOLDERS_FIELD.value in record:
+            incomplete.append(record['url'])
+
+        yield record
 
-            for product in products:
-                params = { MLC.PRODUCT_ID_PARAM.value: product['id'] }
 
-                description_responses = scrap_request([MLC.DESC_URL.value],
-                                                        params, verbose)
+async def _export_mercadolibre_page(index, url, response, N, verbose):
+    """
+    Scraps the products of a search page response and writes them to the
+    page's export file. The page is checkpointed once it is exported, unless
+    the search page itself could not be obtained or any of its products holds
+    placeholders (so that a resumed run scraps it again)
+    """
+    brand = _get_mercadolibre_brand(url)
+    records = await _scrap_mercadolibre_product_pages([response], brand,
+                                                      verbose)
+    incomplete = []
+
+    with METRICS.track('export', MLC.METRICS_SITE.value):
+        count = write_records(get_export_path(MLC.EXPORT_FILE_PATH.value,
+                                              index),
+                              _record_mercadolibre_prices(
+                                  _find_mercadolibre_placeholders(
+                                      records, incomplete)))
 
-                time.sleep(MLC.DELAY_IN_SECS.value)
+    METRICS.count_items(MLC.METRICS_SITE.value, count)
 
-                img_responses = scrap_request([MLC.DETAIL_URL.value], params,
-                                                verbose)
+    if incomplete:
+        print(f'Page {index + 1} of {N} is not checkpointed: '
+              f'{len(incomplete)} of its products hold placeholders')
+    elif response:
+        CHECKPOINTS.complete(MLC.CHECKPOINT_RUN.value, index, url)
 
-                time.sleep(MLC.DELAY_IN_SECS.value)
+    print(f'Scraped page {index + 1} of {N}')
 
-                description = ""
-                if description_responses:
-                    try:
-                        description = description_responses[0].json()['plain_text']
-                    except Exception:
-                        description = "{PROBLEM OBTAINING THIS ITEM'S DESCRIPTION}"
 
-                image = ""
-                if img_responses:
-                    try:
-                        image = img_responses[0].json()['pictures'][0]['secure_url']
-                    except Exception:
-                        image = "{PROBLEM OBTAINING THIS ITEM'S IMAGE URL}"
+def _is_completed(index, url, completed):
+    """
+    Indicates whether a page was exported by the run being resumed: it must be
+    checkpointed with the same URL, and its export file must still exist
+    """
+    return completed.get(index) == url and \
+           os.path.exists(get_export_path(MLC.EXPORT_FILE_PATH.value, index))
 
-                records.append({
-                    'id_ecommerce': SITE_IDS['MercadoLibre'],
-                    'id_type_product': brand_id,
-                    'name': product['title'],
-                    'description': description,
-                    'price': product['price'],
-                    'image': image,
-                    'url': product['permalink']
-                })
 
-                time.sleep(MLC.DELAY_IN_SECS.value)
-        else:
-            print('No response obtained')
-    return records
+async def _scrap_mercadolibre_page(index, url, N, semaphore, verbose):
+    """
+    Fetches a search page and exports its products, with at most as many pages
+    in progress as the semaphore allows
+    """
+    async with semaphore:
+        responses = await scrap_request_async([url], verbose = verbose)
+        await _export_mercadolibre_page(index, url, responses[0], N, verbose)
 
 
-def scrap_mercadolibre(limit = MLC.LIMIT.value, verbose = False):
+async def scrap_mercadolibre_async(limit = MLC.LIMIT.value, verbose = False,
+                                   resume = False):
     """
     Consumes MercadoLibre's API to perform scraping of products
     The limit value establishes the maximum offset for pagination
-    """ 
+
+    The first page of each query is requested first, and the total number of
+    results it reports decides how many more pages are requested. Those are
+    then fetched concurrently, and each page's export file is written as soon
+    as the page arrives. If the first page of a query could not be obtained
+    (even after its retries), the query's remaining pages are skipped, since
+    it's unknown which offsets hold results
+
+    Every exported page is checkpointed, unless some of its products hold
+    placeholders. If resume is set, the pages checkpointed by the previous run
+    are skipped; otherwise the run starts over
+    """
+    if not resume:
+        CHECKPOINTS.clear(MLC.CHECKPOINT_RUN.value)
+
+    completed = CHECKPOINTS.get_completed(MLC.CHECKPOINT_RUN.value)
+    first_urls = [_get_all_mercadolibre_urls(product_url, limit)[0]
+                  for product_url in MLC.PRODUCT_URLS.value]
+    first_responses = await scrap_request_async(first_urls, verbose = verbose)
+
     pages_urls = []
-    
-    for product_url in MLC.PRODUCT_URLS.value:
-        pages_urls.extend(_get_all_mercadolibre_urls(product_url, limit))
-    
-    N = len(pages_urls)
-
-    for i, url in enumerate(pages_urls):
-        product_responses = []
-        response = scrap_request([url], verbose = verbose)
-        product_responses.append(response[0])
-        time.sleep(MLC.DELAY_IN_SECS.value)
-
-        brand = BRAND_IDS['playstation'] if 'ps4' in url \
-                else BRAND_IDS['nintendo'] if 'nintendo' in url \
-                    else BRAND_IDS['xbox'] if 'xbox' in url \
-                        else None
-
-        records = _scrap_mercadolibre_product_pages(product_responses, brand,
-                                                    verbose)
-        index = f'{i}'.zfill(3)
-        file_name = MLC.EXPORT_FILE_PATH.value.replace('.json',
-                                                        f'{index}.json')
-
-        with open(file_name, 'w', encoding = 'utf-8') as export_file:
-            json.dump(records, export_file, ensure_ascii = False)
-        
-        print(f'Scraped page {i + 1} of {N}')
-
-    return N
\ No newline at end of file
+
+    for product_url, response in zip(MLC.PRODUCT_URLS.value, first_responses):
+        total = _get_mercadolibre_total(response)
+
+        if total is None:
+            print(f'The total number of results of {product_url} is unknown, '
+                  'so its remaining pages are skipped')
+            continue
+
+        pages_urls.extend(_get_all_mercadolibre_urls(product_url, limit,
+                                                     total)[1:])
+
+    N = len(first_urls) + len(pages_urls)
+    semaphore = asyncio.Semaphore(MLC.MAX_CONCURRENT_PAGES.value)
+
+    tasks = [_export_mercadolibre_page(i, url, response, N, verbose)
+             for i, (url, response) in enumerate(zip(first_urls,
+                                                     first_responses))
+             if not _is_completed(i, url, completed)]
+    tasks.extend([_scrap_mercadolibre_page(i, url, N, semaphore, verbose)
+                  for i, url in enumerate(pages_urls, len(first_urls))
+                  if not _is_completed(i, url, completed)])
+
+    if len(tasks) < N:
+        print(f'Resuming the previous run: {N - len(tasks)} of {N} pages were '
+              'already exported')
+
+    await asyncio.gather(*tasks)
+    SEEN.commit()
+
+    return N
+
+
+def scrap_mercadolibre(limit = MLC.LIMIT.value, verbose = False,
+                       resume = False):
+    """
+    Synchronous version of scrap_mercadolibre_async. Returns the number of
+    exported pages
+    """
+    return asyncio.run(scrap_mercadolibre_async(limit, verbose, resume))
@@ -0,0 +1,206 @@
+"""
+This module contains the response archive: an append-only record of the raw
+responses obtained by the spiders and the API consuming functions, so that the
+exports can be rebuilt by parsing them again (after fixing an extraction rule,
+for instance) without any network access
+"""
+import os
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from .cache import build_response
+from .constants import ArchiveConfig as Archive
+
+
+CAPTURE = 'capture'
+REPLAY = 'replay'
+
+
+def get_archive_key(method, url, body = b'', rendered = False):
+    """
+    Returns the index key of a request: its method and URL, plus the hash of
+    its body (for the requests that post a form) and whether it was rendered by
+    a browser
+    """
+    key = f'{method} {url}'
+
+    if body:
+        key = f'{key} {hashlib.sha1(body).hexdigest()}'
+
+    if rendered:
+        key = f'{key} browser'
+
+    return key
+
+
+class ResponseArchive:
+    """
+    Append-only archive of raw responses. Every body is appended to a single
+    file as an independent gzip member (so the file is a valid gzip file too),
+    and an sqlite index maps the key of every request to the offset and size of
+    its latest body, together with its URL, status, headers and metadata
+
+    The archive is idle until it is started either in capture mode, where the
+    responses are added to it, or in replay mode, where they are read from it
+    """
+
+    def __init__(self, path, index_path):
+        """
+        Constructor that sets the paths of the archive's body file and index
+        """
+        self.path = path
+        self.index_path = index_path
+        self.mode = None
+        self.body_file = None
+        self.connection = None
+        self.lock = threading.Lock()
+        self.stats = { 'captured': 0, 'replayed': 0, 'missing': 0 }
+
+
+    def start(self, mode):
+        """
+        Opens the archive in capture or replay mode. Starting it again in the
+        same mode does nothing
+        """
+        with self.lock:
+            if self.mode == mode:
+                return
+
+            if self.mode:
+                raise ValueError(f'The archive is already open in {self.mode} '
+                                 'mode')
+
+            directory = os.path.dirname(self.path)
+
+            if directory:
+                os.makedirs(directory, exist_ok = True)
+
+            self.connection = sqlite3.connect(self.index_path,
+                                              check_same_thread = False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                    'key TEXT PRIMARY KEY, url TEXT, '
+                                    'source TEXT, status INTEGER, '
+                                    'headers TEXT, meta TEXT, offset INTEGER, '
+                                    'size INTEGER, archived_at REAL)')
+            self.connection.commit()
+            self.body_file = open(self.path, 'ab' if mode == CAPTURE else 'rb')
+            self.mode = mode
+
+
+    @property
+    def capturing(self):
+        """
+        Indicates whether the responses must be added to the archive
+        """
+        return self.mode == CAPTURE
+
+
+    @property
+    def replaying(self):
+        """
+        Indicates whether the responses must be read from the archive
+        """
+        return self.mode == REPLAY
+
+
+    def add(self, keys, url, status, headers, body, source, meta = None):
+        """
+        Appends a response to the archive, and indexes it under every one of
+        the keys (replacing the responses indexed for them, if any). The source
+        is the spider or API the response belongs to, and meta holds any (json)
+        data the response's callback needs besides the response itself
+        """
+        data = gzip.compress(body)
+
+        with self.lock:
+            self.body_file.seek(0, os.SEEK_END)
+            offset = self.body_file.tell()
+            self.body_file.write(data)
+            self.body_file.flush()
+            self.connection.executemany('REPLACE INTO responses VALUES '
+                                        '(?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                        [(key, url, source, status,
+                                          json.dumps(headers),
+                                          json.dumps(meta or {}), offset,
+                                          len(data), time.time())
+                                         for key in keys])
+            self.connection.commit()
+            self.stats['captured'] += 1
+
+
+    def get(self, key):
+        """
+        Returns the latest response archived for the key as a dictionary with
+        its url, status, headers, body and meta, or None if there is none
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT url, status, headers, meta, '
+                                          'offset, size FROM responses WHERE '
+                                          'key = ?', (key,)).fetchone()
+
+            if not row:
+                self.stats['missing'] += 1
+                return None
+
+            self.body_file.seek(row[4])
+            data = self.body_file.read(row[5])
+            self.stats['replayed'] += 1
+
+        return { 'url': row[0], 'status': row[1],
+                 'headers': json.loads(row[2]), 'body': gzip.decompress(data),
+                 'meta': json.loads(row[3]) }
+
+
+    def add_response(self, url, response, source):
+        """
+        Appends a requests Response obtained by a GET request to the URL
+        """
+        self.add([get_archive_key('GET', url)], url, response.status_code,
+                 dict(response.headers), response.content, source)
+
+
+    def get_response(self, url):
+        """
+        Returns the archived response of a GET request to the URL as a requests
+        Response, or None if it was not archived
+        """
+        entry = self.get(get_archive_key('GET', url))
+
+        if not entry:
+            return None
+
+        return build_response(entry['url'], entry['status'], entry['body'],
+                              entry['headers'])
+
+
+    def close(self):
+        """
+        Closes the archive's files, leaving it idle
+        """
+        with self.lock:
+            if not self.mode:
+                return
+
+            self.body_file.close()
+            self.connection.close()
+            self.mode = None
+
+
+    def print_report(self):
+        """
+        Prints the archive's counters
+        """
+        with self.lock:
+            stats = dict(self.stats)
+
+        print(f'\n{"*" * 70}')
+        print('Response archive report\n')
+        print(f'{stats["captured"]} responses captured, {stats["replayed"]} '
+              f'replayed and {stats["missing"]} missing from {self.path}')
+        print(f'{"*" * 70}\n')
+
+
+ARCHIVE = ResponseArchive(Archive.PATH.value, Archive.INDEX_PATH.value)
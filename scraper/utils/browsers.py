@@ -0,0 +1,125 @@
+"""
+This module contains the pool of headless Chrome drivers used to render the
+pages of the sites that need a browser. Drivers are created on demand, up to
+the pool's size, and are shared by the worker threads that render the pages
+"""
+import queue
+import threading
+from selenium import webdriver
+from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.chrome.options import Options
+from .constants import BrowserConfig as Browser
+
+
+def create_driver():
+    """
+    Starts a headless Chrome driver
+    """
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    driver = webdriver.Chrome(ChromeDriverManager().install(),
+                              chrome_options = chrome_options)
+    driver.set_page_load_timeout(Browser.PAGE_LOAD_TIMEOUT.value)
+
+    return driver
+
+
+class DriverPool:
+    """
+    Thread-safe pool of at most size drivers. The factory function creates a
+    new driver when all of the existing ones are busy
+    """
+
+    def __init__(self, size, factory = create_driver):
+        """
+        Constructor that initializes an empty pool
+        """
+        self.size = size
+        self.factory = factory
+        self.drivers = []
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+
+
+    def _create(self):
+        """
+        Creates a new driver if the pool is not full yet, otherwise returns None
+        """
+        with self.lock:
+            if len(self.drivers) >= self.size:
+                return None
+
+            self.drivers.append(None)
+
+        try:
+            driver = self.factory()
+        except Exception:
+            with self.lock:
+                self.drivers.remove(None)
+            raise
+
+        with self.lock:
+            self.drivers[self.drivers.index(None)] = driver
+
+        return driver
+
+
+    def acquire(self):
+        """
+        Returns an idle driver, creating one if the pool is not full yet, or
+        waits until another thread releases one
+        """
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            driver = self._create()
+
+            if driver:
+                return driver
+
+            # A discarded driver frees a place without being released, so the
+            # wait is bounded to check whether a new driver can be created
+            try:
+                return self.idle.get(timeout = 1)
+            except queue.Empty:
+                pass
+
+
+    def release(self, driver):
+        """
+        Gives back a driver to the pool
+        """
+        self.idle.put(driver)
+
+
+    def discard(self, driver):
+        """
+        Quits a driver that stopped working and removes it from the pool, so
+        that a new one can take its place
+        """
+        with self.lock:
+            self.drivers.remove(driver)
+
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+    def close(self):
+        """
+        Quits every driver of the pool
+        """
+        with self.lock:
+            drivers = [driver for driver in self.drivers if driver]
+            self.drivers = []
+            self.idle = queue.Queue()
+
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
@@ -0,0 +1,195 @@
+"""
+This module contains the persistent HTTP response cache used by the API
+consuming functions. Responses are stored on disk (in a sqlite database) keyed
+by URL together with their ETag and Last-Modified validators, so that stale
+entries can be revalidated with conditional requests
+"""
+import time
+from .stores import SQLiteStore
+from .engine import build_response
+from .constants import CacheConfig
+
+
+class ResponseCache(SQLiteStore):
+    """
+    Size-bounded, least recently used on-disk cache of GET responses
+
+    It counts fresh hits (served without a request), revalidations (served
+    after a 304 response), misses and evictions, as well as the bytes that were
+    not downloaded thanks to the cache
+    """
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, '
+              'etag TEXT, last_modified TEXT, body BLOB, size INTEGER, '
+              'stored_at REAL, accessed_at REAL)')
+
+    def __init__(self, path, max_size):
+        """
+        Constructor that sets the path of the cache database, which is opened
+        (or created) the first time it is used. The max_size is the maximum
+        total size of the bodies in bytes
+        """
+        super().__init__(path)
+        self.max_size = max_size
+        self.stats = { 'hits': 0, 'revalidations': 0, 'misses': 0,
+                       'evictions': 0, 'bytes_saved': 0 }
+
+
+    def _get_entry(self, url):
+        """
+        Returns the stored (etag, last_modified, body, stored_at) row of the
+        URL, or None if it is not cached
+        """
+        return self.connection.execute('SELECT etag, last_modified, body, '
+                                       'stored_at FROM responses WHERE url = ?',
+                                       (url,)).fetchone()
+
+
+    def _touch(self, url, refresh = False):
+        """
+        Marks the URL's entry as recently used. If refresh is set, the entry is
+        also considered as freshly stored
+        """
+        now = time.time()
+
+        if refresh:
+            self.connection.execute('UPDATE responses SET accessed_at = ?, '
+                                    'stored_at = ? WHERE url = ?',
+                                    (now, now, url))
+        else:
+            self.connection.execute('UPDATE responses SET accessed_at = ? '
+                                    'WHERE url = ?', (now, url))
+
+        self.connection.commit()
+
+
+    def get_fresh(self, url, ttl):
+        """
+        Returns the cached response of the URL if it was stored (or revalidated)
+        less than ttl seconds ago, otherwise returns None
+        """
+        with self.lock:
+            entry = self._get_entry(url)
+
+            if not entry or time.time() - entry[3] >= ttl:
+                return None
+
+            self._touch(url)
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += len(entry[2])
+
+        return build_response(url, 200, entry[2])
+
+
+    def get_conditional_headers(self, url):
+        """
+        Returns the If-None-Match and If-Modified-Since headers needed to
+        revalidate the URL's cached response (empty if it is not cached)
+        """
+        with self.lock:
+            entry = self._get_entry(url)
+
+        headers = {}
+
+        if entry and entry[0]:
+            headers['If-None-Match'] = entry[0]
+        if entry and entry[1]:
+            headers['If-Modified-Since'] = entry[1]
+
+        return headers
+
+
+    def update(self, url, response):
+        """
+        Updates the cache with the response obtained for the URL, and returns
+        the response the caller should use: for a 304 response it is the cached
+        one, for a 200 response it is stored and returned as is
+
+        A 304 response whose entry was evicted since the request was sent has
+        no body to serve, so None is returned for it: the URL must be requested
+        again without the conditional headers
+        """
+        if response is None:
+            return None
+
+        if response.status_code == 304:
+            with self.lock:
+                entry = self._get_entry(url)
+
+                if not entry:
+                    return None
+
+                self._touch(url, True)
+                self.stats['revalidations'] += 1
+                self.stats['bytes_saved'] += len(entry[2])
+
+            return build_response(url, 200, entry[2], response.headers)
+
+        if response.status_code == 200:
+            self._store(url, response)
+
+        return response
+
+
+    def _store(self, url, response):
+        """
+        Stores a response for the URL, and evicts the least recently used
+        entries until the cache fits in its maximum size
+        """
+        body = response.content
+        now = time.time()
+
+        with self.lock:
+            self.stats['misses'] += 1
+            self.connection.execute('REPLACE INTO responses VALUES '
+                                    '(?, ?, ?, ?, ?, ?, ?)',
+                                    (url, response.headers.get('ETag'),
+                                     response.headers.get('Last-Modified'),
+                                     body, len(body), now, now))
+
+            total = self.connection.execute('SELECT COALESCE(SUM(size), 0) '
+                                            'FROM responses').fetchone()[0]
+            rows = self.connection.execute('SELECT url, size FROM responses '
+                                           'ORDER BY accessed_at')
+
+            evicted = []
+
+            for evicted_url, size in rows:
+                if total <= self.max_size:
+                    break
+
+                evicted.append((evicted_url,))
+                total -= size
+
+            self.connection.executemany('DELETE FROM responses WHERE url = ?',
+                                        evicted)
+            self.connection.commit()
+            self.stats['evictions'] += len(evicted)
+
+
+    def report(self):
+        """
+        Returns a copy of the cache's counters
+        """
+        with self.lock:
+            return dict(self.stats)
+
+
+    def print_report(self):
+        """
+        Prints the cache's counters
+        """
+        stats = self.report()
+        requests_count = stats['hits'] + stats['revalidations'] + \
+                         stats['misses']
+
+        print(f'\n{"*" * 70}')
+        print('Response cache report\n')
+        print(f'{stats["hits"]} fresh hits, {stats["revalidations"]} '
+              f'revalidated (304), {stats["misses"]} misses out of '
+              f'{requests_count} cacheable requests')
+        print(f'{stats["evictions"]} evictions, '
+              f'{stats["bytes_saved"] / 1024:.1f} KiB not downloaded')
+        print(f'{"*" * 70}\n')
+
+
+CACHE = ResponseCache(CacheConfig.PATH.value, CacheConfig.MAX_SIZE.value)
@@ -0,0 +1,62 @@
+"""
+This module contains the checkpoint store of the resumable scrape runs. It
+keeps, in a sqlite database, the pages of each run that were completely
+exported, so that a run that was interrupted can be resumed without scraping
+them again
+"""
+import os
+import time
+from .stores import SQLiteStore
+from .constants import RunConfig as Run
+
+
+class CheckpointStore(SQLiteStore):
+    """
+    On-disk store of the pages completed by each run, keyed by the run's name
+    and the page's index. The page's URL is kept too, so that a page whose
+    index now points to another URL (because the number of results changed) is
+    not considered completed
+    """
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS pages (run TEXT, page INTEGER, '
+              'url TEXT, completed_at REAL, PRIMARY KEY (run, page))')
+
+    def get_completed(self, run):
+        """
+        Returns a dictionary with the URL of every completed page of the run,
+        keyed by the page's index
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT page, url FROM pages WHERE '
+                                           'run = ?', (run,)).fetchall()
+
+        return dict(rows)
+
+
+    def complete(self, run, page, url):
+        """
+        Records that the page of the run was completely exported
+        """
+        with self.lock:
+            self.connection.execute('REPLACE INTO pages VALUES (?, ?, ?, ?)',
+                                    (run, page, url, time.time()))
+            self.connection.commit()
+
+
+    def clear(self, run):
+        """
+        Forgets the completed pages of the run, so that it starts over
+        """
+        with self.lock:
+            self.connection.execute('DELETE FROM pages WHERE run = ?', (run,))
+            self.connection.commit()
+
+
+def get_job_dir(spider_name):
+    """
+    Returns the directory where scrapy persists the job state (pending
+    requests and seen URLs) of a spider
+    """
+    return os.path.join(Run.JOB_DIR.value, spider_name)
+
+
+CHECKPOINTS = CheckpointStore(Run.CHECKPOINT_PATH.value)
@@ -89,10 +89,13 @@ class MercadoLibreConfig(Enum):
     """
     This enum provides configuration constants for MercadoLibre scraping
     """
-    BASE_URL = 'https://api.mercadolibre.com'
+    # It can be replaced with a local stand-in of the API (see mockserver.py)
+    BASE_URL = os.environ.get('MERCADOLIBRE_API_URL',
+                              'https://api.mercadolibre.com')
     COUNTRY_ID = 'MCO'
     CATEGORY_ID = 'MCO1144'
     PRODUCT_ID_PARAM = '$PRODUCT_ID'
+    PRODUCT_IDS_PARAM = '$PRODUCT_IDS'
     BASE_SITE_URL = f'{BASE_URL}/sites/{COUNTRY_ID}'
     SEARCH_URL = f'{BASE_SITE_URL}/search'
     PRODUCT_URLS = [
@@ -102,6 +105,8 @@ class MercadoLibreConfig(Enum):
     ]
     DETAIL_URL = f'{BASE_URL}/items/{PRODUCT_ID_PARAM}'
     DESC_URL = f'{DETAIL_URL}/description'
+    MULTIGET_URL = (f'{BASE_URL}/items?ids={PRODUCT_IDS_PARAM}'
+                    '&attributes=id,pictures')
     TEST_XBOX_ID = 'MCO12347'
     TEST_PS4_ID = 'MCO12346'
     TEST_SWITCH_ID = 'MCO12345'
@@ -117,6 +122,11 @@ class MercadoLibreConfig(Enum):
         DETAIL_URL.replace(PRODUCT_ID_PARAM, TEST_PS4_ID),
         DETAIL_URL.replace(PRODUCT_ID_PARAM, TEST_XBOX_ID)
     ]
+    TEST_MULTIGET_URLS = [
+        MULTIGET_URL.replace(PRODUCT_IDS_PARAM, TEST_SWITCH_ID),
+        MULTIGET_URL.replace(PRODUCT_IDS_PARAM, TEST_PS4_ID),
+        MULTIGET_URL.replace(PRODUCT_IDS_PARAM, TEST_XBOX_ID)
+    ]
     TEST_PATH_RELATIVE = 'scraper/test/mercadolibre_mocks'
     TEST_PATH = f'{os.getcwd()}/{TEST_PATH_RELATIVE}'
     TEST_INDEX_FILES = [
@@ -145,10 +155,20 @@ class MercadoLibreConfig(Enum):
         'xbox_product.json'
     ]
     TEST_PRODUCTS = _get_test_products(TEST_PATH, SITE_IDS['MercadoLibre'])
-    EXPORT_FILE_PATH = 'export/ml_items.json'
-    DELAY_IN_SECS = 1
+    EXPORT_FILE_PATH = 'export/ml_items.jsonl'
+    REQUESTS_PER_SEC = 10
+    BURST = 20
     MAX_OFFSET = 1000
     LIMIT = 20
+    MULTIGET_SIZE = 20
+    MAX_CONCURRENCY = 10
+    MAX_CONCURRENT_PAGES = 10
+    ITEMS_CACHE_TTL = 6 * 60 * 60
+    DESC_CACHE_TTL = 24 * 60 * 60
+    CHECKPOINT_RUN = 'mercadolibre'
+    SEEN_SOURCE = 'mercadolibre'
+    METRICS_SITE = 'mercadolibre'
+    ARCHIVE_SOURCE = 'mercadolibre'
 
 
 class OLXConfig(Enum):
@@ -162,17 +182,28 @@ class OLXConfig(Enum):
         f'{BASE_URL}/q-switch'
     ]
     SPIDER_NAME = 'olxspider'
+    USE_BROWSER = False
+    API_URL = 'https://www.olx.com.co/api/relevance/v2/search'
+    ITEM_URL = 'https://www.olx.com.co/item'
+    CATEGORY_ID = 1022
+    PAGE_SIZE = 40
+    MAX_PAGES = 50
     DRIVER_TIMEOUT = 30
-    DELAY_IN_SECS = 3
+    REQUESTS_PER_SEC = 1 / 3
+    BURST = 1
+    MAX_CONCURRENCY = 1
+    SEEN_TTL = 24 * 60 * 60
+    RECRAWL_BUDGET = 200
     BTN_CLASS = 'btnLoadMore'
     ITEM_CLASS = 'itemBox'
-    EXPORT_FILE_PATH = 'export/olx_items.json'
+    EXPORT_FILE_PATH = 'export/olx_items.jsonl'
     RIGHT_SECT_CLASS = '_2wMiF'
     LEFT_SECT_CLASS = 'CBG3S'
     IMG_DIV_CLASS = 'slick-active'
     TEST_PATH = f'{os.getcwd()}/scraper/test/olx_mocks'
     TEST_FILES = ['olx_switch_mock.html', 'olx_playstation_mock.html',
                   'olx_xbox_mock.html']
+    TEST_LISTING_FILE = 'olx_listing_mock.json'
     TEST_PRODUCTS = _get_test_products(TEST_PATH, SITE_IDS['OLX'])
 
 
@@ -186,7 +217,13 @@ class ColombiaGamerConfig(Enum):
         'https://www.colombiagamer.com.co/productos/nintendo-switch?limit=24'
     ]
     SPIDER_NAME = 'cgamerspider'
-    EXPORT_FILE_PATH = 'export/cgamer_items.json'
+    EXPORT_FILE_PATH = 'export/cgamer_items.jsonl'
+    REQUESTS_PER_SEC = 4
+    BURST = 8
+    MAX_CONCURRENCY = 8
+    SEEN_TTL = 12 * 60 * 60
+    RECRAWL_BUDGET = 500
+    MAX_PAGES = 100
     ITEM_CLASS = 'product-container'
     IMG_CLASS = 'main-image'
     TITLE_CLASS = 'vm-product-title'
@@ -216,7 +253,13 @@ class GamePlanetConfig(Enum):
         f'{BASE_URL}{SW_RES}&plataforma=671&mode=grid',
     ]
     SPIDER_NAME = 'gameplspider'
-    EXPORT_FILE_PATH = 'export/gamepl_items.json'
+    DRIVER_TIMEOUT = 2
+    EXPORT_FILE_PATH = 'export/gamepl_items.jsonl'
+    REQUESTS_PER_SEC = 4
+    BURST = 8
+    MAX_CONCURRENCY = 8
+    SEEN_TTL = 12 * 60 * 60
+    RECRAWL_BUDGET = 500
     ITEM_CLASS = 'catalog-products-new'
     TITLE_CLASS = 'h1title'
     DESC_CLASS = 'std'
@@ -240,13 +283,21 @@ class MixUpConfig(Enum):
         f'{BASE_URL}?etq=GAMCON&etqP=GAM&bf='
     ]
     SPIDER_NAME = 'mixupspider'
-    EXPORT_FILE_PATH = 'export/mixup_items.json'
+    USE_BROWSER = False
+    MAX_PAGES = 100
+    EXPORT_FILE_PATH = 'export/mixup_items.jsonl'
+    REQUESTS_PER_SEC = 4
+    BURST = 8
+    MAX_CONCURRENCY = 8
+    SEEN_TTL = 12 * 60 * 60
+    RECRAWL_BUDGET = 500
     ITEM_CLASS_1 = 'item'
     ITEM_CLASS_2 = 'cover'
     TITLE_CLASS = 'megatitulo'
     DESC_CLASS = 'resenia'
     PRICE_CLASS = 'preciolista'
     IMAGE_ID = 'imgProd'
+    NEXT_ID = 'ctl00_container_linkPnts2Up'
     TEST_PATH = f'{os.getcwd()}/scraper/test/mixup_mocks'
     TEST_FILES = ['mixup_mock.html']
     TEST_PRODUCTS = _get_test_products(TEST_PATH, SITE_IDS['MixUp'])
@@ -262,7 +313,13 @@ class SearsConfig(Enum):
         'https://www.sears.com.mx/categoria/16663/nintendo/',
     ]
     SPIDER_NAME = 'searspider'
-    EXPORT_FILE_PATH = 'export/sears_items.json'
+    EXPORT_FILE_PATH = 'export/sears_items.jsonl'
+    REQUESTS_PER_SEC = 4
+    BURST = 8
+    MAX_CONCURRENCY = 8
+    SEEN_TTL = 12 * 60 * 60
+    RECRAWL_BUDGET = 500
+    MAX_PAGES = 100
     ITEM_CLASS = 'vistaRapida'
     LINK_CLASS = 'linkProducto'
     TITLE_CLASS = 'productMainContainer'
@@ -272,3 +329,146 @@ class SearsConfig(Enum):
     TEST_PATH = f'{os.getcwd()}/scraper/test/sears_mocks'
     TEST_FILES = ['sears_mock.html']
     TEST_PRODUCTS = _get_test_products(TEST_PATH, SITE_IDS['Sears'])
+
+
+class BackendConfig(Enum):
+    """
+    This enum provides configuration constants for the backend's database API
+    """
+    URL = BACKEND_URL
+    REQUESTS_PER_SEC = 5
+    BURST = 10
+    BATCH_SIZE = 100
+    BATCH_BYTES = 512 * 1024
+    MAX_IN_FLIGHT = 4
+    COMPRESS = True
+    MAX_RETRIES = 5
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 30
+    SPOOL_PATH = 'export/failed_batches.jsonl'
+
+
+class HTTPConfig(Enum):
+    """
+    This enum provides configuration constants for the HTTP fetch engine
+    """
+    MAX_CONCURRENCY = 100
+    POOL_SIZE = 8
+    TIMEOUT = 30
+    DNS_CACHE_TTL = 300
+
+
+class CacheConfig(Enum):
+    """
+    This enum provides configuration constants for the HTTP response cache
+    """
+    PATH = 'cache/responses.sqlite3'
+    MAX_SIZE = 256 * 1024 * 1024
+
+
+class SeenConfig(Enum):
+    """
+    This enum provides configuration constants for the store of the product
+    pages already fetched by the spiders (each site sets its own SEEN_TTL and
+    RECRAWL_BUDGET) and of their change history
+    """
+    PATH = 'cache/seen.sqlite3'
+    PRIOR_CHANGE_INTERVAL = 7 * 24 * 60 * 60
+    PRIORITY_LEVELS = 100
+    FLUSH_SIZE = 500
+
+
+class ArchiveConfig(Enum):
+    """
+    This enum provides configuration constants for the archive of raw
+    responses that the exports can be rebuilt from
+    """
+    PATH = 'archive/responses.gz'
+    INDEX_PATH = 'archive/index.sqlite3'
+
+
+class MetricsConfig(Enum):
+    """
+    This enum provides configuration constants for the metrics of the runs:
+    the file they are written to (every INTERVAL seconds), the address of
+    their HTTP endpoint and the upper bounds (in seconds) of the latency
+    histograms' buckets
+    """
+    PATH = 'metrics/scraper.prom'
+    INTERVAL = 5
+    HOST = '127.0.0.1'
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+               60)
+
+
+class ProfileConfig(Enum):
+    """
+    This enum provides configuration constants for the sampling profiler: the
+    seconds between samples, the directory the collapsed stacks are written
+    to, and the file path fragments that tell the stage of a sample. A sample
+    belongs to the first of the FRAME_STAGES any of its frames matches (so a
+    browser's HTTP calls are a browser wait, not a network one), or else to
+    the LEAF_STAGES its innermost frame matches (a thread blocked in I/O)
+    """
+    INTERVAL = 0.01
+    DIRECTORY = 'profile'
+    TOP_FUNCTIONS = 5
+    FRAME_STAGES = (
+        ('browser', ('/selenium/',)),
+        ('json', ('/json/',)),
+        ('xpath', ('/parsel/', '/lxml/', '/cssselect/', 'utils/selectors.py'))
+    )
+    LEAF_STAGES = (
+        ('network', ('/socket.py', '/ssl.py', '/selectors.py', '/urllib3/',
+                     'reactor.py', 'internet/tcp.py', 'utils/limiters.py')),
+        ('idle', ('/threading.py', '/queue.py', 'concurrent/futures/'))
+    )
+
+
+class ExportConfig(Enum):
+    """
+    This enum provides configuration constants for the export files
+    """
+    COMPRESS = False
+
+
+class ResilienceConfig(Enum):
+    """
+    This enum provides configuration constants for the requests' retries and
+    circuit breakers
+    """
+    MAX_RETRIES = 3
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 30
+    FAILURE_THRESHOLD = 5
+    COOLDOWN = 60
+
+
+class SyncConfig(Enum):
+    """
+    This enum provides configuration constants for the delta synchronization of
+    the scraped records with the backend's database
+    """
+    URL = f'{BACKEND_URL}/sync'
+    PATH = 'cache/fingerprints.sqlite3'
+    FIELDS = ('id_type_product', 'name', 'description', 'price', 'image')
+    PLACEHOLDERS_FIELD = 'placeholders'
+
+
+class RunConfig(Enum):
+    """
+    This enum provides configuration constants for running the sites'
+    scrapers, either at the same time or resuming an interrupted run
+    """
+    MAX_CONCURRENCY = 32
+    CHECKPOINT_PATH = 'cache/checkpoints.sqlite3'
+    JOB_DIR = 'cache/jobs'
+
+
+class BrowserConfig(Enum):
+    """
+    This enum provides configuration constants for the pool of headless
+    browsers that render the pages of the Selenium-backed spiders
+    """
+    POOL_SIZE = 4
+    PAGE_LOAD_TIMEOUT = 30
@@ -0,0 +1,190 @@
+"""
+This module contains the asyncio HTTP fetch engine used by the API consuming
+functions. It runs its own event loop in a background thread, where an aiohttp
+client session per host keeps a pool of at most HTTPConfig.POOL_SIZE keep-alive
+connections (resolving the host through a TTL DNS cache). The requests awaited
+from any thread or event loop are sent on that loop, so they don't hold a
+thread each: the requests beyond the pool's connections wait for a free one,
+and the callers bound how many of them are in flight
+
+Responses are returned as requests' Response objects, with their body already
+read, and the client errors are raised as requests' exceptions, so that the
+callers, the response cache and the archive don't depend on the client
+"""
+import time
+import atexit
+import asyncio
+import aiohttp
+import requests
+import datetime
+import threading
+from .limiters import LIMITER, get_host
+from .constants import HEADERS, HTTPConfig as HTTP
+
+
+def build_response(url, status_code, body, headers = {}, method = 'GET',
+                   elapsed = 0):
+    """
+    Builds a requests Response object for a body, so that callers can't tell
+    apart the ones obtained through the network from the cached or archived
+    ones
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response.encoding = 'utf-8'
+    response.url = url
+    response.request = requests.Request(method, url).prepare()
+    response.elapsed = datetime.timedelta(seconds = elapsed)
+
+    return response
+
+
+class FetchEngine:
+    """
+    asyncio fetch engine with a pooled aiohttp client session per host. Every
+    request waits for the shared per-host rate limiter before being sent, and
+    at most concurrency requests are scheduled at the same time by fetch_all
+    """
+
+    def __init__(self, concurrency, pool_size, timeout, dns_cache_ttl):
+        """
+        Constructor that sets the engine's limits. The pool_size bounds the
+        keep-alive connections (sockets) opened to each host. The event loop
+        is started by the first request
+        """
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.sessions = {}
+        self.loop = None
+        self.lock = threading.Lock()
+
+
+    def _get_loop(self):
+        """
+        Returns the engine's event loop, starting its thread if needed
+        """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target = self.loop.run_forever,
+                                 name = 'FetchEngine', daemon = True).start()
+
+        return self.loop
+
+
+    def _get_session(self, url):
+        """
+        Returns the pooled client session of the URL's host, creating it if
+        needed. It only runs on the engine's loop
+        """
+        host = get_host(url)
+        session = self.sessions.get(host)
+
+        if not session:
+            connector = aiohttp.TCPConnector(limit = self.pool_size,
+                                             ttl_dns_cache = self.dns_cache_ttl)
+            session = aiohttp.ClientSession(connector = connector,
+                                            headers = HEADERS)
+            self.sessions[host] = session
+
+        return session
+
+
+    async def _send(self, method, url, data = None, headers = None,
+                    timeout = None):
+        """
+        Sends a request on the engine's loop, and returns its response once
+        its whole body was read
+        """
+        started = time.perf_counter()
+        client_timeout = aiohttp.ClientTimeout(total = timeout or self.timeout)
+
+        try:
+            async with self._get_session(url).request(
+                    method, url, data = data, headers = headers,
+                    timeout = client_timeout) as response:
+                body = await response.read()
+        except asyncio.TimeoutError as exception:
+            raise requests.Timeout(f'The request to {url} timed out') \
+                  from exception
+        except aiohttp.ClientError as exception:
+            raise requests.ConnectionError(f'The request to {url} failed: '
+                                           f'{exception}') from exception
+
+        return build_response(str(response.url), response.status, body,
+                              dict(response.headers), method,
+                              time.perf_counter() - started)
+
+
+    async def fetch(self, method, url, **kwargs):
+        """
+        Sends a request once the host's budget allows it, and returns its
+        response. The data, headers and timeout keyword arguments are passed
+        on to the client
+        """
+        wait = LIMITER.reserve(url)
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._send(method, url, **kwargs), self._get_loop())
+
+        return await asyncio.wrap_future(future)
+
+
+    async def fetch_all(self, method, urls, data = None, headers = None,
+                        size = None, exception_handler = None, fetch = None):
+        """
+        Sends a request for each URL with at most size of them (or the engine's
+        concurrency) in flight, and returns the responses in the same order.
+        The optional data and headers lists hold the body and the extra headers
+        of each request, and fetch replaces the coroutine function that sends
+        each one of them (the engine's fetch by default)
+
+        Failed requests are passed to the exception_handler callback with their
+        URL and exception, and their place in the results is None
+        """
+        semaphore = asyncio.Semaphore(size or self.concurrency)
+        fetch = fetch or self.fetch
+        bodies = data if data is not None else [None] * len(urls)
+        extra_headers = headers if headers is not None else [None] * len(urls)
+
+        async def bounded_fetch(url, body, request_headers):
+            async with semaphore:
+                try:
+                    return await fetch(method, url, data = body,
+                                       headers = request_headers)
+                except requests.RequestException as exception:
+                    if exception_handler:
+                        exception_handler(url, exception)
+                    return None
+
+        return await asyncio.gather(*[bounded_fetch(*request) for request
+                                      in zip(urls, bodies, extra_headers)])
+
+
+    def close(self):
+        """
+        Closes every pooled connection
+        """
+        if self.loop is None or not self.loop.is_running():
+            return
+
+        async def close_sessions():
+            sessions, self.sessions = self.sessions, {}
+
+            for session in sessions.values():
+                await session.close()
+
+        asyncio.run_coroutine_threadsafe(close_sessions(), self.loop).result()
+
+
+ENGINE = FetchEngine(HTTP.MAX_CONCURRENCY.value, HTTP.POOL_SIZE.value,
+                     HTTP.TIMEOUT.value, HTTP.DNS_CACHE_TTL.value)
+
+atexit.register(ENGINE.close)
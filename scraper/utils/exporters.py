@@ -0,0 +1,82 @@
+"""
+This module contains the functions that write and read the scraper's export
+files. Records are stored as JSON Lines (one json object per line), optionally
+gzip-compressed, so that they can be written and read one at a time
+"""
+import os
+import gzip
+import json
+from scrapy.extensions import feedexport
+from .constants import ExportConfig
+
+
+def get_export_path(path, index = None, compress = ExportConfig.COMPRESS.value):
+    """
+    Returns the path of an export file. If an index is specified, it is added
+    (zero-padded) before the extension, as in export/ml_items000.jsonl. The .gz
+    suffix is added when compression is enabled
+    """
+    if index is not None:
+        root, extension = os.path.splitext(path)
+        page_index = f'{index}'.zfill(3)
+        path = f'{root}{page_index}{extension}'
+
+    return f'{path}.gz' if compress else path
+
+
+def open_export_file(path, mode = 'r'):
+    """
+    Opens an export file in text mode, transparently (de)compressing it if its
+    name ends with .gz
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, f'{mode}t', encoding = 'utf-8')
+
+    return open(path, mode, encoding = 'utf-8')
+
+
+def write_records(path, records):
+    """
+    Writes the records (any iterable of dictionaries, such as a generator) to
+    the export file one line at a time, and returns the number of records
+    """
+    count = 0
+
+    with open_export_file(path, 'w') as export_file:
+        for record in records:
+            export_file.write(json.dumps(record, ensure_ascii = False))
+            export_file.write('\n')
+            count += 1
+
+    return count
+
+
+def read_records(paths):
+    """
+    Generator that yields the records of the export files one at a time, so
+    that they don't need to be loaded in memory at once
+    """
+    for path in paths:
+        with open_export_file(path) as export_file:
+            for line in export_file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class FileFeedStorage(feedexport.FileFeedStorage):
+    """
+    Scrapy feed storage for local files that gzip-compresses the feeds whose
+    path ends with .gz
+    """
+
+    def open(self, spider):
+        """
+        Opens the feed file, wrapping it with gzip if needed
+        """
+        feed_file = super().open(spider)
+
+        if not self.path.endswith('.gz'):
+            return feed_file
+
+        feed_file.close()
+        return gzip.open(self.path, feed_file.mode)
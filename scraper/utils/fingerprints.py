@@ -0,0 +1,163 @@
+"""
+This module contains the fingerprint store used for the delta synchronization
+with the backend's database. It keeps a content hash of every record sent,
+keyed by (id_ecommerce, url), so that each run only sends the records that are
+new, changed or that disappeared since the last synchronized run
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from .constants import SyncConfig
+
+
+def get_fingerprint(record, fields = SyncConfig.FIELDS.value):
+    """
+    Returns the content hash of the record's synchronized fields
+    """
+    content = json.dumps([record.get(field) for field in fields],
+                         ensure_ascii = False, default = str)
+
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class FingerprintStore:
+    """
+    On-disk (sqlite) store of the fingerprints of the records known by the
+    backend
+
+    The changes computed during a run are kept in memory, so that they only
+    become the new baseline once commit is called (that is, once they were sent
+    successfully), and so that several stores (such as the ones of spiders
+    crawling at the same time) can use the same database without locking it
+    """
+
+    def __init__(self, path, fields = SyncConfig.FIELDS.value):
+        """
+        Constructor that opens (or creates) the store's database at the
+        specified path
+        """
+        directory = os.path.dirname(path)
+
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        self.fields = fields
+        self.run_started = time.time()
+        self.ecommerce_ids = set()
+        self.seen = {}
+        self.removed = []
+        self.stats = { 'new': 0, 'changed': 0, 'unchanged': 0,
+                       'disappeared': 0 }
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS fingerprints ('
+                                'id_ecommerce INTEGER, url TEXT, '
+                                'fingerprint TEXT, seen_at REAL, '
+                                'PRIMARY KEY (id_ecommerce, url))')
+        self.connection.commit()
+
+
+    def diff(self, records):
+        """
+        Generator that yields the records (any iterable of dictionaries) that
+        are new or whose content changed, and marks all of them as seen in this
+        run
+
+        A known record with placeholder values (the fields listed in its
+        PLACEHOLDERS_FIELD, such as a description that could not be fetched)
+        is not yielded, and keeps its previous fingerprint, so that the values
+        the backend already has are not replaced by the placeholders. The
+        placeholders list itself is never sent
+        """
+        for record in records:
+            key = (record['id_ecommerce'], record['url'])
+            fingerprint = get_fingerprint(record, self.fields)
+            previous = self.seen.get(key)
+            placeholders = record.get(SyncConfig.PLACEHOLDERS_FIELD.value)
+
+            if previous is None:
+                entry = self.connection.execute('SELECT fingerprint FROM '
+                                                'fingerprints WHERE '
+                                                'id_ecommerce = ? AND url = ?',
+                                                key).fetchone()
+                previous = entry[0] if entry else None
+
+            self.ecommerce_ids.add(record['id_ecommerce'])
+
+            if previous is not None and placeholders:
+                self.seen[key] = previous
+                self.stats['unchanged'] += 1
+                continue
+
+            self.seen[key] = fingerprint
+
+            if previous is None:
+                self.stats['new'] += 1
+            elif previous != fingerprint:
+                self.stats['changed'] += 1
+            else:
+                self.stats['unchanged'] += 1
+                continue
+
+            if placeholders is not None:
+                record = { field: value for field, value in record.items()
+                           if field != SyncConfig.PLACEHOLDERS_FIELD.value }
+
+            yield record
+
+
+    def disappeared(self):
+        """
+        Generator that yields a deactivation record (with status False) for
+        each known record of the e-commerce sites seen in this run that was not
+        seen again, and forgets them. It must be consumed after diff
+        """
+        for id_ecommerce in sorted(self.ecommerce_ids):
+            keys = self.connection.execute('SELECT id_ecommerce, url FROM '
+                                           'fingerprints WHERE id_ecommerce '
+                                           '= ?', (id_ecommerce,))
+
+            for key in keys.fetchall():
+                if key in self.seen:
+                    continue
+
+                self.removed.append(key)
+                self.stats['disappeared'] += 1
+
+                yield { 'id_ecommerce': key[0], 'url': key[1],
+                        'status': False }
+
+
+    def commit(self):
+        """
+        Makes the fingerprints of this run the baseline of the next one
+        """
+        with self.connection:
+            self.connection.executemany('REPLACE INTO fingerprints VALUES '
+                                        '(?, ?, ?, ?)',
+                                        [(*key, fingerprint, self.run_started)
+                                         for key, fingerprint
+                                         in self.seen.items()])
+            self.connection.executemany('DELETE FROM fingerprints WHERE '
+                                        'id_ecommerce = ? AND url = ?',
+                                        self.removed)
+
+        self.seen = {}
+        self.removed = []
+
+
+    def rollback(self):
+        """
+        Discards the fingerprints of this run, so that the next run sends its
+        changes again
+        """
+        self.seen = {}
+        self.removed = []
+
+
+    def close(self):
+        """
+        Closes the store's database, discarding any uncommitted change
+        """
+        self.connection.close()
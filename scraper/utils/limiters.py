@@ -0,0 +1,188 @@
+"""
+This module contains the per-host token bucket rate limiter shared by all the
+outbound traffic of the scraper (API requests, backend requests and spiders)
+"""
+import time
+import threading
+import urllib.parse
+from .constants import MercadoLibreConfig as MLC, BackendConfig as Backend
+from .constants import OLXConfig as OLX, ColombiaGamerConfig as CGamer
+from .constants import GamePlanetConfig as GamePl, MixUpConfig as MU
+from .constants import SearsConfig as SEA
+
+
+def get_host(url):
+    """
+    Returns the host (network location) of the specified URL
+    """
+    return urllib.parse.urlsplit(url).netloc
+
+
+class TokenBucket:
+    """
+    Token bucket that refills at rate tokens per second and holds up to burst
+    tokens. Callers reserve a token and are told how long they have to wait for
+    it, so the bucket itself never blocks
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Constructor that initializes a full bucket
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def _refill(self):
+        """
+        Adds the tokens earned since the last refill. The lock must be held
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens +
+                          (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+
+    def reserve(self):
+        """
+        Takes a token from the bucket and returns the number of seconds the
+        caller has to wait before using it (0 if a token was available)
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+
+            if self.tokens >= 0:
+                return 0
+
+            return -self.tokens / self.rate
+
+
+    def take(self):
+        """
+        Takes a token from the bucket only if one is available, as a server
+        enforcing the budget would. Returns 0 if it was taken, otherwise the
+        number of seconds until there is one
+        """
+        with self.lock:
+            self._refill()
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Registry of token buckets, one for each configured host. Requests to hosts
+    without a configured budget are not limited
+
+    It also keeps track of how many requests went through each host and how
+    long the callers had to wait for them
+    """
+
+    def __init__(self, limits = {}):
+        """
+        Constructor that sets up a bucket for each host in the limits
+        dictionary, which maps hosts to (rate, burst) tuples
+        """
+        self.buckets = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+        for host, (rate, burst) in limits.items():
+            self.configure(host, rate, burst)
+
+
+    def configure(self, host, rate, burst):
+        """
+        Sets (or replaces) the rate and burst budget for the specified host
+        """
+        self.buckets[host] = TokenBucket(rate, burst)
+
+
+    def reserve(self, url):
+        """
+        Reserves a token for a request to the specified URL and returns the
+        number of seconds the caller has to wait before sending it
+        """
+        host = get_host(url)
+        bucket = self.buckets.get(host)
+        wait = bucket.reserve() if bucket else 0
+
+        with self.lock:
+            stats = self.stats.setdefault(host, { 'requests': 0, 'waited': 0,
+                                                  'max_wait': 0 })
+            stats['requests'] += 1
+            stats['waited'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+
+        return wait
+
+
+    def acquire(self, url):
+        """
+        Blocks until a request to the specified URL is allowed, and returns the
+        number of seconds it waited
+        """
+        wait = self.reserve(url)
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+
+    def report(self):
+        """
+        Returns a copy of the per-host statistics: number of requests, total
+        seconds waited and longest single wait
+        """
+        with self.lock:
+            return { host: dict(stats) for host, stats in self.stats.items() }
+
+
+    def print_report(self):
+        """
+        Prints the per-host statistics, so that the budgets can be tuned
+        """
+        print(f'\n{"*" * 70}')
+        print('Rate limiter report (requests, seconds waited, longest wait)\n')
+
+        for host, stats in sorted(self.report().items()):
+            print(f'{host or "(local)"}: {stats["requests"]} requests, '
+                  f'{stats["waited"]:.2f}s waited, '
+                  f'{stats["max_wait"]:.2f}s max')
+
+        print(f'{"*" * 70}\n')
+
+
+def _configured_limits():
+    """
+    Builds the (rate, burst) budget of every site's host from the configuration
+    enums
+    """
+    return {
+        get_host(MLC.BASE_URL.value): (MLC.REQUESTS_PER_SEC.value,
+                                       MLC.BURST.value),
+        get_host(OLX.BASE_URL.value): (OLX.REQUESTS_PER_SEC.value,
+                                       OLX.BURST.value),
+        get_host(CGamer.PRODUCT_URLS.value[0]): (CGamer.REQUESTS_PER_SEC.value,
+                                                 CGamer.BURST.value),
+        get_host(GamePl.BASE_URL.value): (GamePl.REQUESTS_PER_SEC.value,
+                                          GamePl.BURST.value),
+        get_host(MU.BASE_URL.value): (MU.REQUESTS_PER_SEC.value,
+                                      MU.BURST.value),
+        get_host(SEA.PRODUCT_URLS.value[0]): (SEA.REQUESTS_PER_SEC.value,
+                                              SEA.BURST.value),
+        get_host(Backend.URL.value): (Backend.REQUESTS_PER_SEC.value,
+                                      Backend.BURST.value)
+    }
+
+
+LIMITER = RateLimiter(_configured_limits())
@@ -0,0 +1,356 @@
+"""
+This module contains the metrics of the scraper's runs: counters, gauges and
+latency histograms of every stage (fetch, render, parse, export and upload) per
+site and per endpoint. They are exposed in Prometheus' text format, written to
+a file while the run goes on and, optionally, served by a local HTTP endpoint
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .constants import MetricsConfig
+
+
+def _format_labels(names, values, extra = ()):
+    """
+    Returns the label set of a sample in the text format, as in
+    {stage="fetch",site="olxspider"}
+    """
+    pairs = list(zip(names, values)) + list(extra)
+
+    if not pairs:
+        return ''
+
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                .replace('\n', '\\n')) for name, value in pairs]
+
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Metric:
+    """
+    Base metric: a value per combination of label values, updated from any
+    thread
+    """
+    kind = None
+
+    def __init__(self, name, documentation, label_names):
+        """
+        Constructor that sets the metric's name, help text and label names
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+
+    def get(self, *labels):
+        """
+        Returns the value of the specified label values
+        """
+        with self.lock:
+            return self.values.get(labels, 0)
+
+
+    def render(self):
+        """
+        Returns the metric in the text format
+        """
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f'{self.name}'
+                             f'{_format_labels(self.label_names, labels)} '
+                             f'{value}')
+
+        return lines
+
+
+class Counter(Metric):
+    """
+    Metric whose values only go up
+    """
+    kind = 'counter'
+
+    def inc(self, *labels, amount = 1):
+        """
+        Increases the value of the specified label values
+        """
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    """
+    Metric whose values go up and down
+    """
+    kind = 'gauge'
+
+    def dec(self, *labels, amount = 1):
+        """
+        Decreases the value of the specified label values
+        """
+        self.inc(*labels, amount = -amount)
+
+
+class Histogram(Metric):
+    """
+    Metric that counts the observed values in cumulative buckets, together
+    with their sum and count
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names,
+                 buckets = MetricsConfig.BUCKETS.value):
+        """
+        Constructor that also sets the upper bounds of the buckets
+        """
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+
+
+    def observe(self, value, *labels):
+        """
+        Adds an observed value for the specified label values
+        """
+        with self.lock:
+            entry = self.values.setdefault(labels, {
+                'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0 })
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+
+            entry['sum'] += value
+            entry['count'] += 1
+
+
+    def get(self, *labels):
+        """
+        Returns the number of values observed for the specified label values
+        """
+        with self.lock:
+            return self.values[labels]['count'] if labels in self.values \
+                   else 0
+
+
+    def render(self):
+        """
+        Returns the metric in the text format
+        """
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+
+        with self.lock:
+            for labels, entry in sorted(self.values.items()):
+                label_set = _format_labels(self.label_names, labels)
+                bounds = [*self.buckets, '+Inf']
+                counts = [*entry['buckets'], entry['count']]
+
+                for bound, count in zip(bounds, counts):
+                    bucket_set = _format_labels(self.label_names, labels,
+                                                [('le', bound)])
+                    lines.append(f'{self.name}_bucket{bucket_set} {count}')
+
+                lines.append(f'{self.name}_sum{label_set} {entry["sum"]}')
+                lines.append(f'{self.name}_count{label_set} {entry["count"]}')
+
+        return lines
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the metrics endpoint, which serves the registry's
+    metrics at /metrics
+    """
+
+    def do_GET(self):
+        """
+        Serves the metrics in the text format
+        """
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; '
+                         'charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        """
+        Keeps the scrapes of the endpoint out of the run's output
+        """
+        pass
+
+
+class MetricsRegistry:
+    """
+    Registry of the metrics of a run. Every stage is measured by a latency
+    histogram and a counter of its outcomes (labelled by stage, site and
+    endpoint), and by a gauge of the operations in flight (labelled by stage
+    and site). The exported items are counted per site
+
+    Once started, the metrics are written to a file every
+    MetricsConfig.INTERVAL seconds (and when the registry is stopped), and
+    served at http://<host>:<port>/metrics if a port is given
+    """
+
+    def __init__(self):
+        """
+        Constructor that declares the metrics
+        """
+        self.seconds = Histogram('scraper_stage_seconds', 'Seconds spent in '
+                                 'each operation of a stage',
+                                 ('stage', 'site', 'endpoint'))
+        self.operations = Counter('scraper_stage_operations_total',
+                                  'Operations of a stage by outcome',
+                                  ('stage', 'site', 'endpoint', 'outcome'))
+        self.in_flight = Gauge('scraper_stage_in_flight', 'Operations of a '
+                               'stage in progress', ('stage', 'site'))
+        self.items = Counter('scraper_items_total', 'Items exported',
+                             ('site',))
+        self.metrics = [self.seconds, self.operations, self.in_flight,
+                        self.items]
+        self.path = None
+        self.server = None
+        self.stopped = threading.Event()
+        self.writer = None
+
+
+    def start_stage(self, stage, site):
+        """
+        Counts an operation of the stage in flight, and returns its start time
+        """
+        self.in_flight.inc(stage, site)
+
+        return time.perf_counter()
+
+
+    def finish_stage(self, stage, site, endpoint, started, ok = True,
+                     seconds = None):
+        """
+        Records an operation of the stage that started at the specified time.
+        The seconds replace the elapsed time for the operations that are
+        interleaved with others (such as the parsing of a response, which is
+        suspended while its output is processed)
+        """
+        if seconds is None:
+            seconds = time.perf_counter() - started
+
+        self.in_flight.dec(stage, site)
+        self.seconds.observe(seconds, stage, site, endpoint)
+        self.operations.inc(stage, site, endpoint, 'ok' if ok else 'error')
+
+
+    @contextmanager
+    def track(self, stage, site, endpoint = ''):
+        """
+        Context manager that records the operation of the stage it wraps. The
+        operation fails if it raises an exception, or if the 'ok' key of the
+        dictionary it yields is set to False
+        """
+        outcome = { 'ok': True }
+        started = self.start_stage(stage, site)
+
+        try:
+            yield outcome
+        except BaseException:
+            outcome['ok'] = False
+            raise
+        finally:
+            self.finish_stage(stage, site, endpoint, started, outcome['ok'])
+
+
+    def count_items(self, site, amount = 1):
+        """
+        Counts items exported for the site
+        """
+        self.items.inc(site, amount = amount)
+
+
+    def render(self):
+        """
+        Returns every metric in Prometheus' text format
+        """
+        lines = []
+
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+    def write(self):
+        """
+        Replaces the metrics file with the current metrics (atomically, so
+        that a collector never reads half a file)
+        """
+        directory = os.path.dirname(self.path)
+
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        temporary_path = f'{self.path}.tmp'
+
+        with open(temporary_path, 'w', encoding = 'utf-8') as metrics_file:
+            metrics_file.write(self.render())
+
+        os.replace(temporary_path, self.path)
+
+
+    def _write_periodically(self):
+        """
+        Writes the metrics file every INTERVAL seconds until stopped
+        """
+        while not self.stopped.wait(MetricsConfig.INTERVAL.value):
+            self.write()
+
+
+    def start(self, path = MetricsConfig.PATH.value, port = None,
+              host = MetricsConfig.HOST.value):
+        """
+        Starts writing the metrics to the file at the specified path and, if a
+        port is given, serving them over HTTP. Both run in background threads
+        """
+        self.path = path
+        self.stopped.clear()
+        self.writer = threading.Thread(target = self._write_periodically,
+                                       daemon = True)
+        self.writer.start()
+
+        if port is not None:
+            self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+            self.server.daemon_threads = True
+            self.server.registry = self
+            threading.Thread(target = self.server.serve_forever,
+                             daemon = True).start()
+
+
+    def stop(self):
+        """
+        Stops the background threads and writes the final metrics
+        """
+        if not self.writer:
+            return
+
+        self.stopped.set()
+        self.writer.join()
+        self.writer = None
+        self.write()
+
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,672 @@
+"""
+This module contains the scrapy downloader and spider middlewares used by the
+spiders
+"""
+import time
+from scrapy import Request, signals
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy.responsetypes import responsetypes
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from twisted.internet import threads
+from twisted.internet.task import deferLater
+from twisted.internet.defer import DeferredSemaphore
+from twisted.python.threadpool import ThreadPool
+from selenium.common.exceptions import WebDriverException
+from .limiters import LIMITER
+from .browsers import DriverPool
+from .archives import ARCHIVE, REPLAY, get_archive_key
+from .seen import SEEN
+from .metrics import METRICS
+from .constants import RunConfig as Run, BrowserConfig as Browser
+from .constants import SeenConfig as Seen
+
+
+SLOTS = DeferredSemaphore(Run.MAX_CONCURRENCY.value)
+
+
+def _get_callback_name(request):
+    """
+    Returns the name of the spider method that handles the request's response
+    """
+    return getattr(request.callback, '__name__', None) or 'parse'
+
+
+def _is_product_request(request):
+    """
+    Indicates whether a request is for a product page (its callback is the
+    spider's parse_product)
+    """
+    return _get_callback_name(request) == 'parse_product'
+
+
+class ArchiveMiddleware:
+    """
+    Downloader middleware that captures the spiders' responses in the response
+    archive, or replays them from it instead of downloading them, according to
+    the ARCHIVE_MODE setting ('capture' or 'replay')
+
+    It must be closer to the engine than the rest of the scraper's
+    middlewares, so that replayed requests skip the rate limiter, the
+    concurrency slots and the browsers, while the captured responses are the
+    final ones (decompressed, rendered and after their retries and redirects).
+    Responses are archived under the key of the request that was originally
+    scheduled, which redirected and retried requests keep in their meta
+    """
+
+    def __init__(self, crawler, mode):
+        """
+        Constructor that starts the archive in the specified mode
+        """
+        self.crawler = crawler
+        self.stats = crawler.stats
+        ARCHIVE.start(mode)
+
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the middleware for the specified crawler, unless archiving is
+        disabled
+        """
+        mode = crawler.settings.get('ARCHIVE_MODE')
+
+        if not mode:
+            raise NotConfigured
+
+        return cls(crawler, mode)
+
+
+    def _get_key(self, request):
+        """
+        Returns the archive key of the request
+        """
+        return get_archive_key(request.method, request.url, request.body,
+                               bool(request.meta.get('browser')))
+
+
+    def process_request(self, request):
+        """
+        Returns the archived response of the request when replaying. A request
+        that was not archived is ignored
+        """
+        key = request.meta.setdefault('archive_key', self._get_key(request))
+
+        if not ARCHIVE.replaying:
+            return None
+
+        entry = ARCHIVE.get(key)
+
+        if not entry:
+            self.stats.inc_value('archive/missing')
+            raise IgnoreRequest(f'{request.url} is not in the archive')
+
+        self.stats.inc_value('archive/replayed')
+        request.meta.update(entry['meta'])
+        response_class = responsetypes.from_args(headers = entry['headers'],
+                                                 url = entry['url'],
+                                                 body = entry['body'])
+
+        return response_class(entry['url'], status = entry['status'],
+                              headers = entry['headers'],
+                              body = entry['body'], request = request)
+
+
+    def process_response(self, request, response):
+        """
+        Appends the response to the archive when capturing
+        """
+        if not ARCHIVE.capturing:
+            return response
+
+        keys = {request.meta.get('archive_key'), self._get_key(request)}
+        headers = { name.decode('latin-1'): [value.decode('latin-1')
+                                             for value in values]
+                    for name, values in response.headers.items() }
+
+        # The pages rendered by a browser have no headers, so their encoding
+        # is kept for the replay
+        if isinstance(response, TextResponse):
+            headers.setdefault('Content-Type', ['text/html; charset='
+                                                f'{response.encoding}'])
+        meta = { 'browser_result': request.meta['browser_result'] } \
+               if 'browser_result' in request.meta else None
+
+        ARCHIVE.add([key for key in keys if key], response.url,
+                    response.status, headers, response.body,
+                    self.crawler.spider.name, meta)
+        self.stats.inc_value('archive/captured')
+
+        return response
+
+
+class SeenUrlMiddleware:
+    """
+    Spider middleware that schedules the recrawl of the product pages (the
+    ones handled by the spider's parse_product). When the spider opens, the
+    pages it fetched at least SEEN_TTL seconds ago are ranked by their
+    expected staleness (estimated from each product's history of price
+    changes), and the RECRAWL_BUDGET highest ones are due to be downloaded
+    again. The requests of the due pages are prioritized by their expected
+    staleness, while the other known pages are replaced by the item scraped
+    from them back then, so that the exports and the backend still get every
+    product
+
+    New pages, and the ones whose listing fingerprint (the
+    'listing_fingerprint' meta key, for the spiders whose listings show it)
+    changed, are always downloaded first. Requests that set dont_filter (such
+    as a page retried with a browser) are never skipped, and with the
+    SEEN_REFRESH setting every page is downloaded again
+
+    The items scraped from the downloaded product pages are recorded in the
+    seen store, unless the responses are replayed from the archive
+    """
+
+    def __init__(self, crawler, ttl, budget = None, refresh = False,
+                 record = True):
+        """
+        Constructor that sets the seconds a fetched page is considered fresh
+        and the number of known pages that can be downloaded again per run
+        """
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.ttl = ttl
+        self.budget = budget
+        self.refresh = refresh
+        self.record = record
+        self.due = {}
+        self.skipped = set()
+
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the middleware for the specified crawler. The pages recorded
+        during the crawl are committed once the spider finishes
+        """
+        settings = crawler.settings
+        middleware = cls(crawler, settings.getfloat('SEEN_TTL'),
+                         settings.getint('RECRAWL_BUDGET') or None,
+                         settings.getbool('SEEN_REFRESH'),
+                         settings.get('ARCHIVE_MODE') != REPLAY)
+        crawler.signals.connect(middleware.spider_opened,
+                                signal = signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed,
+                                signal = signals.spider_closed)
+        return middleware
+
+
+    def spider_opened(self, spider):
+        """
+        Selects the known pages that are due to be downloaded again
+        """
+        if not self.refresh:
+            self.due = SEEN.get_due(spider.name, self.ttl, self.budget)
+            self.stats.set_value('seen/due', len(self.due))
+
+
+    def spider_closed(self, spider):
+        """
+        Commits the pages recorded during the crawl
+        """
+        SEEN.commit()
+
+
+    def _get_stored_item(self, request):
+        """
+        Returns the item that replaces a product page request that is not due,
+        or None if the page must be downloaded (in which case the request is
+        prioritized by the page's expected staleness)
+        """
+        if self.refresh or request.dont_filter:
+            return None
+
+        page = SEEN.get(request.url)
+        fingerprint = request.meta.get('listing_fingerprint')
+
+        if page is None or (fingerprint is not None and
+                            page['fingerprint'] != fingerprint):
+            staleness = 1
+        elif request.url in self.due:
+            staleness = self.due[request.url]
+        else:
+            return page['item']
+
+        request.priority = round(staleness * Seen.PRIORITY_LEVELS.value)
+
+        return None
+
+
+    def _process_element(self, response, element):
+        """
+        Returns the element of the spider's output to pass on (the stored item
+        of a fresh product page request), or None to drop it
+        """
+        if not isinstance(element, Request):
+            if self.record and response.meta.get('seen_url'):
+                SEEN.record(response.meta['seen_url'], dict(element),
+                            response.meta.get('listing_fingerprint'),
+                            self.crawler.spider.name)
+                self.stats.inc_value('seen/recorded')
+
+            return element
+
+        if not _is_product_request(element):
+            return element
+
+        item = self._get_stored_item(element)
+
+        if item is None:
+            element.meta.setdefault('seen_url', element.url)
+            return element
+
+        # A product listed twice is exported once, as the duplicate requests
+        # filter would do
+        if element.url in self.skipped:
+            return None
+
+        self.skipped.add(element.url)
+        self.stats.inc_value('seen/skipped')
+
+        return item
+
+
+    def process_spider_output(self, response, result):
+        """
+        Replaces the requests of the product pages that are not due with their
+        items, and records the items scraped from the downloaded product pages
+        """
+        for element in result:
+            element = self._process_element(response, element)
+
+            if element is not None:
+                yield element
+
+
+    async def process_spider_output_async(self, response, result):
+        """
+        Version of process_spider_output for the spiders' asynchronous output
+        """
+        async for element in result:
+            element = self._process_element(response, element)
+
+            if element is not None:
+                yield element
+
+
+class FetchMetricsMiddleware:
+    """
+    Downloader middleware that records the spiders' downloads in the fetch
+    metrics (or in the render ones, for the pages rendered by a browser),
+    labelled by the spider method that handles them. Responses with an error
+    status count as errors
+
+    It must be closer to the downloader than the concurrency middleware, so
+    that waiting for a slot doesn't count, but farther than the browser
+    middleware
+    """
+
+    def __init__(self, crawler):
+        """
+        Constructor that keeps the crawler, whose spider labels the metrics
+        """
+        self.crawler = crawler
+
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the middleware for the specified crawler
+        """
+        return cls(crawler)
+
+
+    def _finish(self, request, ok):
+        """
+        Records the request's download, if it was started
+        """
+        started = request.meta.pop('metrics_started', None)
+
+        if started is not None:
+            stage = 'render' if request.meta.get('browser') else 'fetch'
+            METRICS.finish_stage(stage, self.crawler.spider.name,
+                                 _get_callback_name(request), started, ok)
+
+
+    def process_request(self, request):
+        """
+        Starts measuring the request's download
+        """
+        stage = 'render' if request.meta.get('browser') else 'fetch'
+        request.meta['metrics_started'] = METRICS.start_stage(
+            stage, self.crawler.spider.name)
+        return None
+
+
+    def process_response(self, request, response):
+        """
+        Records the download once its response arrived
+        """
+        self._finish(request, response.status < 400)
+        return response
+
+
+    def process_exception(self, request, exception):
+        """
+        Records the download as an error when it failed
+        """
+        self._finish(request, False)
+        return None
+
+
+class ParseMetricsMiddleware:
+    """
+    Spider middleware that records the time the spiders' callbacks spend
+    parsing each response in the parse metrics, labelled by callback, and
+    counts the exported items of each spider. Only the time spent producing
+    the callback's output counts, not the one spent processing it
+
+    It must be the closest scraper's spider middleware to the spider
+    """
+
+    def __init__(self, crawler):
+        """
+        Constructor that keeps the crawler, whose spider labels the metrics
+        """
+        self.crawler = crawler
+
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the middleware for the specified crawler, counting the items
+        that go through the pipelines (and so, to the exports)
+        """
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.item_scraped,
+                                signal = signals.item_scraped)
+        return middleware
+
+
+    def item_scraped(self, item, response, spider):
+        """
+        Counts an exported item of the spider
+        """
+        METRICS.count_items(spider.name)
+
+
+    def process_spider_output(self, response, result):
+        """
+        Passes the callback's output on, measuring the time spent producing it
+        """
+        started = METRICS.start_stage('parse', self.crawler.spider.name)
+        seconds = 0
+        ok = False
+
+        try:
+            iterator = iter(result)
+
+            while True:
+                resumed = time.perf_counter()
+
+                try:
+                    element = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += time.perf_counter() - resumed
+
+                yield element
+
+            ok = True
+        finally:
+            METRICS.finish_stage('parse', self.crawler.spider.name,
+                                 _get_callback_name(response.request),
+                                 started, ok, seconds)
+
+
+    async def process_spider_output_async(self, response, result):
+        """
+        Version of process_spider_output for the spiders' asynchronous output
+        """
+        started = METRICS.start_stage('parse', self.crawler.spider.name)
+        seconds = 0
+        ok = False
+
+        try:
+            iterator = result.__aiter__()
+
+            while True:
+                resumed = time.perf_counter()
+
+                try:
+                    element = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    seconds += time.perf_counter() - resumed
+
+                yield element
+
+            ok = True
+        finally:
+            METRICS.finish_stage('parse', self.crawler.spider.name,
+                                 _get_callback_name(response.request),
+                                 started, ok, seconds)
+
+
+class RateLimitMiddleware:
+    """
+    Downloader middleware that paces the spiders' requests with the shared
+    per-host rate limiter. Waiting happens on the reactor, so other hosts keep
+    being crawled meanwhile
+    """
+
+    def __init__(self, stats):
+        """
+        Constructor that keeps the crawler's stats collector
+        """
+        self.stats = stats
+
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the middleware for the specified crawler
+        """
+        return cls(crawler.stats)
+
+
+    def process_request(self, request):
+        """
+        Reserves a token for the request and, if the host is out of budget,
+        delays the download until the token becomes available
+        """
+        from twisted.internet import reactor
+
+        wait = LIMITER.reserve(request.url)
+
+        self.stats.inc_value('ratelimit/requests')
+
+        if wait > 0:
+            self.stats.inc_value('ratelimit/delayed')
+            self.stats.inc_value('ratelimit/waited_secs', wait)
+            return deferLater(reactor, wait, lambda: None)
+
+        return None
+
+
+class ConcurrencyMiddleware:
+    """
+    Downloader middleware that bounds the downloads in flight across all the
+    spiders running in the process (each spider's own CONCURRENT_REQUESTS is
+    its per-site cap). A slot is taken before the download and given back with
+    its response or exception
+
+    It must be the closest middleware to the downloader, so that the slot is
+    given back before the retry and redirect middlewares replace a response
+    with a new request
+    """
+
+    def __init__(self, stats):
+        """
+        Constructor that keeps the crawler's stats collector
+        """
+        self.stats = stats
+
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the middleware for the specified crawler
+        """
+        return cls(crawler.stats)
+
+
+    def _release(self, request):
+        """
+        Gives back the request's slot, if it holds one
+        """
+        if request.meta.pop('concurrency_slot', False):
+            SLOTS.release()
+
+
+    def process_request(self, request):
+        """
+        Waits for a free slot before letting the request be downloaded
+        """
+        if request.meta.get('concurrency_slot'):
+            return None
+
+        if not SLOTS.tokens:
+            self.stats.inc_value('concurrency/queued')
+
+        def take_slot(_):
+            request.meta['concurrency_slot'] = True
+
+        return SLOTS.acquire().addCallback(take_slot)
+
+
+    def process_response(self, request, response):
+        """
+        Frees the request's slot once its response arrived
+        """
+        self._release(request)
+        return response
+
+
+    def process_exception(self, request, exception):
+        """
+        Frees the request's slot when its download failed
+        """
+        self._release(request)
+        return None
+
+
+class BrowserMiddleware:
+    """
+    Downloader middleware that renders the requests marked with the 'browser'
+    meta key in a pool of headless drivers, running in worker threads, and
+    returns the rendered pages to the spider as regular responses. Any other
+    request is downloaded by scrapy as usual
+
+    The 'browser' meta value can also be the name of a spider method, which is
+    called with the driver once the page is loaded (to click buttons, wait for
+    elements, etc.). Its return value is kept in the response's meta under the
+    'browser_result' key
+    """
+
+    def __init__(self, crawler, pool_size):
+        """
+        Constructor that sets up a pool of pool_size drivers and worker threads
+        """
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.pool = DriverPool(pool_size)
+        self.threadpool = ThreadPool(0, pool_size, 'BrowserMiddleware')
+
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the middleware for the specified crawler. The pool's size can
+        be set with the BROWSER_POOL_SIZE setting
+        """
+        pool_size = crawler.settings.getint('BROWSER_POOL_SIZE',
+                                            Browser.POOL_SIZE.value)
+        middleware = cls(crawler, pool_size)
+        crawler.signals.connect(middleware.spider_opened,
+                                signal = signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed,
+                                signal = signals.spider_closed)
+        return middleware
+
+
+    def spider_opened(self, spider):
+        """
+        Starts the worker threads
+        """
+        self.threadpool.start()
+
+
+    def spider_closed(self, spider):
+        """
+        Stops the worker threads and quits the drivers
+        """
+        self.threadpool.stop()
+        self.pool.close()
+
+
+    def render(self, request, spider):
+        """
+        Loads the request's URL in a driver of the pool, runs the spider's
+        browser action if any, and returns the rendered page as a response.
+        It blocks, so it runs in a worker thread
+
+        The driver always goes back to the pool: a driver that failed (or that
+        was interrupted) is discarded, while one whose page only made the
+        spider's action fail is released, since the next page is loaded from
+        scratch
+        """
+        driver = self.pool.acquire()
+
+        try:
+            driver.get(request.url)
+            action = request.meta['browser']
+
+            if isinstance(action, str):
+                request.meta['browser_result'] = getattr(spider, action)(driver)
+
+            body = driver.page_source
+        except WebDriverException:
+            self.pool.discard(driver)
+            raise
+        except Exception:
+            self.pool.release(driver)
+            raise
+        except BaseException:
+            self.pool.discard(driver)
+            raise
+
+        self.pool.release(driver)
+
+        return HtmlResponse(request.url, body = body, encoding = 'utf-8',
+                            request = request)
+
+
+    def process_request(self, request):
+        """
+        Renders the request in a worker thread if it needs a browser
+        """
+        if not request.meta.get('browser'):
+            return None
+
+        from twisted.internet import reactor
+
+        def count(response):
+            self.stats.inc_value('browser/rendered')
+            return response
+
+        deferred = threads.deferToThreadPool(reactor, self.threadpool,
+                                             self.render, request,
+                                             self.crawler.spider)
+        return deferred.addCallback(count)
@@ -0,0 +1,596 @@
+"""
+This module contains the local mock server used by the offline benchmarks and
+tests. It serves the mocks saved in scraper/test scaled up to any number of
+synthetic products: the listing pages of every site (with their paginators),
+its product pages, OLX's listing json data and a stand-in of MercadoLibre's
+API. It can also inject latency, jitter, rate limiting (429) and server errors
+(500) in its responses
+
+Every response has an ETag, and requests whose If-None-Match matches it are
+answered with 304. MercadoLibre's API also enforces its paging bounds and a
+per-client request budget, like the real one does
+"""
+import re
+import math
+import copy
+import json
+import time
+import random
+import hashlib
+import threading
+import lxml.html
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .selectors import RULES
+from .limiters import TokenBucket
+from .constants import MercadoLibreConfig as MLC, MixUpConfig as MU
+from .constants import OLXConfig as OLX, ColombiaGamerConfig as CGamer
+from .constants import GamePlanetConfig as GamePl, SearsConfig as SEA
+
+
+QUERIES = ['switch', 'ps4', 'xbox-one']
+PAGE_SIZE = 24
+
+# The bounds of MercadoLibre's search paging and multiget requests
+ML_MAX_LIMIT = 50
+ML_MAX_IDS = 20
+
+# The listing mock and the product page mocks ({brand} is switch, playstation
+# or xbox) of every site served as HTML
+HTML_SITES = {
+    'cgamer': (CGamer, 'cgamer_switch_mock.html', '{brand}_mock.html'),
+    'gamepl': (GamePl, 'gameplanet_mock.html', '{brand}_mock.html'),
+    'sears': (SEA, 'sears_mock.html', '{brand}_mock.html'),
+    'mixup': (MU, 'mixup_mock.html', '{brand}_mock.html')
+}
+
+
+def get_brand(text):
+    """
+    Returns the brand of the mocks that match a query, URL or id
+    """
+    text = text.lower()
+
+    if 'ps4' in text or 'playstation' in text:
+        return 'playstation'
+    elif 'xbox' in text:
+        return 'xbox'
+
+    return 'switch'
+
+
+def _read(path):
+    """
+    Returns the content of a mock file
+    """
+    with open(path, encoding = 'utf-8') as mock_file:
+        return mock_file.read()
+
+
+def _get_items(root, anchors):
+    """
+    Returns the elements that hold the products of a listing, that is, the
+    children of the anchors' closest common ancestor (or of the body, if there
+    is a single anchor) that contain them
+    """
+    container = root.find('body')
+
+    if len(anchors) > 1:
+        container = next(ancestor for ancestor in anchors[0].iterancestors()
+                         if all(ancestor in anchor.iterancestors()
+                                for anchor in anchors[1:]))
+
+    items = []
+
+    for anchor in anchors:
+        item = anchor
+
+        while item.getparent() is not container:
+            item = item.getparent()
+
+        if item not in items:
+            items.append(item)
+
+    return items
+
+
+def scale_listing(html, rule, hrefs):
+    """
+    Returns the parsed listing mock with its products replaced by one product
+    (a copy of the first one) for each of the hrefs. The rule is the XPath of
+    the listing's product links
+    """
+    root = lxml.html.fromstring(html)
+    anchors = [attribute.getparent() for attribute in root.xpath(rule)]
+    items = _get_items(root, anchors)
+    original_href = anchors[0].get('href')
+    parent = items[0].getparent()
+    position = parent.index(items[0])
+
+    for item in items:
+        parent.remove(item)
+
+    for offset, href in enumerate(hrefs):
+        item = copy.deepcopy(items[0])
+
+        for anchor in item.iter('a'):
+            if anchor.get('href') == original_href:
+                anchor.set('href', href)
+
+        parent.insert(position + offset, item)
+
+    return root
+
+
+def _get_paginator(site, page, pages):
+    """
+    Returns the HTML of the paginator of a site's listing page
+    """
+    numbers = range(1, pages + 1)
+
+    if site == 'cgamer':
+        links = ''.join(f'<li><a href="?page={n}">{n}</a></li>'
+                        for n in numbers)
+        return f'<nav role="pagination"><ul>{links}</ul></nav>'
+    elif site == 'sears':
+        links = ''.join(f'<li><a href="?page={n}">{n}</a></li>'
+                        for n in numbers)
+        return f'<div class="paginador"><ul>{links}</ul></div>'
+    elif site == 'gamepl':
+        return f'<a title="Next" href="?page={page + 1}">Next</a>' \
+               if page < pages else '<span></span>'
+
+    # MixUp's pages are requested by posting its form back, which keeps the
+    # current page in a hidden field
+    disabled = ' disabled="disabled"' if page >= pages else ''
+    target = MU.NEXT_ID.value.replace('_', '$')
+
+    return (f'<form method="post" action=""><input type="hidden" '
+            f'name="__BENCHPAGE" value="{page}"/><a id="{MU.NEXT_ID.value}"'
+            f'{disabled} href="javascript:__doPostBack(\'{target}\',\'\')">'
+            'Siguiente</a></form>')
+
+
+class MockError(Exception):
+    """
+    Raised by the routes to answer a request with an error, whose body is
+    shaped like the errors of MercadoLibre's API
+    """
+
+    def __init__(self, status, error, message, headers = {}):
+        """
+        Constructor that sets the error's status code, name and headers
+        """
+        super().__init__(message)
+        self.status = status
+        self.error = error
+        self.headers = headers
+
+
+    def get_body(self):
+        """
+        Returns the json body of the error
+        """
+        return { 'message': str(self), 'error': self.error,
+                 'status': self.status, 'cause': [] }
+
+
+class Faults:
+    """
+    Faults injected in the mock server's responses: every response is delayed
+    latency seconds (plus or minus jitter), and a rate_limited and a failures
+    fraction of them are answered with 429 and 500 errors instead
+    """
+
+    def __init__(self, latency = 0, jitter = 0, rate_limited = 0, failures = 0,
+                 seed = None):
+        """
+        Constructor that sets the faults' settings
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limited = rate_limited
+        self.failures = failures
+        self.random = random.Random(seed)
+
+
+    def get_error(self):
+        """
+        Waits for the response's latency, and returns the status code of the
+        error it must be answered with, or None
+        """
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+
+        if delay > 0:
+            time.sleep(delay)
+
+        roll = self.random.random()
+
+        if roll < self.rate_limited:
+            return 429
+        elif roll < self.rate_limited + self.failures:
+            return 500
+
+        return None
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the mock server, that routes the requests to the mocks
+    of its MockServer
+    """
+
+    def log_message(self, format, *args):
+        """
+        Silences the server's access log
+        """
+
+
+    def _send(self, status, body, headers = {}):
+        """
+        Sends a response with the specified body, either HTML (a string) or a
+        json object. Successful responses get an ETag, and are answered with
+        304 (without a body) if the request already has it
+        """
+        content_type = 'text/html; charset=utf-8'
+
+        if not isinstance(body, str):
+            body = json.dumps(body)
+            content_type = 'application/json'
+
+        data = body.encode('utf-8')
+        headers = dict(headers)
+
+        if status == 200:
+            headers['ETag'] = f'"{hashlib.md5(data).hexdigest()}"'
+
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                self.server.mocks.count('not_modified')
+                status, data = 304, b''
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def _handle(self, form = None):
+        """
+        Answers the request with its mock, or with an injected error
+        """
+        mocks = self.server.mocks
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        params.update(form or {})
+        error = mocks.faults.get_error()
+
+        mocks.count('requests')
+
+        if error:
+            mocks.count('rate_limited' if error == 429 else 'failures')
+            self._send(error, { 'error': 'injected', 'status': error })
+            return
+
+        try:
+            body = mocks.route(url.path, params, self.client_address[0])
+        except MockError as error:
+            self._send(error.status, error.get_body(), error.headers)
+            return
+
+        if body is None:
+            self._send(404, { 'message': f'{url.path} not found',
+                              'error': 'not_found', 'status': 404,
+                              'cause': [] })
+        else:
+            self._send(200, body)
+
+
+    def do_GET(self):
+        """
+        Answers a GET request
+        """
+        self._handle()
+
+
+    def do_POST(self):
+        """
+        Answers a POST request (MixUp's postbacks), whose form fields are read
+        as query parameters
+        """
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        self._handle(dict(urllib.parse.parse_qsl(body)))
+
+
+class MockServer:
+    """
+    Local HTTP server (running in a background thread) that serves the sites'
+    mocks with the specified number of synthetic products per listing
+
+    The rate_limit is the (rate, burst) budget of requests per second that
+    every client (by its address) can send to MercadoLibre's API. Requests
+    over it are answered with 429 and a Retry-After header
+    """
+
+    def __init__(self, products = 1000, faults = None, rate_limit = None,
+                 host = '127.0.0.1', port = 0):
+        """
+        Constructor that loads the mocks
+        """
+        self.products = products
+        self.faults = faults or Faults()
+        self.rate_limit = rate_limit
+        self.address = (host, port)
+        self.server = None
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.stats = { 'requests': 0, 'rate_limited': 0, 'failures': 0,
+                       'throttled': 0, 'not_modified': 0 }
+        self.html = {}
+
+        for site, (config, listing, product) in HTML_SITES.items():
+            self.html[site] = (_read(f'{config.TEST_PATH.value}/{listing}'), {
+                brand: _read(f'{config.TEST_PATH.value}/'
+                             f'{product.format(brand = brand)}')
+                for brand in ('switch', 'playstation', 'xbox')
+            })
+
+        olx_listing = json.loads(_read(f'{OLX.TEST_PATH.value}/'
+                                       f'{OLX.TEST_LISTING_FILE.value}'))
+        self.olx_item = olx_listing['data'][0]
+        self.olx_pages = { brand: _read(f'{OLX.TEST_PATH.value}/{brand}'
+                                        '_mock.html')
+                           for brand in ('switch', 'playstation', 'xbox') }
+
+        self.ml_results = {}
+        self.ml_items = {}
+        self.ml_descriptions = {}
+
+        for brand in ('switch', 'playstation', 'xbox'):
+            path = f'{MLC.TEST_PATH.value}/{brand}'
+            self.ml_results[brand] = json.loads(
+                _read(f'{path}_index_base.json'))['results'][0]
+            self.ml_items[brand] = json.loads(_read(f'{path}_product_base.json'))
+            self.ml_descriptions[brand] = json.loads(
+                _read(f'{path}_description.json'))
+
+
+    @property
+    def url(self):
+        """
+        Returns the base URL of the running server
+        """
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+    def start(self):
+        """
+        Starts serving in a background thread, and returns the server
+        """
+        self.server = ThreadingHTTPServer(self.address, MockHandler)
+        self.server.daemon_threads = True
+        self.server.mocks = self
+        threading.Thread(target = self.server.serve_forever,
+                         daemon = True).start()
+
+        return self
+
+
+    def stop(self):
+        """
+        Stops the server
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def count(self, metric):
+        """
+        Increments one of the server's metrics
+        """
+        with self.lock:
+            self.stats[metric] += 1
+
+
+    def _throttle(self, client):
+        """
+        Takes a request from the client's budget of MercadoLibre's API, and
+        raises a 429 MockError if it has none left
+        """
+        if not self.rate_limit:
+            return
+
+        with self.lock:
+            if client not in self.buckets:
+                self.buckets[client] = TokenBucket(*self.rate_limit)
+
+            bucket = self.buckets[client]
+
+        wait = bucket.take()
+
+        if wait:
+            self.count('throttled')
+            raise MockError(429, 'too_many_requests', 'Too many requests',
+                            { 'Retry-After': str(math.ceil(wait)) })
+
+
+    def get_start_urls(self, site):
+        """
+        Returns the URLs of the listings of a site
+        """
+        return [f'{self.url}/{site}/listing/{query}' for query in QUERIES]
+
+
+    def route(self, path, params, client = None):
+        """
+        Returns the body of the mock of the path (HTML or a json object), or
+        None if there is none. Raises MockError for the requests that must be
+        answered with an error
+        """
+        parts = path.strip('/').split('/')
+
+        if parts[0] == 'ml':
+            self._throttle(client)
+            return self._route_mercadolibre(parts[1:], params)
+        elif parts[0] == 'olx':
+            return self._route_olx(parts[1:], params)
+        elif parts[0] in HTML_SITES and len(parts) >= 3:
+            return self._route_html(parts[0], parts[1:], params)
+
+        return None
+
+
+    def _route_html(self, site, parts, params):
+        """
+        Returns a listing page (listing/<query>?page=<n>) or a product page
+        (product/<query>/<n>) of a site served as HTML
+        """
+        config = HTML_SITES[site][0]
+        listing, product_pages = self.html[site]
+
+        if parts[0] == 'product':
+            return product_pages[get_brand(parts[1])]
+        elif parts[0] != 'listing':
+            return None
+
+        query = parts[1]
+        pages = max(1, -(-self.products // PAGE_SIZE))
+        page = int(params.get('page', 1))
+
+        if '__BENCHPAGE' in params:
+            page = int(params['__BENCHPAGE']) + 1
+
+        first = (page - 1) * PAGE_SIZE
+        hrefs = [f'/{site}/product/{query}/{n}'
+                 for n in range(first, min(first + PAGE_SIZE, self.products))]
+        root = scale_listing(listing,
+                             RULES[config.SPIDER_NAME.value]['products'], hrefs)
+        root.find('body').append(lxml.html.fragment_fromstring(
+            _get_paginator(site, page, pages)))
+
+        return lxml.html.tostring(root, encoding = 'unicode')
+
+
+    def _route_olx(self, parts, params):
+        """
+        Returns a page of a listing's json data (api?query=<query>&page=<n>)
+        or a product page (item/<slug>)
+        """
+        if parts[0] == 'item':
+            return self.olx_pages[get_brand(parts[-1])]
+        elif parts[0] != 'api':
+            return None
+
+        query = params.get('query', '')
+        size = int(params.get('size', OLX.PAGE_SIZE.value))
+        first = int(params.get('page', 0)) * size
+        data = []
+
+        for n in range(first, min(first + size, self.products)):
+            item = copy.deepcopy(self.olx_item)
+            item['id'] = str(n)
+            item['title'] = f'{query} {n}'
+            data.append(item)
+
+        return { 'data': data, 'metadata': { 'total_ads': self.products } }
+
+
+    def _route_mercadolibre(self, parts, params):
+        """
+        Returns the response of MercadoLibre's search (sites/<id>/search),
+        item (items/<id>), multiget items (items?ids=<ids>) and description
+        (items/<id>/description) endpoints. The ids of the synthetic products
+        start with the brand's initial, so that their mocks can be found
+        """
+        if parts[-1] == 'search':
+            return self._search_mercadolibre(params)
+        elif parts == ['items']:
+            ids = [product_id for product_id
+                   in params.get('ids', '').split(',') if product_id]
+
+            if not ids or len(ids) > ML_MAX_IDS:
+                raise MockError(400, 'bad_request', 'The ids must be between '
+                                f'1 and {ML_MAX_IDS}')
+
+            attributes = [attribute for attribute
+                          in params.get('attributes', '').split(',')
+                          if attribute]
+
+            return [{ 'code': 200,
+                      'body': self._get_ml_item(product_id, attributes) }
+                    for product_id in ids]
+        elif len(parts) == 2 and parts[0] == 'items':
+            return self._get_ml_item(parts[1])
+        elif len(parts) == 3 and parts[0] == 'items' and \
+             parts[2] == 'description':
+            return self.ml_descriptions[self._get_ml_brand(parts[1])]
+
+        return None
+
+
+    def _search_mercadolibre(self, params):
+        """
+        Returns a page of the search results of a query, whose offset and limit
+        must be within the API's bounds
+        """
+        query = params.get('q', '')
+        brand = get_brand(query)
+
+        try:
+            offset = int(params.get('offset', 0))
+            limit = int(params.get('limit', MLC.LIMIT.value))
+        except ValueError:
+            raise MockError(400, 'bad_request', 'The offset and limit must be '
+                            'numbers')
+
+        if not 0 <= limit <= ML_MAX_LIMIT:
+            raise MockError(400, 'bad_request', 'The limit must be between 0 '
+                            f'and {ML_MAX_LIMIT}')
+        elif not 0 <= offset <= MLC.MAX_OFFSET.value:
+            raise MockError(400, 'bad_request', 'The offset must be between 0 '
+                            f'and {MLC.MAX_OFFSET.value}')
+
+        results = []
+
+        for n in range(offset, min(offset + limit, self.products)):
+            result = copy.deepcopy(self.ml_results[brand])
+            result['id'] = f'{MLC.COUNTRY_ID.value}{brand[0]}{n}'
+            result['title'] = f'{result["title"]} {n}'
+            result['permalink'] = f'{self.url}/ml/item/{result["id"]}'
+            results.append(result)
+
+        return { 'query': query, 'results': results,
+                 'paging': { 'total': self.products, 'offset': offset,
+                             'limit': limit } }
+
+
+    def _get_ml_brand(self, product_id):
+        """
+        Returns the brand of a synthetic MercadoLibre product id
+        """
+        initial = re.sub(r'^[A-Z]+', '', product_id)[:1]
+
+        return next((brand for brand in self.ml_items if brand[0] == initial),
+                    'switch')
+
+
+    def _get_ml_item(self, product_id, attributes = None):
+        """
+        Returns the item of a synthetic MercadoLibre product, with only the
+        specified attributes if any
+        """
+        item = copy.deepcopy(self.ml_items[self._get_ml_brand(product_id)])
+        item['id'] = product_id
+        item['pictures'][0]['secure_url'] = f'{self.url}/ml/images/{product_id}'
+
+        if attributes:
+            return { key: value for key, value in item.items()
+                     if key in attributes }
+
+        return item
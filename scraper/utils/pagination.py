@@ -0,0 +1,125 @@
+"""
+This module contains the functions that discover the pages of a paginated
+listing from its paginator links, so that all of them can be requested at once
+instead of following the "next" link one page at a time
+"""
+import urllib.parse
+
+
+def _get_numbered_links(response, links_xp):
+    """
+    Returns a dictionary that maps the page numbers shown in the paginator to
+    the URLs of their links
+    """
+    links = {}
+
+    for link in response.xpath(links_xp):
+        text = ''.join(link.xpath('.//text()').getall()).strip()
+        href = link.xpath('@href').get()
+
+        if href and text.isdigit():
+            links[int(text)] = response.urljoin(href)
+
+    return links
+
+
+def _get_template(links):
+    """
+    Infers how the page number is written in the listing's URLs: the query
+    parameter whose value grows linearly with the page (such as page=N or
+    start=(N - 1) * 24), from the two highest numbered links
+
+    Returns a (URL parts, query, parameter, step, offset) tuple, or None if the
+    links don't follow such a pattern
+    """
+    pages = sorted(links)
+
+    if len(pages) < 2:
+        return None
+
+    first, last = pages[-2], pages[-1]
+    first_url = urllib.parse.urlparse(links[first])
+    last_url = urllib.parse.urlparse(links[last])
+    first_query = urllib.parse.parse_qs(first_url.query)
+    last_query = urllib.parse.parse_qs(last_url.query)
+
+    if first_url._replace(query = '') != last_url._replace(query = ''):
+        return None
+
+    keys = [key for key in set(first_query) | set(last_query)
+            if first_query.get(key) != last_query.get(key)]
+
+    if len(keys) != 1:
+        return None
+
+    try:
+        first_value = int(first_query[keys[0]][0])
+        last_value = int(last_query[keys[0]][0])
+    except (KeyError, ValueError):
+        return None
+
+    step, remainder = divmod(last_value - first_value, last - first)
+
+    if step <= 0 or remainder:
+        return None
+
+    return last_url, last_query, keys[0], step, first_value - step * first
+
+
+def _get_page_number(url, template):
+    """
+    Returns the page number of a URL according to the template, or None if
+    the URL doesn't match it
+    """
+    template_url, _, key, step, offset = template
+    parsed_url = urllib.parse.urlparse(url)
+    query = urllib.parse.parse_qs(parsed_url.query)
+
+    if parsed_url._replace(query = '') != template_url._replace(query = ''):
+        return None
+
+    try:
+        page, remainder = divmod(int(query[key][0]) - offset, step)
+    except (KeyError, ValueError):
+        return None
+
+    return None if remainder else page
+
+
+def _build_page_url(template, page):
+    """
+    Returns the URL of a page according to the template
+    """
+    template_url, query, key, step, offset = template
+    query = dict(query, **{ key: [str(offset + step * page)] })
+
+    return urllib.parse.urlunparse(template_url._replace(
+        query = urllib.parse.urlencode(query, doseq = True)))
+
+
+def get_page_urls(response, links_xp, max_pages):
+    """
+    Returns the URLs of the listing's pages (from the second one up to
+    max_pages) found in the paginator links selected by links_xp
+
+    When the links' URLs follow a pattern, the last page is read from any link
+    that points past the numbered ones (such as a "last page" link), and every
+    page up to it is returned. Otherwise only the numbered links are returned:
+    paginators that show a sliding window of pages reveal the rest as their
+    pages are parsed, so this function should be called on every listing page
+    and the repeated URLs are left to the duplicates filter
+    """
+    links = _get_numbered_links(response, links_xp)
+    template = _get_template(links)
+
+    if not template:
+        return [url for page, url in sorted(links.items())
+                if 1 < page <= max_pages]
+
+    hrefs = response.xpath(f'{links_xp}/@href').getall()
+    pages = [_get_page_number(response.urljoin(href), template)
+             for href in hrefs]
+    last_page = max([page for page in pages if page] + list(links))
+
+    return [_build_page_url(template, page)
+            for page in range(2, min(last_page, max_pages) + 1)]
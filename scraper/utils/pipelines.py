@@ -0,0 +1,203 @@
+"""
+This module contains the scrapy item pipelines used by the spiders
+"""
+from twisted.internet import defer, threads
+from twisted.python.failure import Failure
+from scrapy.exceptions import DropItem, NotConfigured
+from . import uploads
+from .fingerprints import FingerprintStore
+from .constants import BackendConfig as Backend, SyncConfig as Sync
+
+
+REQUIRED_FIELDS = ('id_ecommerce', 'id_type_product', 'name', 'price', 'image',
+                   'url')
+
+
+def validate_record(record):
+    """
+    Returns the reason why a scraped record can't be stored in the backend's
+    database, or None if it is valid
+    """
+    for field in REQUIRED_FIELDS:
+        if record.get(field) in (None, ''):
+            return f'missing {field}'
+
+    if not isinstance(record['price'], int) or record['price'] <= 0:
+        return f'invalid price {record["price"]!r}'
+
+    return None
+
+
+class BackendPipeline:
+    """
+    Item pipeline that stores the scraped items in the backend's database while
+    the crawl is still running. Valid items that are new or changed since the
+    last synchronized run are buffered in size-bounded batches, which are sent
+    from worker threads with at most max_in_flight of them at a time. When
+    every upload slot is busy, the items wait for one, which slows the spider
+    down (backpressure)
+
+    The items that disappeared are deactivated once the spider finishes
+    (unless the BACKEND_DEACTIVATE setting is disabled), and the run becomes
+    the baseline of the next one only if every batch was sent
+
+    It is enabled by the BACKEND_STORE setting
+    """
+
+    def __init__(self, crawler, endpoint, verbose = False,
+                 max_in_flight = Backend.MAX_IN_FLIGHT.value,
+                 fingerprints_path = Sync.PATH.value, deactivate = True):
+        """
+        Constructor that keeps the crawler (whose spider and stats collector
+        the uploads are reported to) and the upload settings
+        """
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.endpoint = endpoint
+        self.verbose = verbose
+        self.deactivate = deactivate
+        self.fingerprints_path = fingerprints_path
+        self.slots = defer.DeferredSemaphore(max_in_flight)
+        self.buffer = uploads.BatchBuffer()
+        self.pending = []
+        self.fingerprints = None
+
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the pipeline for the specified crawler, unless storing is
+        disabled
+        """
+        settings = crawler.settings
+
+        if not settings.getbool('BACKEND_STORE'):
+            raise NotConfigured
+
+        return cls(crawler, settings.get('BACKEND_SYNC_URL', Sync.URL.value),
+                   settings.getbool('BACKEND_VERBOSE'),
+                   settings.getint('BACKEND_MAX_IN_FLIGHT',
+                                   Backend.MAX_IN_FLIGHT.value),
+                   deactivate = settings.getbool('BACKEND_DEACTIVATE', True))
+
+
+    def open_spider(self):
+        """
+        Opens the fingerprint store of the spider's run
+        """
+        self.fingerprints = FingerprintStore(self.fingerprints_path)
+
+
+    def _finish_batch(self, result):
+        """
+        Counts a finished upload and gives back its slot
+        """
+        if isinstance(result, Failure):
+            self.crawler.spider.logger.error('Could not upload a batch: '
+                                             f'{result.getErrorMessage()}')
+
+        if result is True:
+            self.stats.inc_value('backend/batches_sent')
+        else:
+            self.stats.inc_value('backend/batches_failed')
+
+        self.slots.release()
+
+
+    def _send(self, body):
+        """
+        Sends a batch once an upload slot is free. Returns a Deferred that
+        fires when the upload started
+        """
+        done = defer.Deferred()
+        self.pending.append(done)
+
+        def start(_):
+            upload = threads.deferToThread(uploads.upload_batch, body,
+                                           self.endpoint, self.verbose,
+                                           Backend.SPOOL_PATH.value,
+                                           self.crawler.spider.name)
+            upload.addBoth(self._finish_batch)
+            upload.chainDeferred(done)
+
+        if not self.slots.tokens:
+            self.stats.inc_value('backend/waited_for_slot')
+
+        return self.slots.acquire().addCallback(start)
+
+
+    def process_item(self, item):
+        """
+        Validates the item and adds it to the current batch if it is new or
+        changed. The item is held while its full batch waits for a free upload
+        slot
+        """
+        record = dict(item)
+        error = validate_record(record)
+
+        if error:
+            self.stats.inc_value('backend/invalid_items')
+            raise DropItem(f'Not storing {record.get("url")}: {error}')
+
+        for changed in self.fingerprints.diff([record]):
+            body = self.buffer.add(changed)
+
+            if body:
+                return self._send(body).addCallback(lambda _: item)
+
+        return item
+
+
+    def close_spider(self):
+        """
+        Sends the deactivation of the items that disappeared and the last
+        batch, and waits for every upload to finish. Returns a Deferred
+        """
+        disappeared = self.fingerprints.disappeared() if self.deactivate \
+                      else []
+
+        for record in disappeared:
+            body = self.buffer.add(record)
+
+            if body:
+                self._send(body)
+
+        body = self.buffer.flush()
+
+        if body:
+            self._send(body)
+
+        deferred = defer.DeferredList(self.pending)
+        deferred.addCallback(lambda _: self._close_fingerprints())
+
+        return deferred
+
+
+    def _close_fingerprints(self):
+        """
+        Makes the run the new baseline if every batch was sent, and prints the
+        results of the synchronization
+        """
+        sent = self.stats.get_value('backend/batches_sent', 0)
+        failed = self.stats.get_value('backend/batches_failed', 0)
+
+        try:
+            if failed:
+                self.fingerprints.rollback()
+            else:
+                self.fingerprints.commit()
+        finally:
+            self.fingerprints.close()
+
+        delta = self.fingerprints.stats
+        name = self.crawler.spider.name
+
+        print(f'{name}: {delta["new"]} new, {delta["changed"]} changed, '
+              f'{delta["disappeared"]} disappeared and {delta["unchanged"]} '
+              'unchanged records')
+        print(f'{name}: stored while crawling in {sent} batches, '
+              f'{failed} failed')
+
+        if failed:
+            print(f'The failed batches were saved to {Backend.SPOOL_PATH.value}'
+                  '. Use --replay to send them again')
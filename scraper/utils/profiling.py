@@ -0,0 +1,186 @@
+"""
+This module contains the sampling profiler of the scraper's runs. It samples
+the stack of every thread at a fixed interval, and attributes each sample to
+the stage it belongs to (network wait, browser wait, XPath parsing, JSON
+serialization, idle or other code), so that the cost of each stage can be
+told apart even when they are interleaved in the same threads (such as the
+reactor's). The samples are written as collapsed stacks, the format read by
+flamegraph tools
+"""
+import os
+import sys
+import threading
+from .constants import ProfileConfig as Profile
+
+
+def _get_frame_name(frame):
+    """
+    Returns the name of a frame's function in the collapsed stacks, with the
+    last two components of its file's path and the line it starts at, as in
+    parse_product (utils/spiders.py:311)
+    """
+    code = frame.f_code
+    path = code.co_filename.replace('\\', '/')
+    short_path = '/'.join(path.split('/')[-2:])
+    name = f'{code.co_name} ({short_path}:{code.co_firstlineno})'
+
+    return name.replace(';', ':')
+
+
+def get_stage(paths, frame_stages = Profile.FRAME_STAGES.value,
+              leaf_stages = Profile.LEAF_STAGES.value):
+    """
+    Returns the stage of a sampled stack, given the file paths of its frames
+    (from the outermost to the innermost one): the first of the frame stages
+    any of its frames belongs to or, if there is none, the leaf stage its
+    innermost frame belongs to ('other' if neither)
+    """
+    for stage, patterns in frame_stages:
+        if any(pattern in path for path in paths for pattern in patterns):
+            return stage
+
+    for stage, patterns in leaf_stages:
+        if paths and any(pattern in paths[-1] for pattern in patterns):
+            return stage
+
+    return 'other'
+
+
+class SamplingProfiler:
+    """
+    Profiler that samples the stacks of every thread but its own from a
+    background thread, every interval seconds. The samples are counted by
+    stage and stack
+    """
+
+    def __init__(self, interval = Profile.INTERVAL.value):
+        """
+        Constructor that sets the seconds between samples
+        """
+        self.interval = interval
+        self.samples = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+
+    def _sample(self):
+        """
+        Counts the current stack of every other thread
+        """
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.thread.ident:
+                continue
+
+            frames = []
+
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+
+            frames.reverse()
+            stage = get_stage([frame.f_code.co_filename.replace('\\', '/')
+                               for frame in frames])
+            key = (stage, tuple(_get_frame_name(frame) for frame in frames))
+            self.samples[key] = self.samples.get(key, 0) + 1
+
+
+    def _run(self):
+        """
+        Samples the threads until stopped
+        """
+        while not self.stopped.wait(self.interval):
+            self._sample()
+
+
+    def start(self):
+        """
+        Starts sampling, discarding any previous samples
+        """
+        self.samples = {}
+        self.stopped.clear()
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+
+
+    def stop(self):
+        """
+        Stops sampling
+        """
+        if self.thread:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+
+    def get_stage_counts(self):
+        """
+        Returns a dictionary that maps every sampled stage to its number of
+        samples
+        """
+        counts = {}
+
+        for (stage, _), count in self.samples.items():
+            counts[stage] = counts.get(stage, 0) + count
+
+        return counts
+
+
+    def write(self, directory = Profile.DIRECTORY.value):
+        """
+        Writes the collapsed stacks of every stage to <stage>.folded in the
+        directory, and the ones of the whole run (rooted at their stage) to
+        stacks.folded. Returns the paths of the written files
+        """
+        os.makedirs(directory, exist_ok = True)
+        lines = {}
+
+        for (stage, stack), count in sorted(self.samples.items()):
+            lines.setdefault(stage, []).append(f'{";".join(stack)} {count}')
+            lines.setdefault(None, []).append(f'{stage};{";".join(stack)} '
+                                              f'{count}')
+
+        paths = []
+
+        for stage, stage_lines in lines.items():
+            path = f'{directory}/{stage or "stacks"}.folded'
+
+            with open(path, 'w', encoding = 'utf-8') as folded_file:
+                folded_file.write('\n'.join(stage_lines) + '\n')
+
+            paths.append(path)
+
+        return paths
+
+
+    def print_report(self, top = Profile.TOP_FUNCTIONS.value):
+        """
+        Prints the share of the samples of every stage (the idle samples
+        aside) and the functions where each stage spends most of them
+        """
+        counts = self.get_stage_counts()
+        busy = sum(count for stage, count in counts.items() if stage != 'idle')
+
+        print(f'\n{"*" * 70}')
+        print('Profile report\n')
+
+        for stage, count in sorted(counts.items(), key = lambda item: -item[1]):
+            share = f' ({count / busy:.1%})' if busy and stage != 'idle' \
+                    else ''
+            print(f'{stage}: {count} samples, {count * self.interval:.1f} '
+                  f'thread-seconds{share}')
+
+            functions = {}
+
+            for (sample_stage, stack), stack_count in self.samples.items():
+                if sample_stage == stage and stack:
+                    functions[stack[-1]] = functions.get(stack[-1], 0) + \
+                                           stack_count
+
+            for function, function_count in sorted(
+                    functions.items(), key = lambda item: -item[1])[:top]:
+                print(f'    {function_count:>6} {function}')
+
+        print(f'{"*" * 70}\n')
+
+
+PROFILER = SamplingProfiler()
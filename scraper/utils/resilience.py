@@ -0,0 +1,271 @@
+"""
+This module contains the per-host resilience policy of the scraper's requests:
+retries with backoff (following Retry-After), a circuit breaker that pauses a
+host after repeated failures, and per-host error metrics
+"""
+import time
+import random
+import asyncio
+import requests
+import threading
+import email.utils
+from .engine import ENGINE
+from .limiters import get_host
+from .constants import ResilienceConfig as Resilience
+
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of sending a request to a host whose circuit is open
+    """
+
+
+def get_backoff(attempt, base, ceiling):
+    """
+    Returns the seconds to wait before the specified retry attempt: exponential
+    backoff with full jitter, bounded by the ceiling
+    """
+    return random.uniform(0, min(ceiling, base * 2 ** attempt))
+
+
+def get_retry_after(response):
+    """
+    Returns the seconds requested by the response's Retry-After header (either
+    a number of seconds or an HTTP date), or None if it has no valid one
+    """
+    value = response.headers.get('Retry-After')
+
+    if not value:
+        return None
+
+    if value.strip().isdigit():
+        return int(value)
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0, date.timestamp() - time.time())
+
+
+def is_failure(response):
+    """
+    Indicates whether a response means that the host is failing or overloaded
+    (rate limiting or server errors)
+    """
+    return response.status_code == 429 or response.status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a host. It opens after failure_threshold consecutive
+    failures, rejecting requests during the cooldown; then lets a single probe
+    request through (half-open) and closes again if it succeeds
+    """
+
+    def __init__(self, failure_threshold, cooldown):
+        """
+        Constructor that initializes a closed circuit
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+
+    def allow(self):
+        """
+        Indicates whether a request can be sent to the host now
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+
+            if self.probing or \
+               time.monotonic() - self.opened_at < self.cooldown:
+                return False
+
+            self.probing = True
+            return True
+
+
+    def record_success(self):
+        """
+        Closes the circuit after a successful request
+        """
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+
+    def record_failure(self):
+        """
+        Counts a failed request, and returns True if it opened the circuit
+        """
+        with self.lock:
+            self.failures += 1
+            was_closed = self.opened_at is None
+
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.probing = False
+                return was_closed
+
+            return False
+
+
+class ResiliencePolicy:
+    """
+    Registry of the hosts' circuit breakers and error metrics, that sends
+    requests through the fetch engine retrying the idempotent ones
+    """
+
+    def __init__(self, max_retries, backoff_base, backoff_max,
+                 failure_threshold, cooldown):
+        """
+        Constructor that sets up the retry and circuit breaker settings
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.breakers = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+
+    def _get_breaker(self, host):
+        """
+        Returns the circuit breaker of the host, creating it if needed
+        """
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.failure_threshold,
+                                                     self.cooldown)
+
+            return self.breakers[host]
+
+
+    def _count(self, host, metric):
+        """
+        Increments one of the host's metrics
+        """
+        with self.lock:
+            stats = self.stats.setdefault(host, { 'requests': 0, 'retries': 0,
+                                                  'errors': 0, 'rejected': 0,
+                                                  'circuit_opened': 0,
+                                                  'statuses': {} })
+            stats[metric] += 1
+
+
+    def _record_failure(self, host, breaker, error):
+        """
+        Counts a failed request by its error (exception name or status code),
+        and reports it to the host's circuit breaker
+        """
+        self._count(host, 'errors')
+
+        with self.lock:
+            statuses = self.stats[host]['statuses']
+            statuses[error] = statuses.get(error, 0) + 1
+
+        if breaker.record_failure():
+            self._count(host, 'circuit_opened')
+
+
+    def _get_wait(self, attempt, response):
+        """
+        Returns the seconds to wait before retrying, honoring Retry-After
+        """
+        retry_after = get_retry_after(response) if response is not None \
+                      else None
+
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+
+        return get_backoff(attempt, self.backoff_base, self.backoff_max)
+
+
+    async def fetch(self, method, url, **kwargs):
+        """
+        Sends a request through the fetch engine. Idempotent requests are
+        retried up to max_retries times on connection errors, 429 and 5xx
+        responses. Raises CircuitOpenError if the host's circuit is open
+
+        Returns the last response obtained, which can still be a failed one
+        """
+        host = get_host(url)
+        breaker = self._get_breaker(host)
+        retries = self.max_retries if method in IDEMPOTENT_METHODS else 0
+
+        for attempt in range(0, retries + 1):
+            if not breaker.allow():
+                self._count(host, 'rejected')
+                raise CircuitOpenError(f'The circuit of {host} is open, the '
+                                       f'request to {url} was not sent')
+
+            self._count(host, 'requests')
+            response = None
+
+            try:
+                response = await ENGINE.fetch(method, url, **kwargs)
+            except requests.RequestException as exception:
+                self._record_failure(host, breaker, type(exception).__name__)
+
+                if attempt == retries:
+                    raise
+            else:
+                if not is_failure(response):
+                    breaker.record_success()
+                    return response
+
+                self._record_failure(host, breaker, response.status_code)
+
+                if attempt == retries:
+                    return response
+
+            self._count(host, 'retries')
+            await asyncio.sleep(self._get_wait(attempt + 1, response))
+
+
+    def report(self):
+        """
+        Returns a copy of the per-host error metrics
+        """
+        with self.lock:
+            return { host: dict(stats, statuses = dict(stats['statuses']))
+                     for host, stats in self.stats.items() }
+
+
+    def print_report(self):
+        """
+        Prints the per-host error metrics
+        """
+        print(f'\n{"*" * 70}')
+        print('Resilience report (requests, retries, errors, rejected)\n')
+
+        for host, stats in sorted(self.report().items()):
+            print(f'{host or "(local)"}: {stats["requests"]} requests, '
+                  f'{stats["retries"]} retries, {stats["errors"]} errors, '
+                  f'{stats["rejected"]} rejected, circuit opened '
+                  f'{stats["circuit_opened"]} times')
+
+            for error, count in stats['statuses'].items():
+                print(f'    {error}: {count}')
+
+        print(f'{"*" * 70}\n')
+
+
+RESILIENCE = ResiliencePolicy(Resilience.MAX_RETRIES.value,
+                              Resilience.BACKOFF_BASE.value,
+                              Resilience.BACKOFF_MAX.value,
+                              Resilience.FAILURE_THRESHOLD.value,
+                              Resilience.COOLDOWN.value)
@@ -0,0 +1,227 @@
+"""
+This module contains the store of the product pages already fetched by the
+spiders. It keeps, in a sqlite database, when each product URL was last fetched,
+the fingerprint its listing showed for it and the item scraped from it, so that
+the pages that are still fresh don't have to be downloaded again
+
+It also keeps the change history of every product (how many times its price
+was checked and how many times it changed), from which the recrawl scheduler
+estimates how likely each page is to be stale
+"""
+import json
+import math
+import time
+import hashlib
+from .stores import SQLiteStore
+from .constants import SeenConfig as Seen
+
+
+COLUMNS = ('source', 'fingerprint', 'fetched_at', 'item', 'first_fetched_at',
+           'checks', 'changes')
+
+
+def get_listing_fingerprint(*values):
+    """
+    Returns the fingerprint of the values a listing shows for a product (such
+    as its name and price), which changes whenever any of them does
+    """
+    serialized = json.dumps(values, sort_keys = True, default = str)
+
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()[:16]
+
+
+def get_change_rate(changes, seconds,
+                    prior_interval = Seen.PRIOR_CHANGE_INTERVAL.value):
+    """
+    Returns the estimated price changes per second of a product whose price
+    changed the specified number of times over the seconds it was observed.
+    The estimate starts from a prior of one change every prior_interval
+    seconds, so a product seen only once isn't taken for one that never
+    changes
+    """
+    return (changes + 1) / (seconds + prior_interval)
+
+
+def get_staleness(rate, age):
+    """
+    Returns the probability that a page fetched age seconds ago changed since
+    then, for a product that changes at the specified rate
+    """
+    return 1 - math.exp(-rate * age)
+
+
+class SeenStore(SQLiteStore):
+    """
+    On-disk store of the fetched product pages, keyed by URL. The pages
+    recorded during a run are buffered in memory and written to the disk in
+    batches of flush_size pages, so that the spiders seldom wait for the disk
+    and the buffer doesn't grow with the catalogue. Only the URLs recorded
+    since the last commit are kept for the whole run
+    """
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, '
+              'source TEXT, fingerprint TEXT, fetched_at REAL, item TEXT, '
+              'first_fetched_at REAL, checks INTEGER, changes INTEGER)')
+
+    def __init__(self, path, flush_size = Seen.FLUSH_SIZE.value):
+        """
+        Constructor that sets the path of the store's database, which is
+        opened (or created) the first time it is used
+        """
+        super().__init__(path)
+        self.flush_size = flush_size
+        self.pending = {}
+        self.recorded = set()
+
+
+    def _get_page(self, url):
+        """
+        Returns the stored columns of the URL's page as a dictionary (with the
+        item still serialized), or None if it was never fetched. The lock must
+        be held
+        """
+        if url in self.pending:
+            return self.pending[url]
+
+        row = self.connection.execute(f'SELECT {", ".join(COLUMNS)} FROM '
+                                      'pages WHERE url = ?', (url,)).fetchone()
+
+        return dict(zip(COLUMNS, row)) if row else None
+
+
+    def get(self, url):
+        """
+        Returns the fingerprint, fetch time and item of the URL's page as a
+        dictionary, or None if it was never fetched
+        """
+        with self.lock:
+            page = self._get_page(url)
+
+        if not page:
+            return None
+
+        return { 'fingerprint': page['fingerprint'],
+                 'fetched_at': page['fetched_at'],
+                 'item': json.loads(page['item']) }
+
+
+    def record(self, url, item, fingerprint = None, source = None):
+        """
+        Records that the URL was fetched now, together with the item scraped
+        from it and its listing fingerprint. A price different from the one of
+        the previous fetch counts as a change in the product's history (a URL
+        recorded twice before a commit counts once)
+        """
+        serialized = json.dumps(item)
+
+        with self.lock:
+            page = self._get_page(url)
+            now = time.time()
+
+            if url in self.recorded:
+                page = dict(page, fingerprint = fingerprint, item = serialized)
+            elif page:
+                changed = json.loads(page['item']).get('price') != \
+                          item.get('price')
+                page = dict(page, fingerprint = fingerprint, fetched_at = now,
+                            item = serialized, checks = page['checks'] + 1,
+                            changes = page['changes'] + changed)
+            else:
+                page = { 'source': source, 'fingerprint': fingerprint,
+                         'fetched_at': now, 'item': serialized,
+                         'first_fetched_at': now, 'checks': 0, 'changes': 0 }
+
+            self.pending[url] = page
+            self.recorded.add(url)
+
+            if len(self.pending) >= self.flush_size:
+                self._flush()
+
+
+    def get_due(self, source, min_age, budget = None):
+        """
+        Returns the pages of the source that are due to be fetched again, as a
+        dictionary that maps their URLs to their expected staleness: the
+        budget pages (all of them if there is no budget) with the highest
+        expected staleness among the ones fetched at least min_age seconds ago
+        """
+        now = time.time()
+
+        with self.lock:
+            rows = self.connection.execute('SELECT url, fetched_at, '
+                                           'first_fetched_at, changes FROM '
+                                           'pages WHERE source = ?',
+                                           (source,)).fetchall()
+            pages = { url: (fetched_at, first_fetched_at, changes)
+                      for url, fetched_at, first_fetched_at, changes in rows }
+            pages.update({ url: (page['fetched_at'], page['first_fetched_at'],
+                                 page['changes'])
+                           for url, page in self.pending.items()
+                           if page['source'] == source })
+
+        staleness = {}
+
+        for url, (fetched_at, first_fetched_at, changes) in pages.items():
+            if now - fetched_at >= min_age:
+                rate = get_change_rate(changes, fetched_at - first_fetched_at)
+                staleness[url] = get_staleness(rate, now - fetched_at)
+
+        ranked = sorted(staleness, key = staleness.get, reverse = True)
+
+        return { url: staleness[url] for url in ranked[:budget or None] }
+
+
+    def _flush(self):
+        """
+        Writes the buffered pages to the disk. The lock must be held
+        """
+        with self.connection:
+            self.connection.executemany('REPLACE INTO pages VALUES '
+                                        '(?, ?, ?, ?, ?, ?, ?, ?)',
+                                        [(url, *[page[column] for column
+                                                 in COLUMNS])
+                                         for url, page
+                                         in self.pending.items()])
+
+        self.pending = {}
+
+
+    def commit(self):
+        """
+        Writes the pages recorded since the last commit to the disk, and ends
+        the run: a URL recorded again counts as a new check of its product
+        """
+        with self.lock:
+            self._flush()
+            self.recorded = set()
+
+
+    def print_report(self, sources):
+        """
+        Prints, for each of the sources, how many of its products are tracked,
+        how many of them changed their price at least once and how many are
+        expected to be stale by now
+        """
+        now = time.time()
+
+        print(f'\n{"*" * 70}')
+        print('Recrawl report\n')
+
+        with self.lock:
+            for source in sources:
+                rows = self.connection.execute('SELECT fetched_at, '
+                                               'first_fetched_at, changes '
+                                               'FROM pages WHERE source = ?',
+                                               (source,)).fetchall()
+                changing = sum(1 for row in rows if row[2])
+                stale = sum(get_staleness(get_change_rate(row[2],
+                                                          row[0] - row[1]),
+                                          now - row[0]) for row in rows)
+
+                print(f'{source}: {len(rows)} products tracked, {changing} '
+                      f'changed their price, {stale:.0f} expected to be '
+                      'stale')
+
+        print(f'{"*" * 70}\n')
+
+
+SEEN = SeenStore(Seen.PATH.value)
@@ -0,0 +1,136 @@
+"""
+This module contains the registry of the sites' extraction rules. Every rule is
+an XPath expression declared once, and is compiled the first time a spider of
+its site asks for it, so that the spiders don't build and compile them again
+for every response
+"""
+import threading
+from lxml import etree
+from .constants import OLXConfig as OLX, ColombiaGamerConfig as CGamer
+from .constants import GamePlanetConfig as GamePl, MixUpConfig as MU
+from .constants import SearsConfig as SEA
+
+
+RULES = {
+    OLX.SPIDER_NAME.value: {
+        'name': f'//section[@class="{OLX.RIGHT_SECT_CLASS.value}"]/h1/text()',
+        'description': f'//section[@class="{OLX.LEFT_SECT_CLASS.value}"]//p/'
+                       'text()',
+        'price': f'//section[@class="{OLX.RIGHT_SECT_CLASS.value}"]//span/'
+                 'text()',
+        'image': f'//div[contains(@class, "{OLX.IMG_DIV_CLASS.value}")]//img/'
+                 '@src'
+    },
+    CGamer.SPIDER_NAME.value: {
+        'products': f'//div[contains(@class, "{CGamer.ITEM_CLASS.value}")]//'
+                    'h2/a/@href',
+        'name': f'//div[@class="{CGamer.TITLE_CLASS.value}"]//h2/text()',
+        'short_description': f'//div[@class="{CGamer.SHORT_DESC_CLASS.value}"]'
+                             '/*',
+        'description': f'//div[@class="{CGamer.DESC_CLASS.value}"]/*',
+        'price': f'//span[@class="{CGamer.PRICE_CLASS.value}"]/text()',
+        'image': f'//div[@class="{CGamer.IMG_CLASS.value}"]//img/@src'
+    },
+    GamePl.SPIDER_NAME.value: {
+        'products': f'//div[contains(@class, "{GamePl.ITEM_CLASS.value}")]/'
+                    'div[@class = "row"]/div/a/@href',
+        'name': f'normalize-space(//h1[@class="{GamePl.TITLE_CLASS.value}"])',
+        'description': f'normalize-space(//div[@class="'
+                       f'{GamePl.DESC_CLASS.value}"])',
+        'price': f'normalize-space(//div[contains(@class, "'
+                 f'{GamePl.PRICE_CLASS.value}")]//span)',
+        'image': f'//img[@id = "{GamePl.IMAGE_ID.value}"]/@src',
+        'tag': f'normalize-space(//span[@class = "{GamePl.TAG_CLASS.value}"])'
+    },
+    SEA.SPIDER_NAME.value: {
+        'products': f'//div[@class = "{SEA.ITEM_CLASS.value}"]/a[@class = '
+                    f'"{SEA.LINK_CLASS.value}"]/@href',
+        'name': f'//div[@class = "{SEA.TITLE_CLASS.value}"]/h1/text()',
+        'description': f'//div[@class = "{SEA.DESC_CLASS.value} '
+                       'yotpo-main-widget"]/@data-description',
+        'price': f'//p[@class = "{SEA.PRICE_CLASS.value}"]/text()',
+        'image': f'//ul[contains(@class, "{SEA.IMAGE_CLASS.value}")]/li/img/'
+                 '@src',
+        'tag': '//div[@class = "breadcrumb"]/ul/li[3]/a/text()'
+    },
+    MU.SPIDER_NAME.value: {
+        'products': f'//div[@class = "{MU.ITEM_CLASS_1.value}"]/div[@class = '
+                    f'"{MU.ITEM_CLASS_2.value}"]/a/@href',
+        'name': f'//div[@class="{MU.TITLE_CLASS.value}"]/text()',
+        'description': f'//div[@class="{MU.DESC_CLASS.value}"]//div[@class = '
+                       '"texto"]/text()',
+        'price': f'//span[contains(@class, "{MU.PRICE_CLASS.value}")]/text()',
+        'image': f'//img[@id="{MU.IMAGE_ID.value}"]/@src',
+        'tag': '//div[@id = "ctl00_container_PanelAutor"]/div[@class = '
+               '"titulo"]/text()'
+    }
+}
+
+
+class SiteSelectors:
+    """
+    Compiled extraction rules of a site, which are evaluated on the parsed
+    document of a scrapy response
+    """
+
+    def __init__(self, rules):
+        """
+        Constructor that compiles every rule
+        """
+        self.xpaths = { field: etree.XPath(rule, smart_strings = False)
+                        for field, rule in rules.items() }
+
+
+    def get_all(self, response, field):
+        """
+        Returns the list of strings matched by the field's rule: the texts and
+        attribute values as they are, and the elements as HTML
+        """
+        result = self.xpaths[field](response.selector.root)
+
+        if not isinstance(result, list):
+            return [str(result)]
+
+        return [node if isinstance(node, str) else
+                etree.tostring(node, method = 'html', encoding = 'unicode',
+                               with_tail = False)
+                for node in result]
+
+
+    def get(self, response, field, default = None):
+        """
+        Returns the first string matched by the field's rule, or the default
+        value if there is none
+        """
+        results = self.get_all(response, field)
+
+        return results[0] if results else default
+
+
+class SelectorRegistry:
+    """
+    Registry of the sites' extraction rules, that compiles the rules of a site
+    only once and shares them with every spider of the process
+    """
+
+    def __init__(self, rules):
+        """
+        Constructor that keeps the rules of every site, keyed by spider name
+        """
+        self.rules = rules
+        self.selectors = {}
+        self.lock = threading.Lock()
+
+
+    def get(self, site):
+        """
+        Returns the compiled selectors of the site
+        """
+        with self.lock:
+            if site not in self.selectors:
+                self.selectors[site] = SiteSelectors(self.rules[site])
+
+            return self.selectors[site]
+
+
+SELECTORS = SelectorRegistry(RULES)
@@ -1,70 +1,267 @@
 """
 This module contains all the scrapy spiders for the scraper module
 """
-import time
+import re
+import json
+import math
 import scrapy
-from selenium import webdriver
+import unicodedata
+import urllib.parse
 from .constants import SITE_IDS, BRAND_IDS, SearsConfig as SEA
 from .constants import OLXConfig as OLX, ColombiaGamerConfig as CGamer
 from .constants import GamePlanetConfig as GamePl, MixUpConfig as MU
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import TimeoutException
 from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import NoSuchElementException
+from .limiters import LIMITER
+from .exporters import get_export_path
+from .pagination import get_page_urls
+from .selectors import SELECTORS
+from .checkpoints import get_job_dir
+from .seen import get_listing_fingerprint
+
+
+DOWNLOADER_MIDDLEWARES = {
+    f'{__package__}.middlewares.ArchiveMiddleware': 540,
+    f'{__package__}.middlewares.RateLimitMiddleware': 543,
+    f'{__package__}.middlewares.ConcurrencyMiddleware': 950,
+    f'{__package__}.middlewares.FetchMetricsMiddleware': 955
+}
+BROWSER_DOWNLOADER_MIDDLEWARES = {
+    **DOWNLOADER_MIDDLEWARES,
+    f'{__package__}.middlewares.BrowserMiddleware': 960
+}
+SPIDER_MIDDLEWARES = {
+    f'{__package__}.middlewares.SeenUrlMiddleware': 545,
+    f'{__package__}.middlewares.ParseMetricsMiddleware': 950
+}
+ITEM_PIPELINES = {
+    f'{__package__}.pipelines.BackendPipeline': 300
+}
+FEED_STORAGES = {
+    '': f'{__package__}.exporters.FileFeedStorage',
+    'file': f'{__package__}.exporters.FileFeedStorage'
+}
+
+
+def _get_feeds(export_file_path):
+    """
+    Returns the FEEDS setting that exports the scraped items to the specified
+    path as JSON Lines, one item at a time
+    """
+    return {
+        get_export_path(export_file_path): {
+            'format': 'jsonlines',
+            'encoding': 'utf-8',
+            'fields': ['id_type_product', 'id_ecommerce', 'name',
+                       'description', 'price', 'image', 'url']
+        }
+    }
+
+
+class SiteSpider(scrapy.Spider):
+    """
+    Base spider of the scraped sites, that gets the compiled extraction rules
+    of its site from the selector registry
+
+    If the PERSIST_JOB_STATE setting is enabled, the spider's pending requests
+    and seen URLs are persisted in its own job directory, so that an
+    interrupted crawl can be resumed
+    """
+
+    @classmethod
+    def update_settings(cls, settings):
+        """
+        Applies the spider's custom settings, and its job directory if needed
+        """
+        super().update_settings(settings)
+
+        if settings.getbool('PERSIST_JOB_STATE'):
+            settings.set('JOBDIR', get_job_dir(cls.name), priority = 'spider')
+
+
+    def __init__(self, *args, **kwargs):
+        """
+        Constructor that looks up the site's selectors by the spider's name
+        """
+        super().__init__(*args, **kwargs)
+        self.selectors = SELECTORS.get(self.name)
+
+
+    async def start(self):
+        """
+        Requests the start URLs. The spiders that need other start requests
+        (such as the ones rendered by a browser) override it
+        """
+        for url in self.start_urls:
+            yield scrapy.Request(url, dont_filter = True)
+
+
+def _get_olx_brand(url):
+    """
+    Returns the brand id of an OLX listing, according to its URL
+    """
+    if 'ps4' in url or 'playstation' in url:
+        return BRAND_IDS['playstation']
+    elif 'nintendo' in url or 'switch' in url:
+        return BRAND_IDS['nintendo']
+    elif 'xbox' in url:
+        return BRAND_IDS['xbox']
+
+    return None
 
 
-class OLXSpider(scrapy.Spider):
+def _get_olx_api_url(listing_url, page, api_url = OLX.API_URL.value):
+    """
+    Returns the URL of a page of the json data of an OLX listing, whose search
+    query is the listing URL's last segment (as in .../q-xbox-one)
+    """
+    query = listing_url.rstrip('/').split('/')[-1]
+    query = re.sub(r'^q-', '', query).replace('-', ' ')
+    params = urllib.parse.urlencode({ 'category': OLX.CATEGORY_ID.value,
+                                      'query': query, 'page': page,
+                                      'size': OLX.PAGE_SIZE.value })
+
+    return f'{api_url}?{params}'
+
+
+def _get_olx_item_url(item, item_url = OLX.ITEM_URL.value):
+    """
+    Returns the URL of the product page of an item of OLX's listing json data,
+    which is made of its title's slug and its id
+    """
+    title = unicodedata.normalize('NFKD', item.get('title', ''))
+    slug = re.sub(r'[^a-z0-9]+', '-',
+                  title.encode('ascii', 'ignore').decode().lower()).strip('-')
+
+    return f'{item_url}/{slug}-iid-{item["id"]}'
+
+
+class OLXSpider(SiteSpider):
     """
     This Spider scraps products from the OLX e-commerce site
     """
     name = OLX.SPIDER_NAME.value
     custom_settings = {
-        'FEEDS': {
-            OLX.EXPORT_FILE_PATH.value: {
-                'format': 'json',
-                'encoding': 'utf-8',
-                'fields': ['id_type_product', 'id_ecommerce', 'name',
-                           'description', 'price', 'image', 'url'],
-                'indent': 4
-            }
-        },
+        'FEEDS': _get_feeds(OLX.EXPORT_FILE_PATH.value),
+        'CONCURRENT_REQUESTS': OLX.MAX_CONCURRENCY.value,
+        'SEEN_TTL': OLX.SEEN_TTL.value,
+        'RECRAWL_BUDGET': OLX.RECRAWL_BUDGET.value,
+        'FEED_STORAGES': FEED_STORAGES,
+        'SPIDER_MIDDLEWARES': SPIDER_MIDDLEWARES,
+        'ITEM_PIPELINES': ITEM_PIPELINES,
         'FEED_EXPORT_ENCODING': 'utf-8',
-        'DEPTH_LIMIT': 1,
-        'AUTOTHROTTLE_ENABLED': True
+        'AUTOTHROTTLE_ENABLED': True,
+        'DOWNLOADER_MIDDLEWARES': BROWSER_DOWNLOADER_MIDDLEWARES
     }
 
-    def __init__(self, *args, **kwargs):
-        """
-        Constructor that initializes the Spider instance and sets it up
-        """
-        super().__init__(*args, **kwargs)
-        chrome_options = Options()  
-        chrome_options.add_argument("--headless")
-        self.driver = webdriver.Chrome(ChromeDriverManager().install(),
-        chrome_options=chrome_options)
+    use_browser = OLX.USE_BROWSER.value
+    api_url = OLX.API_URL.value
+    item_url = OLX.ITEM_URL.value
 
-    @classmethod
-    def from_crawler(cls, crawler, *args, **kwargs):
+    async def start(self):
         """
-        This method connects the Spider with a termination signal in order to
-        automatically execute operations when the Spider closes
+        Requests the listings. By default their items are paged through OLX's
+        listing data source (a json endpoint); if use_browser is set (either in
+        OLXConfig or as a spider argument) the listing pages are rendered by a
+        browser which loads all of their items instead
+
+        The api_url and item_url spider arguments replace the addresses of the
+        listing data source and of the product pages
         """
-        spider = super(OLXSpider, cls).from_crawler(crawler, *args, **kwargs)
-        crawler.signals.connect(spider.spider_closed,
-                                signal = scrapy.signals.spider_closed)
-        return spider
+        for url in self.start_urls:
+            if self.use_browser:
+                yield scrapy.Request(url, dont_filter = True,
+                                     meta = { 'browser': 'load_all_items' })
+            else:
+                yield scrapy.Request(_get_olx_api_url(url, 0, self.api_url),
+                                     callback = self.parse_listing,
+                                     meta = { 'listing_url': url, 'page': 0 })
 
 
-    def spider_closed(self, spider):
+    def load_all_items(self, driver):
         """
-        Function that is called in the moment of Spider termination. The Spider
-        calls it's Selenium driver quit method
+        Browser action that clicks the listing's "load more" button until every
+        item is shown (or MAX_PAGES pages were loaded), and returns the URLs of
+        the items
+
+        The links are harvested as the items are loaded, and each click waits
+        for the number of items to change instead of a fixed time
         """
-        self.driver.close()
-        spider.driver.quit()
+        button_xp = f'//button[@data-aut-id="{OLX.BTN_CLASS.value}"]'
+        product_xp = f'//li[@data-aut-id="{OLX.ITEM_CLASS.value}"]/a[@href]'
+        product_urls = []
+
+        def harvest():
+            a_tags = driver.find_elements_by_xpath(product_xp)
+            product_urls.extend(a.get_attribute('href') for a
+                                in a_tags[len(product_urls):])
+
+        try:
+            WebDriverWait(driver, OLX.DRIVER_TIMEOUT.value).until(
+                EC.presence_of_element_located((By.XPATH, button_xp))
+            )
+        except TimeoutException:
+            self.logger.debug('The page took too long to load. '
+                              'Reached timeout.')
+
+        harvest()
+
+        for _ in range(1, OLX.MAX_PAGES.value):
+            try:
+                driver.find_element_by_xpath(button_xp).click()
+                WebDriverWait(driver, OLX.DRIVER_TIMEOUT.value).until(
+                    lambda driver: len(driver.find_elements_by_xpath(
+                        product_xp)) > len(product_urls)
+                )
+            except (NoSuchElementException, StaleElementReferenceException,
+                    TimeoutException):
+                break
+
+            harvest()
+            LIMITER.acquire(driver.current_url)
+
+        return product_urls
+
+
+    def parse_listing(self, response):
+        """
+        Schedules the product pages of a page of the listing's json data, and
+        the listing's following pages. Once the first page reports the total
+        number of items, the rest of the pages are requested at once
+        """
+        data = json.loads(response.text)
+        items = data.get('data') or []
+        total = (data.get('metadata') or {}).get('total_ads')
+        listing_url = response.meta['listing_url']
+        page = response.meta['page']
+        brand = _get_olx_brand(listing_url)
+
+        for item in items:
+            fingerprint = get_listing_fingerprint(item.get('title'),
+                                                  item.get('price'))
+            yield response.follow(_get_olx_item_url(item, self.item_url),
+                                  callback = self.parse_product,
+                                  meta = { 'brand': brand,
+                                           'listing_fingerprint': fingerprint })
+
+        if total is not None:
+            pages = range(page + 1, min(math.ceil(total / OLX.PAGE_SIZE.value),
+                                        OLX.MAX_PAGES.value)) if page == 0 \
+                    else []
+        else:
+            pages = [page + 1] if len(items) == OLX.PAGE_SIZE.value and \
+                    page + 1 < OLX.MAX_PAGES.value else []
+
+        for next_page in pages:
+            yield scrapy.Request(_get_olx_api_url(listing_url, next_page,
+                                                  self.api_url),
+                                 callback = self.parse_listing,
+                                 meta = { 'listing_url': listing_url,
+                                          'page': next_page })
 
 
     def parse_product(self, response):
@@ -72,25 +269,13 @@ class OLXSpider(scrapy.Spider):
         Retrieves product information from the product detail page, and exports
         it to the output json
         """
-        self.log(f'>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<')
+        self.logger.debug(f'>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<')
 
-        name_xp = f'//section[@class="{OLX.RIGHT_SECT_CLASS.value}"]/h1/text()'
-        name = response.xpath(name_xp).get()
-
-        desc_xp = f'//section[@class="{OLX.LEFT_SECT_CLASS.value}"]//p/text()'
-        description = response.xpath(desc_xp).get()
-
-        if not description:
-            description = ''
-
-        price_xp = (f'//section[@class="{OLX.RIGHT_SECT_CLASS.value}"]//span/'
-                    'text()')
-        price = int(response.xpath(price_xp).get().replace('$ ','') \
+        name = self.selectors.get(response, 'name')
+        description = self.selectors.get(response, 'description') or ''
+        price = int(self.selectors.get(response, 'price').replace('$ ','') \
                     .replace('.', ''))
-
-        image_xp = (f'//div[contains(@class, "{OLX.IMG_DIV_CLASS.value}")]//'
-                    'img/@src')
-        image = response.urljoin(response.xpath(image_xp).get())
+        image = response.urljoin(self.selectors.get(response, 'image'))
 
         yield {
             'id_type_product': response.meta['brand'],
@@ -107,63 +292,39 @@ class OLXSpider(scrapy.Spider):
         """
         Retrieves information for all products in terms of the fields: name,
         description, price, image, and url
-        """
-        self.driver.get(response.url)
 
-        button_xp = f'//button[@data-aut-id="{OLX.BTN_CLASS.value}"]'
-
-        try:
-            WebDriverWait(self.driver, OLX.DRIVER_TIMEOUT.value).until(
-                EC.presence_of_element_located((By.XPATH, button_xp))
-            )
-            button = self.driver.find_element_by_xpath(button_xp)
-        except TimeoutException:
-            self.log('The page took too long to load. Reached timeout.')
-            button = False
-        
-
-        while button:
-            try:
-                button.click()
-                time.sleep(OLX.DELAY_IN_SECS.value)
-            except StaleElementReferenceException:
-                button = None
-
-        product_xp = f'//li[@data-aut-id="{OLX.ITEM_CLASS.value}"]/a[@href]'
-        a_tags = self.driver.find_elements_by_xpath(product_xp)
-        product_urls = [a.get_attribute('href') for a in a_tags]
-
-        brand = None
+        The listing's items come from the browser action that rendered it, so
+        a listing that was not rendered by it (such as one that failed) is
+        skipped
+        """
+        if 'browser_result' not in response.meta:
+            self.logger.warning(f'Could not load the items of {response.url}')
+            return
 
-        if 'ps4' in response.url or 'playstation' in response.url:
-            brand = BRAND_IDS['playstation']
-        elif 'nintendo' in response.url or 'switch' in response.url:
-            brand = BRAND_IDS['nintendo']
-        elif 'xbox' in response.url:
-            brand = BRAND_IDS['xbox']
+        product_urls = response.meta['browser_result']
+        brand = _get_olx_brand(response.url)
 
         for url in product_urls:
            yield response.follow(url, callback = self.parse_product,
                                  meta = { 'brand': brand })
 
 
-class ColombiaGamerSpider(scrapy.Spider):
+class ColombiaGamerSpider(SiteSpider):
     """
     This Spider scraps products from the ColombiaGamer e-commerce site
     """
     name = CGamer.SPIDER_NAME.value
     custom_settings = {
-        'FEEDS': {
-            CGamer.EXPORT_FILE_PATH.value: {
-                'format': 'json',
-                'encoding': 'utf-8',
-                'fields': ['id_type_product', 'id_ecommerce', 'name',
-                           'description', 'price', 'image', 'url'],
-                'indent': 4
-            }
-        },
+        'FEEDS': _get_feeds(CGamer.EXPORT_FILE_PATH.value),
+        'CONCURRENT_REQUESTS': CGamer.MAX_CONCURRENCY.value,
+        'SEEN_TTL': CGamer.SEEN_TTL.value,
+        'RECRAWL_BUDGET': CGamer.RECRAWL_BUDGET.value,
+        'FEED_STORAGES': FEED_STORAGES,
+        'SPIDER_MIDDLEWARES': SPIDER_MIDDLEWARES,
+        'ITEM_PIPELINES': ITEM_PIPELINES,
         'FEED_EXPORT_ENCODING': 'utf-8',
-        'AUTOTHROTTLE_ENABLED': True
+        'AUTOTHROTTLE_ENABLED': True,
+        'DOWNLOADER_MIDDLEWARES': DOWNLOADER_MIDDLEWARES
     }
 
 
@@ -172,26 +333,19 @@ class ColombiaGamerSpider(scrapy.Spider):
         Retrieves product information from the product detail page, and exports
         it to the output json
         """
-        self.log(f'\n>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<\n')
+        self.logger.debug(f'\n>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<\n')
 
-        name_xp = f'//div[@class="{CGamer.TITLE_CLASS.value}"]//h2/text()'
-        name = response.xpath(name_xp).get()
+        name = self.selectors.get(response, 'name')
 
-        short_desc_xp = f'//div[@class="{CGamer.SHORT_DESC_CLASS.value}"]/*'
-        short_desc_elements = response.xpath(short_desc_xp).extract()
-        short_description = ''.join(short_desc_elements)
-
-        desc_xp = f'//div[@class="{CGamer.DESC_CLASS.value}"]/*'
-        description_elements = response.xpath(desc_xp).extract()
-        big_description = ''.join(description_elements)
+        short_description = ''.join(self.selectors.get_all(
+            response, 'short_description'))
+        big_description = ''.join(self.selectors.get_all(response,
+                                                         'description'))
         description = f'{short_description}\n{big_description}'
 
-        price_xp = f'//span[@class="{CGamer.PRICE_CLASS.value}"]/text()'
-        price = int(response.xpath(price_xp).get().replace('$ ','') \
+        price = int(self.selectors.get(response, 'price').replace('$ ','') \
                     .replace('.', ''))
-
-        image_xp = (f'//div[@class="{CGamer.IMG_CLASS.value}"]//img/@src')
-        image = response.urljoin(response.xpath(image_xp).get())
+        image = response.urljoin(self.selectors.get(response, 'image'))
 
         yield {
             'id_type_product': response.meta['brand'],
@@ -209,20 +363,13 @@ class ColombiaGamerSpider(scrapy.Spider):
         Retrieves information for all products in terms of the fields: name,
         description, price, image, and url
         """
+        page_links_xp = '//nav[@role="pagination"]//a'
 
-        list_items = response.xpath('//nav[@role="pagination"]//li/@class')
-        page_buttons_xp = '//nav[@role="pagination"]//a/@href'
-        page_buttons = response.xpath(page_buttons_xp).getall()
-
-        if len(page_buttons) > 1:
-            last_item_class = list_items[-1]
-            if last_item_class != 'active':
-                next_page = page_buttons[-2]
-                yield response.follow(next_page, callback = self.parse)
+        for url in get_page_urls(response, page_links_xp,
+                                 CGamer.MAX_PAGES.value):
+            yield response.follow(url, callback = self.parse)
 
-        product_xp = (f'//div[contains(@class, "{CGamer.ITEM_CLASS.value}")]//'
-                      'h2/a/@href')
-        product_urls = response.xpath(product_xp).getall()
+        product_urls = self.selectors.get_all(response, 'products')
 
         brand = None
 
@@ -238,83 +385,63 @@ class ColombiaGamerSpider(scrapy.Spider):
                                   meta = { 'brand': brand })
 
 
-class GamePlSpider(scrapy.Spider):
+class GamePlSpider(SiteSpider):
     """
     This spider scraps products from the GamePlanet e-commerce site
     """
     name = GamePl.SPIDER_NAME.value
     custom_settings = {
-        'FEEDS': {
-            GamePl.EXPORT_FILE_PATH.value: {
-                'format': 'json',
-                'encoding': 'utf-8',
-                'fields': ['id_type_product', 'id_ecommerce', 'name',
-                           'description', 'price', 'image', 'url'],
-                'indent': 4
-            }
-        },
+        'FEEDS': _get_feeds(GamePl.EXPORT_FILE_PATH.value),
+        'CONCURRENT_REQUESTS': GamePl.MAX_CONCURRENCY.value,
+        'SEEN_TTL': GamePl.SEEN_TTL.value,
+        'RECRAWL_BUDGET': GamePl.RECRAWL_BUDGET.value,
+        'FEED_STORAGES': FEED_STORAGES,
+        'SPIDER_MIDDLEWARES': SPIDER_MIDDLEWARES,
+        'ITEM_PIPELINES': ITEM_PIPELINES,
         "FEED_EXPORT_ENCODING": "utf-8",
-        'AUTOTHROTTLE_ENABLED': True
+        'AUTOTHROTTLE_ENABLED': True,
+        'DOWNLOADER_MIDDLEWARES': BROWSER_DOWNLOADER_MIDDLEWARES
     }
 
 
-    def __init__(self, *args, **kwargs):
+    async def start(self):
         """
-        Constructor that initializes the Spider instance and sets it up
+        Requests the listing pages to be rendered by a browser
         """
-        super().__init__(*args, **kwargs)
-        chrome_options = Options()  
-        chrome_options.add_argument("--headless")
-        self.driver = webdriver.Chrome(ChromeDriverManager().install(),
-        chrome_options=chrome_options)
+        for url in self.start_urls:
+            yield scrapy.Request(url, dont_filter = True,
+                                 meta = { 'browser': True })
 
 
-    @classmethod
-    def from_crawler(cls, crawler, *args, **kwargs):
+    def wait_for_product(self, driver):
         """
-        This method connects the Spider with a termination signal in order to
-        automatically execute operations when the Spider closes
+        Browser action that waits for the product's details to be shown
         """
-        spider = super(GamePlSpider, cls).from_crawler(crawler, *args, **kwargs)
-        crawler.signals.connect(spider.spider_closed,
-                                signal = scrapy.signals.spider_closed)
-        return spider
-
+        name_xp = f'//h1[@class="{GamePl.TITLE_CLASS.value}"]'
 
-    def spider_closed(self, spider):
-        """
-        Function that is called in the moment of Spider termination. The Spider
-        calls it's Selenium driver quit method
-        """
-        self.driver.quit()
+        try:
+            WebDriverWait(driver, GamePl.DRIVER_TIMEOUT.value).until(
+                EC.presence_of_element_located((By.XPATH, name_xp))
+            )
+        except TimeoutException:
+            self.logger.debug('The product took too long to load. '
+                              'Reached timeout.')
 
 
-    def parse_product(self, response):
+    def _extract_product(self, response):
         """
-        Retrieves product information from the product detail page, and exports
-        it to the output json
+        Reads the product's fields from the page's HTML. Returns None if any of
+        the required ones (name, price, image and platform) is missing
         """
-        self.log(f'>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<')
-
-        self.driver.implicitly_wait(2)
+        name = self.selectors.get(response, 'name')
+        description = self.selectors.get(response, 'description')
 
-        self.driver.get(response.url)
-        name_xp = f'//h1[@class="{GamePl.TITLE_CLASS.value}"]'
-        name = self.driver.find_elements_by_xpath(name_xp)[0].get_attribute('innerText')
-
-        desc_xp = f'//div[@class="{GamePl.DESC_CLASS.value}"]'
-        description = self.driver.find_elements_by_xpath(desc_xp)[0].get_attribute('innerText')
+        price = self.selectors.get(response, 'price')
+        price = price.replace("$","").replace(",","").replace(".","").strip()
 
-        price_xp = f'//div[contains(@class, "{GamePl.PRICE_CLASS.value}")]//span'
-        price = self.driver.find_elements_by_xpath(price_xp)[0].get_attribute('innerText')
-        price = int(float(price.replace("$","").replace(",","").replace(".","")))
-
-        image_xp = (f'//img[@id = "{GamePl.IMAGE_ID.value}"]')
-        image_url = self.driver.find_elements_by_xpath(image_xp)[0].get_attribute('src')
-        image = image_url
-
-        tag_xp = (f'//span[@class = "{GamePl.TAG_CLASS.value}"]')
-        tag_product = self.driver.find_elements_by_xpath(tag_xp)[0].get_attribute('innerText')
+        image = self.selectors.get(response, 'image')
+        tag_product = self.selectors.get(response, 'tag')
+        id_type_product = None
         if "switch" in tag_product.lower():
             id_type_product = 1
         if "xbox" in tag_product.lower():
@@ -322,53 +449,76 @@ class GamePlSpider(scrapy.Spider):
         if "playstation" in tag_product.lower():
             id_type_product = 3
 
-        yield{
+        if not (name and price.isdigit() and image and id_type_product):
+            return None
+
+        return {
             'name': name,
             'description': description,
             'id_ecommerce': SITE_IDS['GamePlanet'],
             'id_type_product': id_type_product,
-            'price': price,
-            'image': image,
+            'price': int(price),
+            'image': response.urljoin(image),
             'url': response.url
         }
 
 
+    def parse_product(self, response):
+        """
+        Retrieves product information from the product detail page, and exports
+        it to the output json
+
+        The downloaded HTML is parsed first. Only if a required field is
+        missing, the page is requested again to be rendered by a browser
+        """
+        self.logger.debug(f'>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<')
+
+        product = self._extract_product(response)
+
+        if product:
+            yield product
+        elif not response.meta.get('browser'):
+            self.crawler.stats.inc_value('gamepl/browser_fallback',
+                                         spider = self)
+            meta = dict(response.meta, browser = 'wait_for_product')
+            yield response.request.replace(dont_filter = True, meta = meta)
+        else:
+            self.logger.warning(f'Could not scrap the product {response.url}')
+
+
     def parse(self, response):
         """
         Retrieves information for all products in terms of the fields: name,
         description, price, image, and url
         """
 
-        self.driver.get(response.url)
-        next_xp = (f'//a[@title = "Next"]')
-        next_page = self.driver.find_elements_by_xpath(next_xp)
-        if len(next_page) > 0:
-            next_url = next_page[0].get_attribute('href')
-            yield response.follow(next_url, callback = self.parse)
+        next_xp = (f'//a[@title = "Next"]/@href')
+        next_url = response.xpath(next_xp).get()
+        if next_url:
+            yield response.follow(next_url, callback = self.parse,
+                                  meta = { 'browser': True })
 
-        product_xp = (f'//div[contains(@class, "{GamePl.ITEM_CLASS.value}")]/div[@class = "row"]/div/a')
-        product_urls = self.driver.find_elements_by_xpath(product_xp)
+        product_urls = self.selectors.get_all(response, 'products')
         for url in product_urls:
-            yield response.follow(url.get_attribute('href'), callback = self.parse_product)
+            yield response.follow(url, callback = self.parse_product)
 
 
-class SearSpider(scrapy.Spider):
+class SearSpider(SiteSpider):
     """
     This Spider scraps products from the Sears e-commerce site
     """
     name = SEA.SPIDER_NAME.value
     custom_settings = {
-        'FEEDS': {
-            SEA.EXPORT_FILE_PATH.value: {
-                'format': 'json',
-                'encoding': 'utf-8',
-                'fields': ['id_type_product', 'id_ecommerce', 'name',
-                           'description', 'price', 'image', 'url'],
-                'indent': 4
-            }
-        },
+        'FEEDS': _get_feeds(SEA.EXPORT_FILE_PATH.value),
+        'CONCURRENT_REQUESTS': SEA.MAX_CONCURRENCY.value,
+        'SEEN_TTL': SEA.SEEN_TTL.value,
+        'RECRAWL_BUDGET': SEA.RECRAWL_BUDGET.value,
+        'FEED_STORAGES': FEED_STORAGES,
+        'SPIDER_MIDDLEWARES': SPIDER_MIDDLEWARES,
+        'ITEM_PIPELINES': ITEM_PIPELINES,
         'FEED_EXPORT_ENCODING': 'utf-8',
-        'AUTOTHROTTLE_ENABLED': True
+        'AUTOTHROTTLE_ENABLED': True,
+        'DOWNLOADER_MIDDLEWARES': DOWNLOADER_MIDDLEWARES
     }
 
 
@@ -377,23 +527,16 @@ class SearSpider(scrapy.Spider):
         Retrieves product information from the product detail page, and exports
         it to the output json
         """
-        self.log(f'\n>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<\n')
-
-        name_xp = f'//div[@class = "{SEA.TITLE_CLASS.value}"]/h1/text()'
-        name = response.xpath(name_xp).get()
+        self.logger.debug(f'\n>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<\n')
 
-        desc_xp = f'//div[@class = "{SEA.DESC_CLASS.value} yotpo-main-widget"]/@data-description'
-        description = response.xpath(desc_xp)[0].get()
+        name = self.selectors.get(response, 'name')
+        description = self.selectors.get(response, 'description')
 
-        price_xp = f'//p[@class = "{SEA.PRICE_CLASS.value}"]/text()'
-        price = response.xpath(price_xp).get()
+        price = self.selectors.get(response, 'price')
         price = int(float(price.replace("$","").replace(",","").replace(".","")))
 
-        image_xp = (f'//ul[contains(@class,{SEA.IMAGE_CLASS.value})]/li/img/@src')
-        image = response.urljoin(response.xpath(image_xp)[0].get())
-
-        tag_xp = (f'//div[@class = "breadcrumb"]/ul/li[3]/a/text()')
-        tag_product = response.xpath(tag_xp).get()
+        image = response.urljoin(self.selectors.get(response, 'image'))
+        tag_product = self.selectors.get(response, 'tag')
 
         if "nintendo" in tag_product.lower():
             id_type_product = 1
@@ -418,91 +561,113 @@ class SearSpider(scrapy.Spider):
         Retrieves information for all products in terms of the fields: name,
         description, price, image, and url
         """
-        list_items = response.xpath('//div[contains(@class, "paginador")]/ul/li/a')
-        page_buttons_xp = '//div[contains(@class, "paginador")]/ul/li/a/@href'
-        page_buttons = response.xpath(page_buttons_xp).getall()
+        page_links_xp = '//div[contains(@class, "paginador")]/ul/li/a'
 
-        if len(page_buttons) > 1:
-            last_item_class = list_items[-1]
-            if last_item_class.xpath('@class').get() != 'active':
-                next_page = page_buttons[-1]
-                yield response.follow(response.urljoin(next_page), callback = self.parse)
+        for url in get_page_urls(response, page_links_xp,
+                                 SEA.MAX_PAGES.value):
+            yield response.follow(url, callback = self.parse)
 
-        product_xp = (f'//div[@class = "{SEA.ITEM_CLASS.value}"]/a[@class = "{SEA.LINK_CLASS.value}"]/@href')
-        product_urls = response.xpath(product_xp).getall()
+        product_urls = self.selectors.get_all(response, 'products')
 
         for url in product_urls:
             yield response.follow(url, callback = self.parse_product)
 
 
-class MixUpSpider(scrapy.Spider):
+class MixUpSpider(SiteSpider):
     """
     This Spider scraps products from the MixUp e-commerce site
+
+    MixUp's listings are ASP.NET pages whose pager only has a "next" button,
+    which posts the page's __VIEWSTATE back. There are no postback targets for
+    the other pages, and the state only leads to the page after the one it was
+    read from, so the pages of a listing are deliberately requested one after
+    another: only the different listings and the product pages are crawled
+    concurrently
     """
     name = MU.SPIDER_NAME.value
     custom_settings = {
-        'FEEDS': {
-            MU.EXPORT_FILE_PATH.value: {
-                'format': 'json',
-                'encoding': 'utf-8',
-                'fields': ['id_type_product', 'id_ecommerce', 'name',
-                           'description', 'price', 'image', 'url'],
-                'indent': 4
-            }
-        },
+        'FEEDS': _get_feeds(MU.EXPORT_FILE_PATH.value),
+        'CONCURRENT_REQUESTS': MU.MAX_CONCURRENCY.value,
+        'SEEN_TTL': MU.SEEN_TTL.value,
+        'RECRAWL_BUDGET': MU.RECRAWL_BUDGET.value,
+        'FEED_STORAGES': FEED_STORAGES,
+        'SPIDER_MIDDLEWARES': SPIDER_MIDDLEWARES,
+        'ITEM_PIPELINES': ITEM_PIPELINES,
         'FEED_EXPORT_ENCODING': 'utf-8',
-        'AUTOTHROTTLE_ENABLED': True
+        'AUTOTHROTTLE_ENABLED': True,
+        'DOWNLOADER_MIDDLEWARES': BROWSER_DOWNLOADER_MIDDLEWARES
     }
 
 
-    def __init__(self, *args, **kwargs):
+    async def start(self):
         """
-        Constructor that initializes the Spider instance and sets it up
+        Requests the listing pages. If USE_BROWSER is enabled, they are
+        rendered by a browser which collects the products of all of their
+        pages; otherwise their pages are requested by replaying the ASP.NET
+        postbacks of the "next" button
         """
-        super().__init__(*args, **kwargs)
-        chrome_options = Options()  
-        chrome_options.add_argument("--headless")
-        self.driver = webdriver.Chrome(ChromeDriverManager().install(),
-        chrome_options=chrome_options)
+        meta = { 'browser': 'collect_product_urls' } if MU.USE_BROWSER.value \
+               else { 'page': 1 }
 
+        for url in self.start_urls:
+            yield scrapy.Request(url, dont_filter = True, meta = dict(meta))
 
-    @classmethod
-    def from_crawler(cls, crawler, *args, **kwargs):
-        spider = super(MixUpSpider, cls).from_crawler(crawler, *args, **kwargs)
-        crawler.signals.connect(spider.spider_closed,
-                                signal = scrapy.signals.spider_closed)
-        return spider
 
+    def collect_product_urls(self, driver):
+        """
+        Browser action that goes through the listing's pages with its "next"
+        button, and returns the URLs of the products found in all of them
+        """
+        product_urls = []
+        product_xp = (f'//div[@class = "{MU.ITEM_CLASS_1.value}"]/div[@class = "{MU.ITEM_CLASS_2.value}"]/a')
+        products = driver.find_elements_by_xpath(product_xp)
+
+        for product in products:
+            product_urls.append(product.get_attribute('href'))
+
+        try:
+            next_button = driver.find_elements_by_xpath(f'//a[@id = "{MU.NEXT_ID.value}"]')
+            next_button = next_button[0]
+            next_button.click()
+            condition = True
+        except IndexError:
+            condition = False
+            pass
+
+        while (condition):
+            self.logger.debug(f'condition: {condition}')
+            driver.implicitly_wait(2)
+            new_products = driver.find_elements_by_xpath(product_xp)
+            for product in new_products:
+                new_url = product.get_attribute('href')
+                product_urls.append(new_url)
+            next_button = driver.find_elements_by_xpath(f'//a[@id = "{MU.NEXT_ID.value}"]')
+            if not next_button:
+                break
+            next_button = next_button[0]
+            disabled = next_button.get_attribute('disabled')
+            condition = disabled != 'true'
+            next_button.click()
+
+        return product_urls
 
-    def spider_closed(self, spider):
-        spider.driver.quit()
 
     def parse_product(self, response):
         """
         Retrieves product information from the product detail page, and exports
         it to the output json
         """
-        self.log(f'\n>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<\n')
-
-        name_xp = f'//div[@class="{MU.TITLE_CLASS.value}"]/text()'
-        name = response.xpath(name_xp).get().strip()
+        self.logger.debug(f'\n>>>>> ATTEMPTING TO SCRAP {response.url}<<<<<\n')
 
-        desc_xp = f'//div[@class="{MU.DESC_CLASS.value}"]//div[@class = "texto"]/text()'
-        description = response.xpath(desc_xp).get()
-        description = description.strip()
+        name = self.selectors.get(response, 'name').strip()
+        description = self.selectors.get(response, 'description').strip()
 
-        price_xp = f'//span[contains(@class, "{MU.PRICE_CLASS.value}")]/text()'
-        price = response.xpath(price_xp)[1].get()
-        price = price.strip()         
-        price = int(float(price.replace("$","").replace(",","").replace(".",""))) 
+        price = self.selectors.get_all(response, 'price')[1].strip()
+        price = int(float(price.replace("$","").replace(",","").replace(".","")))
 
-        image_xp = (f'//img[@id="{MU.IMAGE_ID.value}"]/@src')
-        image = response.urljoin(response.xpath(image_xp).get())
+        image = response.urljoin(self.selectors.get(response, 'image'))
 
-        tag_xp = (f'//div[@id = "ctl00_container_PanelAutor"]/div[@class = "titulo"]/text()')
-        tag_product = response.xpath(tag_xp).getall()
-        tag_product = ''.join(tag_product)
-        tag_product = tag_product.strip()
+        tag_product = ''.join(self.selectors.get_all(response, 'tag')).strip()
 
         if "switch" in tag_product.lower():
             id_type_product = 1
@@ -522,41 +687,51 @@ class MixUpSpider(scrapy.Spider):
         }
 
 
+    def _get_next_page_request(self, response):
+        """
+        Returns the FormRequest that replays the postback of the listing's
+        "next" button (with the page's __VIEWSTATE and other hidden fields), or
+        None if it is the last page
+        """
+        next_link = response.xpath(f'//a[@id = "{MU.NEXT_ID.value}"]')
+        page = response.meta.get('page', 1)
+
+        if not next_link or 'disabled' in next_link.attrib or \
+           page >= MU.MAX_PAGES.value or not response.xpath('//form'):
+            return None
+
+        postback = re.search(r"__doPostBack\('([^']*)',\s*'([^']*)'\)",
+                             next_link.attrib.get('href', ''))
+        # ASP.NET names the event target after the control's unique id, which
+        # is its client id with $ separators
+        target, argument = postback.groups() if postback \
+                           else (MU.NEXT_ID.value.replace('_', '$'), '')
+
+        form = response.xpath('//form')[0]
+        formdata = { field.attrib['name']: field.attrib.get('value', '')
+                     for field in form.xpath('.//input[@type = "hidden"]'
+                                             '[@name]') }
+        formdata.update({ '__EVENTTARGET': target, '__EVENTARGUMENT': argument })
+
+        return scrapy.FormRequest(response.urljoin(form.attrib.get('action',
+                                                                   '')),
+                                  formdata = formdata, callback = self.parse,
+                                  meta = { 'page': page + 1 })
+
+
     def parse(self, response):
         """
         Retrieves information for all products in terms of the fields: name,
         description, price, image, and url
         """
-        self.driver.get(response.url)
-        
-        product_urls = []
-        product_xp = (f'//div[@class = "{MU.ITEM_CLASS_1.value}"]/div[@class = "{MU.ITEM_CLASS_2.value}"]/a')
-        products = self.driver.find_elements_by_xpath(product_xp)
+        if 'browser_result' in response.meta:
+            product_urls = response.meta['browser_result']
+        else:
+            product_urls = self.selectors.get_all(response, 'products')
+            next_page_request = self._get_next_page_request(response)
 
-        for product in products:
-            product_urls.append(product.get_attribute('href'))
-
-        try:
-            next_button = self.driver.find_elements_by_xpath('//a[@id = "ctl00_container_linkPnts2Up"]')
-            next_button = next_button[0]
-            next_button.click()
-            condition = True
-        except IndexError:
-            condition = False
-            pass
+            if next_page_request:
+                yield next_page_request
 
-        while (condition):
-            self.log(f'condition: {condition}')
-            self.driver.implicitly_wait(2)
-            new_products = self.driver.find_elements_by_xpath(product_xp)
-            for product in new_products:
-                new_url = product.get_attribute('href')
-                product_urls.append(new_url)
-            next_button = self.driver.find_elements_by_xpath('//a[@id = "ctl00_container_linkPnts2Up"]')
-            next_button = next_button[0]
-            disabled = next_button.get_attribute('disabled')
-            condition = disabled != 'true'
-            next_button.click()
-            
         for url in product_urls:
             yield response.follow(url, callback = self.parse_product)
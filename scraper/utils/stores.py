@@ -0,0 +1,49 @@
+"""
+This module contains the base class of the on-disk stores (the response cache,
+the seen store and the checkpoint store), which keep their data in a sqlite
+database that is opened the first time it is used
+"""
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """
+    Base class of the stores backed by a sqlite database. Subclasses set the
+    SCHEMA statement that creates their table, and hold the lock while they
+    use the connection
+    """
+    SCHEMA = None
+
+    def __init__(self, path):
+        """
+        Constructor that sets the path of the store's database, which is
+        opened (or created) the first time it is used
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection_lock = threading.Lock()
+        self._connection = None
+
+
+    @property
+    def connection(self):
+        """
+        Returns the connection to the store's database, opening (or creating)
+        it if needed
+        """
+        with self.connection_lock:
+            if self._connection is None:
+                directory = os.path.dirname(self.path)
+
+                if directory:
+                    os.makedirs(directory, exist_ok = True)
+
+                connection = sqlite3.connect(self.path,
+                                             check_same_thread = False)
+                connection.execute(self.SCHEMA)
+                connection.commit()
+                self._connection = connection
+
+        return self._connection
@@ -0,0 +1,253 @@
+"""
+This module contains the bulk upload pipeline that sends the scraped records to
+the backend's database API. Records are grouped in size-bounded batches, sent
+gzip-compressed with a bounded number of requests in flight, and retried with
+exponential backoff. Batches that still fail are written to a spool file that
+can be replayed later
+"""
+import os
+import gzip
+import json
+import shutil
+import asyncio
+import requests
+import threading
+import urllib.parse
+from .engine import ENGINE
+from .metrics import METRICS
+from .resilience import get_backoff, is_failure
+from .exporters import open_export_file, read_records
+from .constants import BackendConfig as Backend
+
+
+SPOOL_LOCK = threading.Lock()
+
+
+class BatchBuffer:
+    """
+    Buffer that groups the records added to it in json array bodies of at most
+    max_records records and (about) max_bytes bytes
+    """
+
+    def __init__(self, max_records = Backend.BATCH_SIZE.value,
+                 max_bytes = Backend.BATCH_BYTES.value):
+        """
+        Constructor that sets the bounds of the bodies
+        """
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.batch = []
+        self.size = 2
+
+
+    def add(self, record):
+        """
+        Adds a record to the buffer. Returns the body of the previous records if
+        the record didn't fit in it, otherwise returns None
+        """
+        serialized = json.dumps(record)
+        body = None
+
+        if self.batch and (len(self.batch) == self.max_records or
+                           self.size + len(serialized) + 1 > self.max_bytes):
+            body = self.flush()
+
+        self.batch.append(serialized)
+        self.size += len(serialized) + 1
+
+        return body
+
+
+    def flush(self):
+        """
+        Returns the body of the buffered records (None if there are none), and
+        empties the buffer
+        """
+        if not self.batch:
+            return None
+
+        body = f'[{",".join(self.batch)}]'
+        self.batch = []
+        self.size = 2
+
+        return body
+
+
+def batch_payloads(records, max_records = Backend.BATCH_SIZE.value,
+                   max_bytes = Backend.BATCH_BYTES.value):
+    """
+    Generator that groups the records in json array bodies of at most
+    max_records records and (about) max_bytes bytes, consuming the records only
+    as the bodies are requested
+    """
+    buffer = BatchBuffer(max_records, max_bytes)
+
+    for record in records:
+        body = buffer.add(record)
+
+        if body:
+            yield body
+
+    body = buffer.flush()
+
+    if body:
+        yield body
+
+
+def _get_backoff(attempt):
+    """
+    Returns the seconds to wait before the specified retry attempt: exponential
+    backoff with full jitter
+    """
+    return get_backoff(attempt, Backend.BACKOFF_BASE.value,
+                       Backend.BACKOFF_MAX.value)
+
+
+async def _send_batch(body, endpoint, verbose, site = ''):
+    """
+    Sends a json array body to the endpoint, retrying up to MAX_RETRIES times.
+    Every attempt is recorded in the upload metrics of the records' site.
+    Returns True if the backend accepted it
+    """
+    data = body.encode('utf-8')
+    headers = { 'Content-Type': 'application/json' }
+    path = urllib.parse.urlsplit(endpoint).path
+
+    if Backend.COMPRESS.value:
+        data = gzip.compress(data)
+        headers['Content-Encoding'] = 'gzip'
+
+    for attempt in range(0, Backend.MAX_RETRIES.value + 1):
+        if attempt:
+            await asyncio.sleep(_get_backoff(attempt))
+
+        try:
+            with METRICS.track('upload', site, path) as outcome:
+                response = await ENGINE.fetch('POST', endpoint, data = data,
+                                              headers = headers)
+                outcome['ok'] = response.status_code == 201
+        except requests.RequestException as exception:
+            print(f'Upload attempt {attempt + 1} failed: {exception}')
+            continue
+
+        if response.status_code == 201:
+            if verbose:
+                print(f'Uploaded a batch of {len(data)} bytes')
+            return True
+
+        print(f'Upload attempt {attempt + 1} failed with status '
+              f'{response.status_code}')
+
+        if not is_failure(response):
+            break
+
+    return False
+
+
+def _spool(spool_path, body):
+    """
+    Appends a failed batch to the spool file, so that it can be replayed
+    """
+    with SPOOL_LOCK, open_export_file(spool_path, 'a') as spool_file:
+        spool_file.write(json.dumps(body))
+        spool_file.write('\n')
+
+
+async def upload_async(bodies, endpoint, verbose = False,
+                       spool_path = Backend.SPOOL_PATH.value, site = ''):
+    """
+    Sends the json array bodies (any iterable, such as a generator) to the
+    endpoint, with at most MAX_IN_FLIGHT requests at a time. The batches that
+    could not be sent are appended to the spool file. The site whose records
+    are sent (if known) labels the upload metrics
+
+    Returns a dictionary with the number of sent and failed batches
+    """
+    stats = { 'sent': 0, 'failed': 0 }
+    semaphore = asyncio.Semaphore(Backend.MAX_IN_FLIGHT.value)
+    tasks = set()
+
+    async def send(body):
+        try:
+            if await _send_batch(body, endpoint, verbose, site):
+                stats['sent'] += 1
+            else:
+                stats['failed'] += 1
+                _spool(spool_path, body)
+        finally:
+            semaphore.release()
+
+    for body in bodies:
+        await semaphore.acquire()
+        task = asyncio.ensure_future(send(body))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+    return stats
+
+
+def upload_batch(body, endpoint, verbose = False,
+                 spool_path = Backend.SPOOL_PATH.value, site = ''):
+    """
+    Sends a single json array body to the endpoint from a worker thread, and
+    spools it if it could not be sent. Returns True if the backend accepted it
+    """
+    if asyncio.run(_send_batch(body, endpoint, verbose, site)):
+        return True
+
+    _spool(spool_path, body)
+    return False
+
+
+def upload(bodies, endpoint, verbose = False,
+           spool_path = Backend.SPOOL_PATH.value, site = ''):
+    """
+    Synchronous version of upload_async
+    """
+    return asyncio.run(upload_async(bodies, endpoint, verbose, spool_path,
+                                    site))
+
+
+def upload_records(records, endpoint, verbose = False,
+                   spool_path = Backend.SPOOL_PATH.value, site = ''):
+    """
+    Groups the records in batches and uploads them to the endpoint
+    """
+    return upload(batch_payloads(records), endpoint, verbose, spool_path,
+                  site)
+
+
+def replay_spool(endpoint, verbose = False,
+                 spool_path = Backend.SPOOL_PATH.value):
+    """
+    Sends again the batches stored in the spool file to the endpoint. The ones
+    that fail again are kept in the spool for a later replay
+
+    The batches being replayed are moved to a .replay file first. If a replay
+    was interrupted and left that file behind, its batches are replayed too,
+    together with the ones spooled since then
+
+    Returns a dictionary with the number of sent and failed batches
+    """
+    replay_path = f'{spool_path}.replay'
+
+    with SPOOL_LOCK:
+        if os.path.exists(spool_path) and os.path.exists(replay_path):
+            with open(spool_path, 'rb') as spool_file, \
+                 open(replay_path, 'ab') as replay_file:
+                shutil.copyfileobj(spool_file, replay_file)
+
+            os.remove(spool_path)
+        elif os.path.exists(spool_path):
+            os.replace(spool_path, replay_path)
+
+    if not os.path.exists(replay_path):
+        return { 'sent': 0, 'failed': 0 }
+
+    stats = upload(read_records([replay_path]), endpoint, verbose, spool_path)
+    os.remove(replay_path)
+
+    return stats